@@ -1,7 +1,7 @@
-from flask import Flask, render_template, request, Response, jsonify
+from flask import Flask, render_template, request, Response, jsonify, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from flask_socketio import SocketIO, join_room, leave_room
+from flask_socketio import SocketIO
 from flask_login import LoginManager
 from config import Config
 import traceback
@@ -20,6 +20,13 @@ login_manager.login_view = 'auth.login'
 login_manager.login_message = 'この機能を使用するにはログインが必要です。'
 login_manager.login_message_category = 'info'
 
+# ルームに送信されたイベントを受け取って返すエンドポイント。HTTP専用のワーカー（REALTIME_ROLE=http）は
+# 他のワーカーのイベントを受信しないため、これらはゲートウェイ（または REALTIME_ROLE=all）だけが受け付ける
+EVENT_STREAM_ENDPOINTS = {'chat.channel_stream', 'chat.channel_poll'}
+
+# ゲートウェイで受け付けるHTTPのエンドポイント（Socket.IOの接続はFlaskのルートを通らない）
+GATEWAY_ENDPOINTS = EVENT_STREAM_ENDPOINTS | {'main.show_metrics'}
+
 def check_auth(username, password):
     """Basic認証のクレデンシャルを確認"""
     return username == os.getenv('BASIC_AUTH_USERNAME') and password == os.getenv('BASIC_AUTH_PASSWORD')
@@ -71,10 +78,21 @@ def create_app(config_class=Config):
     db.init_app(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
+    # イベントハンドラは init_app より前に登録する（Socket.IOのサーバーがない間に登録したハンドラだけが、
+    # create_app を呼ぶたびに作られる全てのサーバーに登録される）
+    from app.realtime import handlers
     if not app.config.get('SOCKETIO_ENABLED', True):
         app.wsgi_app = app.wsgi_app
     else:
-        socketio.init_app(app, cors_allowed_origins="*")
+        # 複数ワーカーで動かす場合はワーカー間でイベントを中継する
+        from app.realtime.fanout import create_client_manager
+        socketio.init_app(app, cors_allowed_origins="*", client_manager=create_client_manager(app.config))
+        from app.realtime.compression import configure_compression
+        configure_compression(
+            socketio.server,
+            app.config.get('SOCKETIO_COMPRESSION', True),
+            app.config.get('SOCKETIO_COMPRESSION_THRESHOLD', 128)
+        )
 
     # ユーザーローダーの設定
     @login_manager.user_loader
@@ -94,6 +112,17 @@ def create_app(config_class=Config):
                 result = conn.execute(sa.text('SELECT 1')).scalar()
                 print(f"データベース接続テスト成功: {result}")
             
+            # メンション解決用のユーザー名インデックスを読み込み
+            from app.mentions import username_index
+            username_index.refresh_interval = app.config.get('USERNAME_INDEX_REFRESH_SECONDS', 300)
+            username_index.load()
+            print("ユーザー名インデックスを読み込みました")
+            
+            # チャンネル一覧キャッシュを初期化（初回参照時に読み込み）
+            from app.channel_cache import channel_cache
+            channel_cache.ttl = app.config.get('CHANNEL_CACHE_TTL_SECONDS', 30)
+            channel_cache.invalidate()
+            
     except SQLAlchemyError as e:
         print(f"SQLAlchemyエラー: {str(e)}")
         print(traceback.format_exc())
@@ -101,6 +130,64 @@ def create_app(config_class=Config):
         print(f"データベース接続エラー: {str(e)}")
         print(traceback.format_exc())
 
+    # 再送用バッファなどリアルタイム配信の初期化
+    from app.realtime.replay import replay_buffer
+    from app.realtime.reactions import reaction_broadcaster
+    from app.realtime.presence import presence_tracker
+    from app.realtime.typing import typing_tracker
+    from app.realtime.stream import channel_streams
+    from app.realtime.longpoll import channel_waiters
+    from app.realtime.admission import connect_admission
+    replay_buffer.configure(
+        app.config.get('REPLAY_BUFFER_SIZE', 256),
+        app.config.get('REPLAY_BUFFER_MAX_CHANNELS', 1024)
+    )
+    connect_admission.configure(
+        app.config.get('SOCKETIO_CONNECT_RATE', 0),
+        app.config.get('SOCKETIO_CONNECT_BURST', 0),
+        app.config.get('SOCKETIO_RECONNECT_WINDOW_SECONDS', 0)
+    )
+    reaction_broadcaster.configure(app.config.get('REACTION_BROADCAST_WINDOW_MS', 100) / 1000)
+    presence_tracker.configure(
+        app.config.get('PRESENCE_TIMEOUT_SECONDS', 90),
+        app.config.get('PRESENCE_BROADCAST_INTERVAL', 1.0)
+    )
+    typing_tracker.configure(
+        app.config.get('TYPING_TIMEOUT_SECONDS', 5.0),
+        app.config.get('TYPING_THROTTLE_SECONDS', 1.0),
+        app.config.get('TYPING_BROADCAST_INTERVAL', 0.5)
+    )
+    # 送信されたイベント（他のワーカーから中継されたものを含む）を再送用に記録し、SSEの購読者とlong-pollingの待機中のリクエストにも配る
+    channel_streams.configure(app.config.get('SSE_QUEUE_SIZE', 256))
+    if app.config.get('SOCKETIO_ENABLED', True):
+        from app.realtime import record_channel_event
+        socketio.server.manager.add_listener(record_channel_event)
+        socketio.server.manager.add_listener(channel_streams.publish)
+        socketio.server.manager.add_listener(channel_waiters.notify)
+        # 他のワーカーのオンラインユーザーを取り込む
+        socketio.server.manager.add_listener(presence_tracker.receive_sync)
+
+    # ゲートウェイ（gateway.py）はSocket.IO・SSE・long-pollingの接続だけを受け付け、
+    # HTTP専用のワーカーはイベントが届かないSSE・long-pollingを受け付けない
+    if app.config.get('REALTIME_ROLE', 'all') == 'gateway':
+        @app.before_request
+        def restrict_to_realtime():
+            if request.endpoint not in GATEWAY_ENDPOINTS:
+                abort(404)
+    elif app.config.get('REALTIME_ROLE', 'all') == 'http':
+        @app.before_request
+        def refuse_event_streams():
+            if request.endpoint in EVENT_STREAM_ENDPOINTS:
+                abort(404)
+    
+    # コミット後にイベントを配信するアウトボックスのディスパッチャー（最初のコミットで起動）
+    from app.outbox import outbox_dispatcher
+    outbox_dispatcher.configure(
+        app,
+        app.config.get('OUTBOX_BATCH_SIZE', 100),
+        app.config.get('OUTBOX_POLL_INTERVAL', 30.0)
+    )
+
     # ルートの登録
     from app.routes import main, auth, chat, profile
     app.register_blueprint(main.bp)
@@ -108,8 +195,15 @@ def create_app(config_class=Config):
     app.register_blueprint(chat.bp, url_prefix='/chat')
     app.register_blueprint(profile.profile)
 
+    # CLIコマンドの登録
+    from app.commands import messages_cli, channels_cli, reactions_cli, realtime_cli
+    app.cli.add_command(messages_cli)
+    app.cli.add_command(channels_cli)
+    app.cli.add_command(reactions_cli)
+    app.cli.add_command(realtime_cli)
+
     # モデルの登録
-    from app.models import User, Channel, Message, Reaction
+    from app.models import User, Channel, Message, Reaction, ChannelParticipant, MessageTombstone, ReactionCount, OutboxEvent, MessageIdempotencyKey
 
     # エラーハンドラーの登録
     @app.errorhandler(404)
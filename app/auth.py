@@ -5,6 +5,7 @@ from flask import session
 from flask_login import login_user as flask_login_user, logout_user as flask_logout_user, current_user
 from app.models import User
 from app import db
+from app.mentions import username_index
 import traceback
 import sqlalchemy as sa
 from sqlalchemy.exc import SQLAlchemyError
@@ -89,6 +90,9 @@ def create_user(username, password):
                 }
             )
     
+    # メンション解決用のインデックスに追加
+    username_index.add(username)
+    
     print(f"ユーザー '{username}' を作成しました。ID: {user_id}")
     return user
 
@@ -0,0 +1,98 @@
+"""チャンネル一覧のプロセス内キャッシュ
+
+チャンネル一覧はほとんど変更されないが全ページ表示で参照されるため、
+バージョン番号付きでメモリに保持する。チャンネルの作成・編集・削除時に
+バージョンを上げてキャッシュを無効化する。
+"""
+import threading
+import time
+from collections import namedtuple
+from app import db
+from app.models import Channel
+
+DEFAULT_CHANNEL_NAME = 'general'
+
+# セッションに依存しないチャンネル情報のスナップショット
+ChannelSnapshot = namedtuple('ChannelSnapshot', ['id', 'name', 'created_by', 'created_at', 'updated_at'])
+
+_CacheEntry = namedtuple('_CacheEntry', ['version', 'loaded_at', 'channels', 'by_id', 'default_channel_id'])
+
+
+class ChannelCache:
+    """バージョン番号で無効化されるチャンネル一覧のキャッシュ"""
+
+    def __init__(self, ttl=30):
+        self.version = 0
+        # 他のワーカーでの変更を取り込むための有効期間（秒、0で無期限）
+        self.ttl = ttl
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """バージョンを上げてキャッシュを破棄する"""
+        with self._lock:
+            self.version += 1
+            self._entry = None
+
+    def _is_valid(self, entry):
+        if entry is None or entry.version != self.version:
+            return False
+        if self.ttl and time.monotonic() - entry.loaded_at > self.ttl:
+            return False
+        return True
+
+    def _load(self):
+        version = self.version
+        rows = Channel.query.order_by(Channel.name).all()
+        channels = tuple(
+            ChannelSnapshot(ch.id, ch.name, ch.created_by, ch.created_at, ch.updated_at)
+            for ch in rows
+        )
+        default_channel_id = next(
+            (ch.id for ch in channels if ch.name == DEFAULT_CHANNEL_NAME), None
+        )
+        entry = _CacheEntry(
+            version=version,
+            loaded_at=time.monotonic(),
+            channels=channels,
+            by_id={ch.id: ch for ch in channels},
+            default_channel_id=default_channel_id
+        )
+        with self._lock:
+            # 読み込み中に無効化された場合は保存しない（次回の参照で再読み込み）
+            if self.version == version:
+                self._entry = entry
+        return entry
+
+    def _get_entry(self):
+        entry = self._entry
+        if not self._is_valid(entry):
+            entry = self._load()
+        return entry
+
+    def list(self):
+        """名前順のチャンネル一覧"""
+        return self._get_entry().channels
+
+    def get(self, channel_id):
+        """IDからチャンネルを取得（存在しない場合は None）"""
+        return self._get_entry().by_id.get(channel_id)
+
+    def get_or_load(self, channel_id):
+        """IDからチャンネルを取得し、キャッシュにない場合はDBを確認する（存在しない場合は None）
+
+        他のワーカーで作成されたチャンネルは有効期間が切れるまでキャッシュにないため、
+        DBにあればキャッシュを無効化して読み込み直す。
+        """
+        channel = self.get(channel_id)
+        if channel is None and db.session.get(Channel, channel_id) is not None:
+            self.invalidate()
+            channel = self.get(channel_id)
+        return channel
+
+    def default_channel_id(self):
+        """デフォルトチャンネルのID（未作成の場合は None）"""
+        return self._get_entry().default_channel_id
+
+
+channel_cache = ChannelCache()
@@ -0,0 +1,86 @@
+"""管理用のFlask CLIコマンド"""
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import or_
+from app import db
+from app.models import Message
+from app.participants import rebuild_participants
+from app.reaction_counts import recount_reactions
+from app.realtime.broker import IPCBroker
+from app.serializers import RENDER_VERSION, prerender_message
+
+messages_cli = AppGroup('messages', help='メッセージ関連の管理コマンド')
+channels_cli = AppGroup('channels', help='チャンネル関連の管理コマンド')
+reactions_cli = AppGroup('reactions', help='リアクション関連の管理コマンド')
+realtime_cli = AppGroup('realtime', help='リアルタイム配信関連のコマンド')
+
+
+@messages_cli.command('rerender')
+@click.option('--batch-size', default=500, show_default=True, help='1回のコミットで処理する件数')
+@click.option('--all', 'rerender_all', is_flag=True,
+              help='バージョンに関係なく全てのメッセージを再生成する（メンションの判定をやり直す場合）')
+def rerender_messages(batch_size, rerender_all):
+    """表示用HTMLが未生成、または古いルールで生成されたメッセージを再生成する"""
+    total = 0
+    last_id = None
+    while True:
+        query = Message.query
+        if not rerender_all:
+            query = query.filter(or_(
+                Message.content_html.is_(None),
+                Message.render_version.is_(None),
+                Message.render_version != RENDER_VERSION
+            ))
+        if last_id is not None:
+            query = query.filter(Message.id > last_id)
+        messages = query.order_by(Message.id).limit(batch_size).all()
+        if not messages:
+            break
+
+        for message in messages:
+            prerender_message(message)
+        db.session.commit()
+        last_id = messages[-1].id
+
+        total += len(messages)
+        click.echo(f'{total}件のメッセージを再生成しました')
+
+    click.echo(f'再生成が完了しました（バージョン: {RENDER_VERSION}、合計: {total}件）')
+
+
+@channels_cli.command('rebuild-participants')
+def rebuild_channel_participants():
+    """既存のメッセージからチャンネル参加者テーブルを作り直す"""
+    total = rebuild_participants()
+    click.echo(f'チャンネル参加者を再構築しました（合計: {total}件）')
+
+
+@reactions_cli.command('recount')
+@click.option('--batch-size', default=500, show_default=True, help='1回に処理するメッセージ数')
+@click.option('--fix', is_flag=True, help='検出したずれを修正する')
+def recount_reaction_counts(batch_size, fix):
+    """リアクション数のカウンターと実際のリアクションのずれを検出・修正する"""
+    drift = recount_reactions(batch_size=batch_size, fix=fix)
+    for message_id, emoji, stored, actual in drift:
+        click.echo(f'{message_id} {emoji}: 保存値={stored} 実際={actual}')
+
+    if not drift:
+        click.echo('ずれはありませんでした')
+    elif fix:
+        click.echo(f'{len(drift)}件のずれを修正しました')
+    else:
+        click.echo(f'{len(drift)}件のずれを検出しました（--fix で修正します）')
+
+
+@realtime_cli.command('broker')
+@click.option('--path', default=None, help='Unixソケットのパス（省略時はSOCKETIO_IPC_PATH）')
+def run_broker(path):
+    """複数ワーカー間でSocket.IOのイベントを中継するブローカーを起動する（SOCKETIO_FANOUT_BACKEND=ipc）"""
+    path = path or current_app.config['SOCKETIO_IPC_PATH']
+    broker = IPCBroker(path)
+    click.echo(f'ブローカーを起動しました: {path}')
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        broker.stop()
@@ -0,0 +1,104 @@
+"""メンション解決用のユーザー名インデックス
+
+起動時に全ユーザー名をメモリに読み込み、ユーザーを作成・改名したトランザクションのコミット時に
+反映することで、「どの @名前 が実在するユーザーか」をDBに問い合わせずに判定する。
+他のワーカーで作成されたユーザーは再読み込みまでインデックスにないため、インデックスにない名前は
+呼び出し側（find_existing_usernames）でDBを確認する。
+"""
+import threading
+import time
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from app import db
+from app.models import User
+
+
+class UsernameIndex:
+    """プロセス内で共有するユーザー名の集合"""
+
+    def __init__(self, refresh_interval=300):
+        self._usernames = set()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        # 他のワーカーで作成されたユーザーを取り込むための再読み込み間隔（秒）
+        self.refresh_interval = refresh_interval
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def load(self):
+        """DBから全ユーザー名を読み込む（アプリケーションコンテキスト内で呼び出す）"""
+        usernames = {row.username for row in db.session.query(User.username).all()}
+        with self._lock:
+            self._usernames = usernames
+            self._loaded_at = time.monotonic()
+
+    def add(self, username):
+        """作成されたユーザー名をインデックスに追加"""
+        with self._lock:
+            self._usernames.add(username)
+
+    def discard(self, username):
+        """改名されたユーザーの元の名前をインデックスから削除"""
+        with self._lock:
+            self._usernames.discard(username)
+
+    def _is_stale(self):
+        if not self.refresh_interval:
+            return False
+        return time.monotonic() - self._loaded_at > self.refresh_interval
+
+    def filter_existing(self, usernames):
+        """指定したユーザー名のうち実在するものを返す
+
+        インデックスが未読み込みの場合は None を返し、呼び出し側でDBを参照させる。
+        """
+        if not self.loaded:
+            return None
+        if self._is_stale():
+            self.load()
+        return {username for username in usernames if username in self._usernames}
+
+
+username_index = UsernameIndex()
+
+
+# コミット待ちのユーザー名の変更（session.info のキー、(ユーザー名, 存在するか) のリスト）
+_PENDING_KEY = 'pending_usernames'
+
+
+def _record_pending(target, username, exists):
+    object_session(target).info.setdefault(_PENDING_KEY, []).append((username, exists))
+
+
+@event.listens_for(User, 'after_insert')
+def _record_inserted_username(mapper, connection, target):
+    """ORM経由で作成されたユーザーも、コミット後にインデックスへ反映するよう記録"""
+    _record_pending(target, target.username, True)
+
+
+@event.listens_for(User, 'after_update')
+def _record_renamed_username(mapper, connection, target):
+    """ORM経由で改名されたユーザーは、コミット後に元の名前を削除して新しい名前を追加するよう記録"""
+    history = inspect(target).attrs.username.history
+    if not history.deleted:
+        return
+    for username in history.deleted:
+        _record_pending(target, username, False)
+    _record_pending(target, target.username, True)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed_usernames(session):
+    for username, exists in session.info.pop(_PENDING_KEY, ()):
+        if exists:
+            username_index.add(username)
+        else:
+            username_index.discard(username)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_usernames(session):
+    # ロールバックした変更はDBに残らないため、インデックスに反映しない
+    session.info.pop(_PENDING_KEY, None)
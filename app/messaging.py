@@ -0,0 +1,180 @@
+"""メッセージ送信の共通処理
+
+HTTP（/chat/send）とWebSocket（send_message イベント）のどちらから送信しても、
+同じ検証・保存・配信の処理を通るようにする。
+
+クライアントは送信ごとに送信キー（client_message_id）を付けられる。タイムアウト後の再送などで
+同じキーが一定期間内に再び送られた場合は、保存済みのメッセージを返し、保存も配信もやり直さない。
+"""
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.channel_cache import channel_cache
+from app.metrics import metrics
+from app.models import Message, MessageIdempotencyKey, User
+from app.outbox import enqueue_event
+from app.participants import add_participant
+from app.serializers import extract_mentions, find_existing_usernames, prerender_message, format_message
+from app.sync import next_change_seq
+
+
+CLIENT_MESSAGE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# 期限切れの送信キーを削除する間隔（秒、プロセスごと）
+PRUNE_INTERVAL_SECONDS = 60
+_last_pruned_at = 0.0
+
+# メンションの通知に含める本文の最大文字数
+MENTION_EXCERPT_LENGTH = 100
+
+
+class MessageError(ValueError):
+    """メッセージの入力内容のエラー（メッセージはそのまま利用者に表示する）"""
+
+
+def validate_new_message(channel_id, content, has_image=False, client_message_id=None):
+    """送信内容を検証し、問題がある場合は MessageError を送出する"""
+    if client_message_id is not None and (
+        not isinstance(client_message_id, str) or not CLIENT_MESSAGE_ID_PATTERN.match(client_message_id)
+    ):
+        raise MessageError('送信キーが不正です')
+    if not channel_id:
+        raise MessageError('チャンネルIDが指定されていません')
+    if not content and not has_image:
+        raise MessageError('メッセージまたは画像を入力してください')
+    if channel_cache.get_or_load(channel_id) is None:
+        raise MessageError('チャンネルが見つかりません')
+
+
+def _idempotency_cutoff():
+    window = current_app.config.get('MESSAGE_IDEMPOTENCY_WINDOW_SECONDS', 86400)
+    return datetime.utcnow() - timedelta(seconds=window)
+
+
+def find_sent_message(user_id, client_message_id):
+    """送信キーで保存済みのメッセージを探して整形済みのデータを返す（未送信の場合は None）
+
+    送信後にメッセージが削除されている場合は MessageError を送出する。
+    """
+    if not client_message_id:
+        return None
+    sent = db.session.get(MessageIdempotencyKey, (user_id, client_message_id))
+    if sent is None or sent.created_at < _idempotency_cutoff():
+        return None
+
+    message = db.session.get(Message, sent.message_id)
+    if message is None:
+        raise MessageError('このメッセージは送信後に削除されています')
+    metrics.increment('message_send_deduplicated_total')
+    return format_message(message)
+
+
+def prune_idempotency_keys(force=False, commit=True):
+    """期限切れの送信キーを削除する（force でない場合はプロセスごとに一定間隔で実行）
+
+    commit が False の場合は呼び出し元のトランザクションで削除する。
+    """
+    global _last_pruned_at
+    now = time.monotonic()
+    if not force and now - _last_pruned_at < PRUNE_INTERVAL_SECONDS:
+        return 0
+    _last_pruned_at = now
+    deleted = MessageIdempotencyKey.query.filter(
+        MessageIdempotencyKey.created_at < _idempotency_cutoff()
+    ).delete(synchronize_session=False)
+    if commit:
+        db.session.commit()
+    return deleted
+
+
+def enqueue_mentions(message, mentioned_usernames):
+    """メンションされたユーザー（投稿者を除く）の個人のルームに送る mention イベントを追加する"""
+    if not mentioned_usernames:
+        return
+    # 通知先と投稿者のユーザー名を1クエリで取得
+    rows = db.session.query(User.id, User.username).filter(
+        or_(User.username.in_(mentioned_usernames), User.id == message.user_id)
+    ).all()
+    author = next((row.username for row in rows if row.id == message.user_id), None)
+    channel = channel_cache.get(message.channel_id)
+    payload = {
+        'message_id': message.id,
+        'channel_id': message.channel_id,
+        'channel_name': channel.name if channel else None,
+        'user_id': message.user_id,
+        'username': author,
+        'excerpt': (message.content or '')[:MENTION_EXCERPT_LENGTH],
+    }
+    for row in rows:
+        if row.id != message.user_id and row.username in mentioned_usernames:
+            enqueue_event('mention', payload, message.channel_id, user_id=row.id)
+
+
+def post_message(user_id, channel_id, content, image_url=None, client_message_id=None):
+    """メッセージを保存して整形済みのデータを返す
+
+    配信するイベントは同じトランザクションでアウトボックスに追加する。
+    client_message_id が保存済みの場合は、保存済みのメッセージをそのまま返す。
+    保存に失敗した場合はロールバックして例外をそのまま送出する。
+    """
+    sent = find_sent_message(user_id, client_message_id)
+    if sent is not None:
+        return sent
+
+    message = Message(
+        id=str(uuid.uuid4()),
+        content=content,
+        user_id=user_id,
+        channel_id=channel_id,
+        image_url=image_url
+    )
+
+    # メンション処理（実在するユーザー名を1クエリで確認）
+    mentions = extract_mentions(content)
+    existing_usernames = find_existing_usernames(mentions)
+    mentioned_usernames = [username for username in mentions if username in existing_usernames]
+
+    # 表示用HTMLを書き込み時に生成
+    prerender_message(message)
+
+    try:
+        if client_message_id:
+            # 期限切れで削除前の送信キーが残っている場合は置き換える
+            expired = db.session.get(MessageIdempotencyKey, (user_id, client_message_id))
+            if expired is not None:
+                db.session.delete(expired)
+            db.session.add(MessageIdempotencyKey(user_id=user_id, key=client_message_id, message_id=message.id))
+
+        message.change_seq = next_change_seq(channel_id)
+        db.session.add(message)
+        db.session.flush()
+
+        formatted_message = format_message(message)
+        formatted_message['mentions'] = mentioned_usernames
+        formatted_message['channel_id'] = channel_id  # channel_idを明示的に追加
+        enqueue_event('new_message', formatted_message, channel_id)
+        enqueue_mentions(message, mentioned_usernames)
+
+        # チャンネル参加者の記録と期限切れの送信キーの削除もメッセージと同じトランザクションで行う
+        add_participant(channel_id, user_id)
+        if client_message_id:
+            prune_idempotency_keys(commit=False)
+
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # 同じ送信キーの同時リクエストが先に保存した場合はそちらを返す
+        sent = find_sent_message(user_id, client_message_id)
+        if sent is not None:
+            return sent
+        raise
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return formatted_message
@@ -0,0 +1,46 @@
+"""運用監視用の簡易メトリクス
+
+プロセス内のカウンター・ゲージと、参照時に値を計算するゲージ（コールバック）を保持し、
+/metrics でJSONとして公開する。
+"""
+import threading
+
+
+class Metrics:
+    """カウンターとゲージの置き場所"""
+
+    def __init__(self):
+        self._values = {}
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        """カウンターを増やす"""
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + value
+
+    def set(self, name, value):
+        """ゲージの値を設定する"""
+        with self._lock:
+            self._values[name] = value
+
+    def register(self, name, callback):
+        """参照時に値を計算するゲージを登録する"""
+        with self._lock:
+            self._callbacks[name] = callback
+
+    def snapshot(self):
+        """現在の値を {名前: 値} で返す（計算に失敗したゲージは None）"""
+        with self._lock:
+            values = dict(self._values)
+            callbacks = dict(self._callbacks)
+        for name, callback in callbacks.items():
+            try:
+                values[name] = callback()
+            except Exception as e:
+                print(f"メトリクスの取得エラー（{name}）: {str(e)}")
+                values[name] = None
+        return dict(sorted(values.items()))
+
+
+metrics = Metrics()
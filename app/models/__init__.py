@@ -2,4 +2,9 @@ from .user import User
 from .channel import Channel
 from .message import Message
 from .reaction import Reaction
-# from .channel_member import ChannelMember  # 削除 
\ No newline at end of file
+from .channel_participant import ChannelParticipant
+from .message_tombstone import MessageTombstone
+from .reaction_count import ReactionCount
+from .outbox_event import OutboxEvent
+from .message_idempotency_key import MessageIdempotencyKey
+# from .channel_member import ChannelMember  # 削除
@@ -7,6 +7,8 @@ class Channel(db.Model):
     id = db.Column(db.String(255), primary_key=True)
     name = db.Column(db.String(255), nullable=False)
     created_by = db.Column(db.String(255), db.ForeignKey('users.id'), nullable=False)
+    # チャンネル内の変更（投稿・編集・削除）ごとに増える連番
+    change_seq = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(UTC))
     updated_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(UTC), onupdate=lambda: datetime.now(UTC))
 
@@ -0,0 +1,13 @@
+from datetime import datetime
+from app import db
+
+class ChannelParticipant(db.Model):
+    """チャンネルに投稿したことのあるユーザー（メンション候補の一覧用）"""
+    __tablename__ = 'channel_participants'
+
+    channel_id = db.Column(db.String(255), db.ForeignKey('channels.id'), primary_key=True)
+    user_id = db.Column(db.String(255), db.ForeignKey('users.id'), primary_key=True)
+    joined_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ChannelParticipant {self.channel_id}:{self.user_id}>'
@@ -3,13 +3,24 @@ from app import db
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # チャンネル履歴のキーセットページング用インデックス
+        db.Index('ix_messages_channel_created_id', 'channel_id', 'created_at', 'id'),
+        # 差分同期用インデックス
+        db.Index('ix_messages_channel_change_seq', 'channel_id', 'change_seq'),
+    )
 
     id = db.Column(db.String(36), primary_key=True)
     channel_id = db.Column(db.String(255), db.ForeignKey('channels.id'), nullable=False)
     user_id = db.Column(db.String(255), db.ForeignKey('users.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    # 書き込み時に生成した表示用HTMLと、その生成ルールのバージョン
+    content_html = db.Column(db.Text, nullable=True)
+    render_version = db.Column(db.Integer, nullable=True)
     image_url = db.Column(db.String(255), nullable=True)
     is_edited = db.Column(db.Boolean, default=False)
+    # 最後に作成・編集された時点のチャンネル内連番
+    change_seq = db.Column(db.BigInteger, nullable=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
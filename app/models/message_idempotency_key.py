@@ -0,0 +1,14 @@
+from datetime import datetime
+from app import db
+
+class MessageIdempotencyKey(db.Model):
+    """クライアントが指定した送信キー（再送による重複送信を防ぐため一定期間保持する）"""
+    __tablename__ = 'message_idempotency_keys'
+
+    user_id = db.Column(db.String(255), db.ForeignKey('users.id'), primary_key=True)
+    key = db.Column(db.String(64), primary_key=True)
+    message_id = db.Column(db.String(36), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<MessageIdempotencyKey {self.user_id} {self.key}>'
@@ -0,0 +1,17 @@
+from datetime import datetime
+from app import db
+
+class MessageTombstone(db.Model):
+    """削除されたメッセージの記録（差分同期で削除を通知するため）"""
+    __tablename__ = 'message_tombstones'
+    __table_args__ = (
+        db.Index('ix_message_tombstones_channel_seq', 'channel_id', 'change_seq'),
+    )
+
+    message_id = db.Column(db.String(36), primary_key=True)
+    channel_id = db.Column(db.String(255), db.ForeignKey('channels.id'), nullable=False)
+    change_seq = db.Column(db.BigInteger, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<MessageTombstone {self.message_id}>'
@@ -0,0 +1,17 @@
+from datetime import datetime
+from app import db
+
+class OutboxEvent(db.Model):
+    """コミット後に配信するSocket.IOイベント（トランザクショナルアウトボックス）"""
+    __tablename__ = 'outbox_events'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    event = db.Column(db.String(50), nullable=False)
+    channel_id = db.Column(db.String(255), nullable=False)
+    # 個人のルームに送信するイベントの送信先（チャンネルのルームに送信する場合は None）
+    user_id = db.Column(db.String(255), nullable=True)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.event}>'
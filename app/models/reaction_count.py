@@ -0,0 +1,12 @@
+from app import db
+
+class ReactionCount(db.Model):
+    """メッセージ・絵文字ごとのリアクション数（reactionsテーブルの集計を非正規化したもの）"""
+    __tablename__ = 'reaction_counts'
+
+    message_id = db.Column(db.String(36), db.ForeignKey('messages.id'), primary_key=True)
+    emoji = db.Column(db.String(10), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ReactionCount {self.emoji}:{self.count}>'
@@ -0,0 +1,198 @@
+"""トランザクショナルアウトボックス
+
+チャンネルのイベントをメッセージの変更と同じトランザクションで outbox_events に書き込み、
+コミット後にバックグラウンドのディスパッチャーがまとめて送信する。
+HTTPレスポンスは配信を待たず、コミット後にプロセスが落ちても次のディスパッチで送信される
+（少なくとも1回の配信。重複したイベントはクライアント側でメッセージIDと連番により無視される）。
+"""
+import json
+import threading
+import traceback
+from datetime import datetime
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from app import db, socketio
+from app.metrics import metrics
+from app.models import OutboxEvent
+from app.realtime import publish_channel_event, publish_user_event
+
+# 未配信のイベントを追加したセッションの目印（session.info のキー）
+_PENDING_KEY = 'outbox_pending'
+
+
+def enqueue_event(event_name, payload, channel_id, user_id=None):
+    """イベントを現在のトランザクションに追加する（コミット後に配信される）
+
+    user_id を指定した場合はチャンネルのルームではなく、そのユーザーの個人のルームに送信する。
+    """
+    db.session.add(OutboxEvent(
+        event=event_name,
+        channel_id=channel_id,
+        user_id=user_id,
+        payload=json.dumps(payload, ensure_ascii=False)
+    ))
+    db.session.info[_PENDING_KEY] = True
+
+
+def _claim_channel_events(channel_id, limit):
+    """チャンネルの未配信のイベントを古い順に最大 limit 件ロックして返す
+
+    チャンネルの最も古い未配信のイベントをロックできた場合だけ、そのチャンネルを担当する。
+    他のワーカーが担当中（最も古いイベントをロック中）の場合は空のリストを返す。
+    同じチャンネルのイベントは常に1つのワーカーが古い順に送信するため、連番の順序が入れ替わらない。
+    """
+    first_id = db.session.query(func.min(OutboxEvent.id)).filter(OutboxEvent.channel_id == channel_id).scalar()
+    if first_id is None:
+        return []
+    first = OutboxEvent.query.filter(OutboxEvent.id == first_id).with_for_update(skip_locked=True).first()
+    if first is None:
+        return []
+    return OutboxEvent.query.filter(OutboxEvent.channel_id == channel_id) \
+        .order_by(OutboxEvent.id).limit(limit).with_for_update().all()
+
+
+def dispatch_pending(batch_size):
+    """未配信のイベントを最大 batch_size 件送信して削除し、送信した件数を返す
+
+    未配信のイベントが古いチャンネルから順にチャンネル単位で取得する。複数のワーカーが同時に
+    実行しても、1つのチャンネルのイベントは担当した1つのワーカーだけが古い順に送信する。
+    """
+    channel_ids = [
+        row.channel_id for row in db.session.query(OutboxEvent.channel_id)
+        .group_by(OutboxEvent.channel_id).order_by(func.min(OutboxEvent.id)).limit(batch_size)
+    ]
+    rows = []
+    for channel_id in channel_ids:
+        if len(rows) >= batch_size:
+            break
+        rows.extend(_claim_channel_events(channel_id, batch_size - len(rows)))
+    if not rows:
+        db.session.commit()
+        return 0
+
+    for row in rows:
+        if row.user_id is not None:
+            publish_user_event(row.event, json.loads(row.payload), row.user_id)
+        else:
+            publish_channel_event(row.event, json.loads(row.payload), row.channel_id)
+    # 追加されてから送信するまでの時間（バッチ内で最も古いもの）
+    lag = (datetime.utcnow() - min(row.created_at for row in rows)).total_seconds()
+    count = len(rows)
+
+    # 送信後に削除する（削除前に落ちた場合は次回に再送される）
+    OutboxEvent.query.filter(OutboxEvent.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+    db.session.commit()
+
+    metrics.increment('outbox_dispatched_total', count)
+    metrics.set('outbox_dispatch_lag_seconds', lag)
+    return count
+
+
+def outbox_depth():
+    """未配信のイベント数"""
+    return db.session.query(func.count(OutboxEvent.id)).scalar()
+
+
+def outbox_oldest_age():
+    """最も古い未配信イベントの経過秒数（未配信がない場合は0）"""
+    oldest = db.session.query(func.min(OutboxEvent.created_at)).scalar()
+    if oldest is None:
+        return 0
+    return (datetime.utcnow() - oldest).total_seconds()
+
+
+metrics.register('outbox_depth', outbox_depth)
+metrics.register('outbox_oldest_age_seconds', outbox_oldest_age)
+
+
+class OutboxDispatcher:
+    """アウトボックスのイベントをバックグラウンドでまとめて送信する
+
+    イベントを追加したトランザクションのコミットの通知で起こされる。通知のない間も poll_interval
+    ごとに1回だけ未配信を確認する（他のワーカーが送信前に異常終了して残ったイベントを拾うため）。
+    最初のコミットの通知で起動する。
+    """
+
+    def __init__(self, batch_size=100, poll_interval=30.0):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._app = None
+        self._started = False
+        self._task = None
+        # stop() のたびに進め、古いバックグラウンドのループを終わらせる
+        self._generation = 0
+        self._wakeup = threading.Event()
+        self._start_lock = threading.Lock()
+        # バックグラウンドとflush()が同時に送信しないようにする
+        self._dispatch_lock = threading.Lock()
+
+    def configure(self, app, batch_size, poll_interval):
+        """送信に使うアプリケーションと設定を指定する"""
+        self._app = app
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+    def notify(self):
+        """コミットされたイベントがあることを知らせる"""
+        if self._app is None:
+            return
+        with self._start_lock:
+            if not self._started:
+                self._started = True
+                self._task = socketio.start_background_task(self._run, self._generation)
+        self._wakeup.set()
+
+    def stop(self, timeout=5):
+        """バックグラウンドの送信を止め、送信中のバッチが終わるまで待つ（次の通知で再び起動する）"""
+        with self._start_lock:
+            task, self._task = self._task, None
+            self._started = False
+            self._generation += 1
+        self._wakeup.set()
+        if task is not None and hasattr(task, 'join'):
+            task.join(timeout)
+
+    def _run(self, generation):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            if generation != self._generation:
+                return
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"アウトボックスの配信エラー: {str(e)}")
+                traceback.print_exc()
+
+    def dispatch_batch(self):
+        """1バッチ分を送信して送信した件数を返す"""
+        with self._dispatch_lock:
+            with self._app.app_context():
+                try:
+                    return dispatch_pending(self.batch_size)
+                except Exception:
+                    db.session.rollback()
+                    raise
+
+    def flush(self):
+        """未配信のイベントがなくなるまで送信して送信した件数を返す"""
+        total = 0
+        while True:
+            count = self.dispatch_batch()
+            total += count
+            if count < self.batch_size:
+                return total
+
+
+outbox_dispatcher = OutboxDispatcher()
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_after_commit(session):
+    if session.info.pop(_PENDING_KEY, False):
+        outbox_dispatcher.notify()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _clear_after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
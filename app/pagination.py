@@ -0,0 +1,107 @@
+"""メッセージ履歴のカーソル（キーセット）ページング
+
+(created_at, id) の組をカーソルとして使用し、OFFSETを使わずに
+インデックスの範囲検索だけでページを取得する。
+"""
+import base64
+import binascii
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import and_, or_
+from app.models import Message
+
+
+class InvalidCursor(ValueError):
+    """カーソル文字列を解釈できない場合の例外"""
+
+
+def encode_cursor(message):
+    """メッセージの (created_at, id) をURLセーフなカーソル文字列に変換"""
+    raw = f"{message.created_at.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """カーソル文字列を (created_at, id) に戻す"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        created_at, message_id = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), message_id
+    except (ValueError, UnicodeError, binascii.Error) as e:
+        raise InvalidCursor(f'不正なカーソルです: {cursor}') from e
+
+
+def get_page_size(limit=None):
+    """リクエストされた件数を設定値の範囲内に丸める"""
+    default_size = current_app.config.get('MESSAGES_PAGE_SIZE', 50)
+    max_size = current_app.config.get('MESSAGES_MAX_PAGE_SIZE', 200)
+    if not limit or limit < 1:
+        return default_size
+    return min(limit, max_size)
+
+
+class MessagePage:
+    """1ページ分のメッセージ（古い順）と前後ページの有無"""
+
+    def __init__(self, messages, has_older, has_newer):
+        self.messages = messages
+        self.has_older = has_older
+        self.has_newer = has_newer
+
+    @property
+    def older_cursor(self):
+        """さらに古いページを取得するためのカーソル"""
+        if not self.messages or not self.has_older:
+            return None
+        return encode_cursor(self.messages[0])
+
+    @property
+    def newer_cursor(self):
+        """より新しいページを取得するためのカーソル"""
+        if not self.messages:
+            return None
+        return encode_cursor(self.messages[-1])
+
+    def to_dict(self):
+        return {
+            'has_older': self.has_older,
+            'has_newer': self.has_newer,
+            'older_cursor': self.older_cursor,
+            'newer_cursor': self.newer_cursor
+        }
+
+
+def paginate_messages(channel_id, before=None, after=None, limit=None):
+    """チャンネルのメッセージを1ページ分取得する
+
+    before も after も指定されない場合は最新のページを返す。
+    どちらの場合も返却するメッセージは古い順に並ぶ。
+    before と after は同時に指定できない（InvalidCursor を送出する）。
+    """
+    if before and after:
+        raise InvalidCursor('before と after は同時に指定できません')
+    page_size = get_page_size(limit)
+    query = Message.query.filter(Message.channel_id == channel_id)
+
+    if after:
+        created_at, message_id = decode_cursor(after)
+        rows = query.filter(or_(
+            Message.created_at > created_at,
+            and_(Message.created_at == created_at, Message.id > message_id)
+        )).order_by(Message.created_at.asc(), Message.id.asc()).limit(page_size + 1).all()
+        has_newer = len(rows) > page_size
+        return MessagePage(rows[:page_size], has_older=True, has_newer=has_newer)
+
+    if before:
+        created_at, message_id = decode_cursor(before)
+        query = query.filter(or_(
+            Message.created_at < created_at,
+            and_(Message.created_at == created_at, Message.id < message_id)
+        ))
+
+    rows = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(page_size + 1).all()
+    has_older = len(rows) > page_size
+    rows = rows[:page_size]
+    rows.reverse()
+    return MessagePage(rows, has_older=has_older, has_newer=before is not None)
@@ -0,0 +1,51 @@
+"""チャンネル参加者（投稿したことのあるユーザー）の管理
+
+メッセージ送信時に (channel_id, user_id) を記録しておき、メンション候補の一覧を
+メッセージテーブルの走査ではなく主キーのインデックス検索で取得する。
+"""
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import ChannelParticipant, Message, User
+
+
+def add_participant(channel_id, user_id):
+    """ユーザーをチャンネルの参加者として記録（記録済みの場合は何もしない）
+
+    呼び出し元のトランザクションで記録し、コミットは呼び出し元で行う。
+    """
+    if db.session.get(ChannelParticipant, (channel_id, user_id)) is not None:
+        return False
+    try:
+        with db.session.begin_nested():
+            db.session.add(ChannelParticipant(channel_id=channel_id, user_id=user_id))
+    except IntegrityError:
+        # 同じユーザーの同時送信で既に記録された場合（セーブポイントまでだけ戻す）
+        return False
+    return True
+
+
+def get_participants(channel_id):
+    """チャンネル参加者の id と username を取得"""
+    return db.session.query(User.id, User.username).join(
+        ChannelParticipant, ChannelParticipant.user_id == User.id
+    ).filter(
+        ChannelParticipant.channel_id == channel_id
+    ).all()
+
+
+def rebuild_participants():
+    """既存のメッセージから参加者テーブルを作り直す"""
+    db.session.query(ChannelParticipant).delete()
+    db.session.execute(
+        insert(ChannelParticipant).from_select(
+            ['channel_id', 'user_id', 'joined_at'],
+            select(
+                Message.channel_id,
+                Message.user_id,
+                func.min(Message.created_at)
+            ).group_by(Message.channel_id, Message.user_id)
+        )
+    )
+    db.session.commit()
+    return db.session.query(func.count()).select_from(ChannelParticipant).scalar()
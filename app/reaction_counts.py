@@ -0,0 +1,108 @@
+"""リアクション数の非正規化カウンター
+
+リアクションの追加・削除と同じトランザクションで (message_id, emoji) ごとの件数を更新し、
+表示時は集計クエリの代わりにカウンターを主キーで読み込む。
+"""
+from sqlalchemy import delete, func, select, update
+from app import db
+from app.models import Message, Reaction, ReactionCount
+
+
+def increment_reaction_count(message_id, emoji):
+    """リアクション数を1増やす（コミットは呼び出し元で行う）"""
+    result = db.session.execute(
+        update(ReactionCount)
+        .where(ReactionCount.message_id == message_id, ReactionCount.emoji == emoji)
+        .values(count=ReactionCount.count + 1)
+    )
+    if result.rowcount == 0:
+        db.session.add(ReactionCount(message_id=message_id, emoji=emoji, count=1))
+
+
+def decrement_reaction_count(message_id, emoji):
+    """リアクション数を1減らし、0になった行は削除する（コミットは呼び出し元で行う）"""
+    db.session.execute(
+        update(ReactionCount)
+        .where(ReactionCount.message_id == message_id, ReactionCount.emoji == emoji)
+        .values(count=ReactionCount.count - 1)
+    )
+    db.session.execute(
+        delete(ReactionCount)
+        .where(ReactionCount.message_id == message_id, ReactionCount.emoji == emoji)
+        .where(ReactionCount.count <= 0)
+    )
+
+
+def delete_reaction_counts(message_id):
+    """メッセージのリアクション数をすべて削除する（メッセージ削除時）"""
+    db.session.execute(delete(ReactionCount).where(ReactionCount.message_id == message_id))
+
+
+def delete_channel_reaction_counts(channel_id):
+    """チャンネルの全メッセージのリアクション数を削除する（チャンネル削除時、メッセージより先に呼ぶ）"""
+    message_ids = select(Message.id).where(Message.channel_id == channel_id)
+    db.session.execute(delete(ReactionCount).where(ReactionCount.message_id.in_(message_ids)))
+
+
+def load_reaction_counts(message_ids):
+    """複数メッセージのリアクション数を1クエリで取得して {message_id: [...]} を返す"""
+    result = {message_id: [] for message_id in message_ids}
+    if not result:
+        return result
+    rows = db.session.query(ReactionCount).filter(
+        ReactionCount.message_id.in_(result.keys()),
+        ReactionCount.count > 0
+    ).order_by(ReactionCount.message_id, ReactionCount.emoji).all()
+
+    for row in rows:
+        result[row.message_id].append({'emoji': row.emoji, 'count': row.count})
+    return result
+
+
+def recount_reactions(batch_size=500, fix=False):
+    """カウンターとreactionsテーブルの集計を比較し、ずれを検出（fix=Trueの場合は修正）する
+
+    メッセージIDの順にbatch_size件ずつ処理し、ずれのあった (message_id, emoji, 保存値, 実際の値) を返す。
+    """
+    drift = []
+    last_id = ''
+    while True:
+        message_ids = [row.id for row in db.session.query(Message.id).filter(
+            Message.id > last_id
+        ).order_by(Message.id).limit(batch_size).all()]
+        if not message_ids:
+            break
+        last_id = message_ids[-1]
+
+        actual = {
+            (row.message_id, row.emoji): row.count
+            for row in db.session.query(
+                Reaction.message_id,
+                Reaction.emoji,
+                func.count(Reaction.user_id).label('count')
+            ).filter(Reaction.message_id.in_(message_ids)).group_by(Reaction.message_id, Reaction.emoji)
+        }
+        stored = {
+            (row.message_id, row.emoji): row
+            for row in ReactionCount.query.filter(ReactionCount.message_id.in_(message_ids))
+        }
+
+        for key in set(actual) | set(stored):
+            actual_count = actual.get(key, 0)
+            counter = stored.get(key)
+            stored_count = counter.count if counter else 0
+            if actual_count == stored_count and (counter is None or counter.count > 0):
+                continue
+            drift.append((key[0], key[1], stored_count, actual_count))
+            if not fix:
+                continue
+            if actual_count == 0:
+                db.session.delete(counter)
+            elif counter is None:
+                db.session.add(ReactionCount(message_id=key[0], emoji=key[1], count=actual_count))
+            else:
+                counter.count = actual_count
+
+        if fix:
+            db.session.commit()
+    return drift
@@ -0,0 +1,44 @@
+"""リアルタイム配信（Socket.IO）関連の処理"""
+from app import socketio
+from app.realtime.replay import replay_buffer
+
+_CHANNEL_ROOM_PREFIX = 'channel:'
+
+
+def channel_room(channel_id):
+    """チャンネルのイベントを受け取るクライアントが参加するルーム名"""
+    return f'{_CHANNEL_ROOM_PREFIX}{channel_id}'
+
+
+def user_room(user_id):
+    """ユーザー宛てのイベント（メンションの通知など）を受け取る個人のルーム名"""
+    return f'user:{user_id}'
+
+
+def channel_id_from_room(room):
+    """チャンネルのルーム名からチャンネルIDを返す（チャンネルのルームでない場合は None）"""
+    if not isinstance(room, str) or not room.startswith(_CHANNEL_ROOM_PREFIX):
+        return None
+    return room[len(_CHANNEL_ROOM_PREFIX):]
+
+
+def publish_channel_event(event, payload, channel_id):
+    """チャンネルのルームにイベントを送信する（連番付きのものは record_channel_event で再送用に記録される）"""
+    socketio.emit(event, payload, to=channel_room(channel_id))
+
+
+def publish_user_event(event, payload, user_id):
+    """ユーザーの個人のルーム（そのユーザーの全ての接続）にイベントを送信する"""
+    socketio.emit(event, payload, to=user_room(user_id))
+
+
+def record_channel_event(event, payload, room):
+    """クライアントマネージャーが送信した連番付きのイベントを再送用に記録する
+
+    他のワーカーから中継されたイベントも記録するため、接続を受け付ける全てのプロセス
+    （ゲートウェイを含む）の再送用バッファに同じイベントが揃う。
+    """
+    channel_id = channel_id_from_room(room)
+    if channel_id is None or not isinstance(payload, dict) or payload.get('seq') is None:
+        return
+    replay_buffer.append(channel_id, payload['seq'], event, payload)
@@ -0,0 +1,82 @@
+"""再接続の集中に対するSocket.IOの接続の受け付け制限
+
+デプロイでワーカーが再起動すると、全てのブラウザが同時に再接続し、それぞれが再送・差分同期の
+取得を始めるため、起動直後の数十秒に負荷が集中する。ここではトークンバケットで1秒あたりに
+受け付ける接続数を制限し、受け付けなかった接続には再接続までの待ち時間（retry_after）を返す。
+
+待ち時間はトークンが補充されるまでの時間に、0〜window 秒のランダムな時間（ジッター）を加えたもの。
+同時に断られたクライアントが同じ時刻に再接続しないよう、再接続を window 秒の間に分散させる。
+制限はプロセスごとに行う（ゲートウェイを複数起動する場合は1プロセスあたりの値として設定する）。
+"""
+import random
+import threading
+import time
+from app.metrics import metrics
+
+
+class TokenBucket:
+    """1秒あたり rate 個のトークンを補充し、最大 burst 個まで貯めるトークンバケット"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self):
+        """トークンを1つ取得する。取得できない場合は次のトークンが補充されるまでの秒数を返す（取得できた場合は 0）"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def available(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class ConnectAdmission:
+    """Socket.IOの接続を受け付けるかを判定する"""
+
+    def __init__(self, rate=0, burst=0, window=0):
+        self.configure(rate, burst, window)
+
+    def configure(self, rate, burst, window):
+        """1秒あたりに受け付ける接続数（0以下で制限しない）、連続して受け付ける上限、再接続を分散させる秒数を設定する"""
+        self.window = max(window, 0)
+        self._bucket = TokenBucket(rate, max(burst, 1)) if rate > 0 else None
+
+    def admit(self):
+        """接続を受け付ける場合は None、受け付けない場合は再接続までの待ち時間（秒）を返す"""
+        if self._bucket is None:
+            return None
+        wait = self._bucket.take()
+        if not wait:
+            metrics.increment('socketio_connects_admitted_total')
+            return None
+        metrics.increment('socketio_connects_rejected_total')
+        return max(round(wait + random.uniform(0, self.window), 1), 0.1)
+
+    def stats(self):
+        """/metrics 用の受け付けの状況（制限しない場合は None）"""
+        if self._bucket is None:
+            return None
+        return {
+            'rate': self._bucket.rate,
+            'burst': self._bucket.burst,
+            'window': self.window,
+            'tokens': round(self._bucket.available(), 1),
+        }
+
+
+connect_admission = ConnectAdmission()
+
+metrics.register('socketio_connect_admission', connect_admission.stats)
@@ -0,0 +1,136 @@
+"""ワーカー間のイベントを中継するUnixソケットのブローカー
+
+同じマシン上で複数のワーカーを動かす場合に使う。各ワーカーの IPCManager が接続し、
+1行1メッセージ（JSON）で送られたデータを送信元以外の全接続にそのまま転送する。
+受信が追いつかない接続は切断し、再接続後にクライアント側の再送・差分同期に任せる。
+"""
+import os
+import selectors
+import socket
+
+
+class _Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+
+
+class IPCBroker:
+    """受け取った行を他の全接続に転送するブローカー"""
+
+    def __init__(self, path, max_line=1024 * 1024, max_buffer=8 * 1024 * 1024):
+        self.path = path
+        # 1メッセージの最大サイズと、接続ごとの未送信データの上限（バイト）
+        self.max_line = max_line
+        self.max_buffer = max_buffer
+        self._selector = selectors.DefaultSelector()
+        self._connections = {}
+        self._listener = None
+        self._running = False
+
+    def _remove_stale_socket(self):
+        """前回のブローカーが残したソケットファイルを削除する"""
+        if not os.path.exists(self.path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except OSError:
+            os.unlink(self.path)
+        else:
+            raise RuntimeError(f'ブローカーは既に起動しています: {self.path}')
+        finally:
+            probe.close()
+
+    def serve_forever(self):
+        """ソケットを作成して接続を待ち受ける（stop() が呼ばれるまで戻らない）"""
+        self._remove_stale_socket()
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.path)
+        self._listener.listen(128)
+        self._listener.setblocking(False)
+        self._selector.register(self._listener, selectors.EVENT_READ)
+        self._running = True
+        try:
+            while self._running:
+                for key, mask in self._selector.select(timeout=1):
+                    if key.fileobj is self._listener:
+                        self._accept()
+                        continue
+                    connection = self._connections.get(key.fileobj)
+                    if connection and mask & selectors.EVENT_READ:
+                        self._read(connection)
+                    if connection and mask & selectors.EVENT_WRITE:
+                        self._write(connection)
+        finally:
+            for connection in list(self._connections.values()):
+                self._close(connection)
+            self._selector.unregister(self._listener)
+            self._listener.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def stop(self):
+        self._running = False
+
+    def _accept(self):
+        try:
+            sock, _ = self._listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        connection = _Connection(sock)
+        self._connections[sock] = connection
+        self._selector.register(sock, selectors.EVENT_READ)
+
+    def _close(self, connection):
+        if self._connections.pop(connection.sock, None) is None:
+            return
+        self._selector.unregister(connection.sock)
+        connection.sock.close()
+
+    def _read(self, connection):
+        try:
+            data = connection.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(connection)
+            return
+
+        connection.inbuf += data
+        while True:
+            end = connection.inbuf.find(b'\n')
+            if end < 0:
+                break
+            line = bytes(connection.inbuf[:end + 1])
+            del connection.inbuf[:end + 1]
+            self._broadcast(line, connection)
+        if len(connection.inbuf) > self.max_line:
+            self._close(connection)
+
+    def _broadcast(self, line, sender):
+        for connection in list(self._connections.values()):
+            if connection is sender:
+                continue
+            was_empty = not connection.outbuf
+            connection.outbuf += line
+            if len(connection.outbuf) > self.max_buffer:
+                self._close(connection)
+            elif was_empty:
+                self._selector.modify(connection.sock, selectors.EVENT_READ | selectors.EVENT_WRITE)
+
+    def _write(self, connection):
+        try:
+            sent = connection.sock.send(connection.outbuf)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._close(connection)
+            return
+        del connection.outbuf[:sent]
+        if not connection.outbuf:
+            self._selector.modify(connection.sock, selectors.EVENT_READ)
@@ -0,0 +1,85 @@
+"""Socket.IOの通信の圧縮
+
+new_message などのイベントは content と raw_content、アバターの色、書式付きの日時など
+同じキーと似た値を毎回送るため、圧縮すると通信量を大きく減らせる。
+
+- long-polling: Engine.IO の HTTP 圧縮（gzip/deflate）を使う。閾値未満の応答は圧縮しない
+- WebSocket: クライアントが permessage-deflate を提示した場合に使用する。eventlet の実装は
+  全てのメッセージを圧縮するため、閾値未満のメッセージ（ping・ack・入力中表示など）は圧縮せずに送る（RFC 7692 ではメッセージごとに圧縮の有無を選べる）
+
+閾値の判定と permessage-deflate の提示の拒否は eventlet で動かす場合（本番）だけ行う。
+開発用サーバー（threading）の WebSocket は simple-websocket の設定のまま全てのメッセージを圧縮する。
+どちらも eventlet・python-engineio の内部のメソッドを置き換えるため、バージョンの更新で
+それらが見つからない場合は警告を記録し、置き換えずに eventlet の標準の動作（全て圧縮）で動かす。
+"""
+
+
+def configure_compression(server, enabled, threshold):
+    """Engine.IO のサーバーに圧縮の設定（有効か、圧縮する最小のバイト数）を適用する
+
+    enabled が False の場合は long-polling・WebSocket とも圧縮しない。
+    """
+    eio = server.eio
+    eio.http_compression = enabled
+    eio.compression_threshold = threshold
+    if eio.async_mode != 'eventlet':
+        return
+    drivers = getattr(eio, '_async', None)
+    websocket = _threshold_websocket(enabled, threshold)
+    if websocket is None or not isinstance(drivers, dict) or 'websocket' not in drivers:
+        server.logger.warning('eventlet・python-engineio の内部が想定と異なるため、WebSocketの圧縮の設定を適用できません'
+                              '（permessage-deflate を提示したクライアントには全てのメッセージを圧縮して送ります）')
+        return
+    # ドライバーの設定はモジュール共通の辞書のため、このサーバーの分だけを差し替える
+    eio._async = dict(drivers, websocket=websocket)
+
+
+# 置き換える eventlet・python-engineio の内部のメソッド
+_WEBSOCKET_METHODS = ('_pack_message', '_get_permessage_deflate_enc')
+_WEBSOCKET_WSGI_METHODS = ('_negotiate_permessage_deflate', '_handle_hybi_request')
+
+
+def _threshold_websocket(deflate, threshold):
+    """permessage-deflate の使用と閾値を設定した eventlet の WebSocket のクラスを返す
+
+    置き換えるメソッドが見つからない場合は None を返す。
+    """
+    from eventlet.websocket import RFC6455WebSocket
+    from engineio.async_drivers.eventlet import WebSocketWSGI
+    if not all(callable(getattr(RFC6455WebSocket, name, None)) for name in _WEBSOCKET_METHODS) \
+            or not all(callable(getattr(WebSocketWSGI, name, None)) for name in _WEBSOCKET_WSGI_METHODS):
+        return None
+
+    class ThresholdDeflateWebSocket(RFC6455WebSocket):
+        def _get_permessage_deflate_enc(self):
+            if self._skip_deflate:
+                return None
+            return super()._get_permessage_deflate_enc()
+
+        def _pack_message(self, message, *args, **kwargs):
+            # 圧縮しないメッセージでは圧縮の状態（コンテキスト）を進めない
+            size = len(message.encode('utf-8')) if isinstance(message, str) else len(message)
+            self._skip_deflate = size < threshold
+            try:
+                return super()._pack_message(message, *args, **kwargs)
+            finally:
+                self._skip_deflate = False
+
+    class ThresholdDeflateWebSocketWSGI(WebSocketWSGI):
+        def _negotiate_permessage_deflate(self, extensions):
+            if not deflate:
+                return None
+            return super()._negotiate_permessage_deflate(extensions)
+
+        def _handle_hybi_request(self, environ):
+            return self.wrap(super()._handle_hybi_request(environ))
+
+        @staticmethod
+        def wrap(ws):
+            """eventlet が作成した WebSocket に閾値の判定を加える"""
+            if isinstance(ws, RFC6455WebSocket):
+                ws.__class__ = ThresholdDeflateWebSocket
+                ws._skip_deflate = False
+            return ws
+
+    return ThresholdDeflateWebSocketWSGI
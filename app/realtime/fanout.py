@@ -0,0 +1,242 @@
+"""ワーカー間のイベント配信（ファンアウト）
+
+socketio.emit は同じプロセスに接続しているクライアントにしか届かないため、複数ワーカーで
+動かす場合は python-socketio の PubSubManager を使ってワーカー間でイベントを中継する。
+
+- local: 中継しない（1ワーカー構成、デフォルト）
+- ipc: 同じマシン上のUnixソケットのブローカー（flask realtime broker）を経由する
+- postgres: PostgreSQL の LISTEN/NOTIFY を経由する
+
+中継の切断中に送られたイベントは失われるが、クライアントは再接続時の再送・差分同期で取得し直す。
+いずれの場合も、接続ごとの送信キューの上限は SendQueueManager で、参加者の多いルームへの
+送信の分割は ShardedFanoutManager で扱う。
+
+REALTIME_ROLE でプロセスの役割を分けられる（ipc・postgres の場合のみ）。
+
+- all: HTTPのリクエストとSocket.IOの接続の両方を受け付ける（デフォルト）
+- http: HTTPのリクエストだけを受け付け、イベントは中継に送るだけにする（受信はしない）
+- gateway: Socket.IOとSSEの接続だけを受け付け、中継されたイベントを配信する（gateway.py）
+"""
+import json
+import select
+import socket
+import threading
+import uuid
+from socketio import PubSubManager
+from app.realtime.send_queue import SendQueueManager
+
+FANOUT_BACKENDS = ('local', 'ipc', 'postgres')
+REALTIME_ROLES = ('all', 'http', 'gateway')
+
+
+class IPCManager(PubSubManager, SendQueueManager):
+    """Unixソケットのブローカー経由でワーカー間の配信を行う"""
+    name = 'ipc'
+
+    def __init__(self, path, channel='easychat_socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self._sock = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def _connect(self):
+        """ブローカーへの接続を返す（未接続の場合は接続する）"""
+        with self._lock:
+            if self._sock is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    sock.connect(self.path)
+                except OSError:
+                    sock.close()
+                    raise
+                self._sock = sock
+            return self._sock
+
+    def _reset(self, sock):
+        """切断された接続を破棄する（次回の送受信で接続し直す）"""
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    def _publish(self, data):
+        line = json.dumps(data).encode('utf-8') + b'\n'
+        for _ in range(2):
+            try:
+                sock = self._connect()
+            except OSError as e:
+                self._get_logger().error(f'ブローカーに接続できません: {self.path} ({e})')
+                return
+            try:
+                with self._send_lock:
+                    sock.sendall(line)
+                return
+            except OSError:
+                self._reset(sock)
+        self._get_logger().error('ブローカーへの送信に失敗しました')
+
+    def _listen(self):
+        while True:
+            try:
+                sock = self._connect()
+            except OSError:
+                self.server.sleep(1)
+                continue
+
+            buffer = b''
+            try:
+                while True:
+                    data = sock.recv(65536)
+                    if not data:
+                        break
+                    buffer += data
+                    *lines, buffer = buffer.split(b'\n')
+                    for line in lines:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+            except OSError:
+                pass
+            self._reset(sock)
+            self._get_logger().warning('ブローカーとの接続が切れたため再接続します')
+            self.server.sleep(1)
+
+
+class PostgresManager(PubSubManager, SendQueueManager):
+    """PostgreSQL の LISTEN/NOTIFY でワーカー間の配信を行う
+
+    NOTIFY のペイロードは8000バイト未満に制限されるため、大きなメッセージは分割して送り、
+    受信側で結合する。分割したものは1トランザクションで送るため、まとめて順番に届く。
+    """
+    name = 'postgres'
+
+    # 1回のNOTIFYで送る最大バイト数と、分割時の1片の文字数（UTF-8で4バイト/文字でも収まる長さ）
+    MAX_PAYLOAD_BYTES = 7900
+    CHUNK_CHARS = 1500
+    # 結合待ちにしておく分割メッセージの上限
+    MAX_PARTIAL_MESSAGES = 100
+
+    def __init__(self, url, channel='easychat_socketio', write_only=False, logger=None):
+        try:
+            import psycopg2
+        except ImportError:
+            raise RuntimeError('PostgreSQLのファンアウトには psycopg2 が必要です')
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.psycopg2 = psycopg2
+        # SQLAlchemy形式のURI（postgresql+psycopg2://）も受け付ける
+        scheme, sep, rest = url.partition('://')
+        self.url = scheme.split('+')[0] + sep + rest
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def initialize(self):
+        if self.server.async_mode == 'eventlet':
+            from eventlet.support import psycopg2_patcher
+            psycopg2_patcher.make_psycopg_green()
+        super().initialize()
+
+    def _split(self, payload):
+        if len(payload.encode('utf-8')) <= self.MAX_PAYLOAD_BYTES:
+            return [payload]
+        message_id = uuid.uuid4().hex
+        parts = [payload[i:i + self.CHUNK_CHARS] for i in range(0, len(payload), self.CHUNK_CHARS)]
+        return [f'#{message_id}:{index}:{len(parts)}:{part}' for index, part in enumerate(parts)]
+
+    def _assemble(self, payload, partial):
+        """分割されたメッセージを結合する（揃っていない場合は None）"""
+        if not payload.startswith('#'):
+            return payload
+        message_id, index, total, part = payload[1:].split(':', 3)
+        parts = partial.setdefault(message_id, {})
+        parts[int(index)] = part
+        if len(parts) < int(total):
+            while len(partial) > self.MAX_PARTIAL_MESSAGES:
+                partial.pop(next(iter(partial)))
+            return None
+        del partial[message_id]
+        return ''.join(parts[i] for i in range(int(total)))
+
+    def _publish(self, data):
+        chunks = self._split(json.dumps(data))
+        with self._lock:
+            try:
+                if self._conn is None or self._conn.closed:
+                    self._conn = self.psycopg2.connect(self.url)
+                with self._conn.cursor() as cursor:
+                    for chunk in chunks:
+                        cursor.execute('SELECT pg_notify(%s, %s)', (self.channel, chunk))
+                self._conn.commit()
+            except self.psycopg2.Error as e:
+                self._get_logger().error(f'NOTIFYの送信に失敗しました: {e}')
+                if self._conn is not None:
+                    self._conn.close()
+                self._conn = None
+
+    def _listen(self):
+        from psycopg2 import sql
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        while True:
+            conn = None
+            try:
+                conn = self.psycopg2.connect(self.url)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(sql.SQL('LISTEN {}').format(sql.Identifier(self.channel)))
+
+                partial = {}
+                while True:
+                    select.select([conn], [], [], 5)
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        payload = self._assemble(notify.payload, partial)
+                        if payload is None:
+                            continue
+                        try:
+                            yield json.loads(payload)
+                        except ValueError:
+                            continue
+            except (self.psycopg2.Error, OSError) as e:
+                self._get_logger().warning(f'LISTENの接続が切れたため再接続します: {e}')
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+            self.server.sleep(1)
+
+
+def create_client_manager(config):
+    """設定に応じたSocket.IOのクライアントマネージャーを作成する"""
+    backend = config.get('SOCKETIO_FANOUT_BACKEND', 'local')
+    channel = config.get('SOCKETIO_FANOUT_CHANNEL', 'easychat_socketio')
+    role = config.get('REALTIME_ROLE', 'all')
+    if role not in REALTIME_ROLES:
+        raise ValueError(f'不明なリアルタイム配信の役割です: {role}（{", ".join(REALTIME_ROLES)} のいずれか）')
+    if role != 'all' and backend not in ('ipc', 'postgres'):
+        raise ValueError(f'REALTIME_ROLE={role} の場合は SOCKETIO_FANOUT_BACKEND に ipc か postgres を指定してください')
+    # HTTPワーカーは接続を持たないため、中継からイベントを受信しない
+    write_only = role == 'http'
+    if backend == 'local':
+        manager = SendQueueManager()
+    elif backend == 'ipc':
+        manager = IPCManager(config['SOCKETIO_IPC_PATH'], channel=channel, write_only=write_only)
+    elif backend == 'postgres':
+        url = config.get('SOCKETIO_FANOUT_URL') or config['SQLALCHEMY_DATABASE_URI']
+        manager = PostgresManager(url, channel=channel, write_only=write_only)
+    else:
+        raise ValueError(f'不明なファンアウトバックエンドです: {backend}（{", ".join(FANOUT_BACKENDS)} のいずれか）')
+    manager.configure_send_queue(
+        config.get('SOCKETIO_SEND_QUEUE_SIZE', 256),
+        config.get('SOCKETIO_SEND_QUEUE_POLICY', 'coalesce')
+    )
+    manager.configure_fanout(
+        config.get('SOCKETIO_FANOUT_SHARD_SIZE', 500),
+        config.get('SOCKETIO_FANOUT_WORKERS', 4),
+        config.get('SOCKETIO_FANOUT_YIELD_EVERY', 50)
+    )
+    return manager
@@ -0,0 +1,170 @@
+"""Socket.IOのイベントハンドラ"""
+from flask import current_app, request, session
+from flask_socketio import ConnectionRefusedError, emit, join_room, leave_room, rooms
+import traceback
+from app import db, socketio
+from app.channel_cache import channel_cache
+from app.messaging import MessageError, validate_new_message, post_message
+from app.realtime import channel_room, user_room
+from app.realtime.admission import connect_admission
+from app.realtime.presence import presence_tracker
+from app.realtime.replay import replay_buffer
+from app.realtime.typing import typing_tracker
+
+
+def enter_channel(channel_id):
+    """チャンネルのルームに参加し、それ以外のチャンネルのルームから退出する
+
+    クライアントは一度に1つのチャンネルを開いているため、参加するルームも1つだけにする。
+    """
+    room = channel_room(channel_id)
+    for joined in rooms():
+        if joined.startswith('channel:') and joined != room:
+            leave_room(joined)
+    join_room(room)
+    presence_tracker.enter(request.sid, channel_id)
+
+
+def payload_channel_id(data):
+    """イベントのデータのチャンネルID（データが辞書でない場合やIDが文字列でない場合は None）"""
+    if not isinstance(data, dict):
+        return None
+    channel_id = data.get('channel_id')
+    return channel_id if isinstance(channel_id, str) else None
+
+
+@socketio.on('connect')
+def handle_connect(auth=None):
+    """ログイン済みの接続を個人のルームに参加させ、オンライン状態の管理に登録する
+
+    HTTP専用のワーカー（REALTIME_ROLE=http）は接続を受け付けない（ゲートウェイに接続させる）。
+    再接続が集中している場合は接続を断り、ジッターを加えた再接続までの待ち時間（retry_after）を返す。
+    """
+    if current_app.config.get('REALTIME_ROLE', 'all') == 'http':
+        return False
+    retry_after = connect_admission.admit()
+    if retry_after is not None:
+        raise ConnectionRefusedError('busy', {'retry_after': retry_after})
+    if 'user_id' in session:
+        join_room(user_room(session['user_id']))
+        presence_tracker.connect(request.sid, session['user_id'])
+        presence_tracker.start()
+
+
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    presence_tracker.disconnect(request.sid)
+
+
+@socketio.on('heartbeat')
+def handle_heartbeat(data=None):
+    """クライアントが接続中であることを記録する（応答は返さない）"""
+    if 'user_id' not in session:
+        return
+    presence_tracker.heartbeat(request.sid, session['user_id'], payload_channel_id(data))
+
+
+@socketio.on('typing_start')
+def handle_typing_start(data=None):
+    """入力中であることを記録する（同じチャンネルへの通知は一定間隔でまとめて送る）"""
+    if 'user_id' not in session:
+        return
+    channel_id = payload_channel_id(data)
+    if not channel_id or channel_cache.get_or_load(channel_id) is None:
+        return
+    typing_tracker.start_typing(channel_id, session['user_id'], session.get('username'))
+    typing_tracker.start()
+
+
+@socketio.on('typing_stop')
+def handle_typing_stop(data=None):
+    if 'user_id' not in session:
+        return
+    channel_id = payload_channel_id(data)
+    if channel_id:
+        typing_tracker.stop_typing(channel_id, session['user_id'])
+
+
+@socketio.on('join_channel')
+def handle_join_channel(data):
+    """開いているチャンネルのイベントを受け取れるようにする"""
+    if 'user_id' not in session:
+        return {'status': 'error', 'message': 'ログインが必要です'}
+
+    channel_id = payload_channel_id(data)
+    if not channel_id or channel_cache.get_or_load(channel_id) is None:
+        return {'status': 'error', 'message': 'チャンネルが見つかりません'}
+
+    enter_channel(channel_id)
+    return {'status': 'joined', 'online': presence_tracker.online_users(channel_id)}
+
+
+@socketio.on('leave_channel')
+def handle_leave_channel(data):
+    """チャンネルのイベントの受信をやめる"""
+    channel_id = payload_channel_id(data)
+    if channel_id:
+        leave_room(channel_room(channel_id))
+        presence_tracker.leave(request.sid, channel_id)
+    return {'status': 'left'}
+
+
+@socketio.on('resume')
+def handle_resume(data):
+    """再接続したクライアントに取りこぼしたイベントを再送する
+
+    再接続ではルームの参加状態が失われるため、先にチャンネルのルームに参加し直す。
+    バッファから消えた範囲を含む場合は再同期（差分同期API）を求める。
+    """
+    if 'user_id' not in session:
+        return {'status': 'error', 'message': 'ログインが必要です'}
+
+    data = data if isinstance(data, dict) else {}
+    channel_id = payload_channel_id(data)
+    try:
+        last_seq = int(data.get('last_seq'))
+    except (TypeError, ValueError):
+        return {'status': 'error', 'message': 'last_seqが不正です'}
+
+    if not channel_id or channel_cache.get_or_load(channel_id) is None:
+        return {'status': 'error', 'message': 'チャンネルが見つかりません'}
+    enter_channel(channel_id)
+
+    online = presence_tracker.online_users(channel_id)
+    events = replay_buffer.since(channel_id, last_seq)
+    if events is None:
+        return {'status': 'resync', 'online': online}
+
+    for seq, event, payload in events:
+        emit(event, payload)
+    return {'status': 'replayed', 'count': len(events), 'online': online}
+
+
+@socketio.on('send_message')
+def handle_send_message(data):
+    """テキストメッセージを送信し、ackで保存したメッセージを返す
+
+    /chat/send と同じ検証・保存の処理を通り、他のクライアントへの配信もアウトボックス経由で行う。
+    client_message_id を付けて再送した場合は保存済みのメッセージを返す。
+    画像付きのメッセージはHTTPで送信する。
+    """
+    if 'user_id' not in session:
+        return {'status': 'error', 'message': 'ログインが必要です'}
+
+    data = data if isinstance(data, dict) else {}
+    channel_id = payload_channel_id(data)
+    content = data.get('message')
+    content = content.strip() if isinstance(content, str) else ''
+    client_message_id = data.get('client_message_id')
+    try:
+        validate_new_message(channel_id, content, client_message_id=client_message_id)
+        message = post_message(session['user_id'], channel_id, content, client_message_id=client_message_id)
+    except MessageError as e:
+        return {'status': 'error', 'message': str(e)}
+    except Exception as e:
+        db.session.rollback()
+        print(f"メッセージ送信エラー: {str(e)}")
+        traceback.print_exc()
+        return {'status': 'error', 'message': 'メッセージの送信に失敗しました'}
+
+    return {'status': 'success', 'data': message}
@@ -0,0 +1,99 @@
+"""HTTPのlong-pollingによるチャンネルのイベント取得
+
+WebSocket も Engine.IO の long-polling も通らないプロキシの内側にいるクライアント向けに、
+/chat/channels/<id>/poll?since=<連番> で新しいイベントが届くまでリクエストを待たせる。
+
+待機中のリクエストはチャンネルごとに1つの待機用イベント（ワーカーの非同期モードに合った Event）を
+共有し、キューやタイマーを持たない。連番付きのイベントが送信されると待機用イベントを新しいものに
+差し替えてから古いものをセットするため、待機中の全てのリクエストが1回で起こされる。
+返すイベントは再送用バッファから読むため、SSE と同じく他のワーカーから中継されたイベントも届く。
+"""
+import threading
+import time
+from app import socketio
+from app.metrics import metrics
+from app.realtime import channel_id_from_room
+from app.realtime.replay import replay_buffer
+
+
+class _Waiters:
+    """チャンネルの待機用イベントと、それを待っているリクエストの数"""
+
+    def __init__(self, event):
+        self.event = event
+        self.count = 0
+
+
+class ChannelWaiters:
+    """チャンネルごとに新しいイベントを待つリクエストを管理する"""
+
+    def __init__(self):
+        # チャンネルID -> _Waiters
+        self._waiters = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, channel_id):
+        with self._lock:
+            waiters = self._waiters.get(channel_id)
+            if waiters is None:
+                waiters = _Waiters(socketio.server.eio.create_event())
+                self._waiters[channel_id] = waiters
+            waiters.count += 1
+            return waiters
+
+    def _release(self, channel_id, waiters):
+        with self._lock:
+            waiters.count -= 1
+            if waiters.count <= 0 and self._waiters.get(channel_id) is waiters:
+                del self._waiters[channel_id]
+
+    def notify(self, event, payload, room):
+        """ルームに送信された連番付きのイベントで、そのチャンネルを待っているリクエストを起こす
+
+        再送用バッファへの記録（record_channel_event）の後に呼ばれるように登録する。
+        """
+        channel_id = channel_id_from_room(room)
+        if channel_id is None or not isinstance(payload, dict) or payload.get('seq') is None:
+            return
+        with self._lock:
+            waiters = self._waiters.pop(channel_id, None)
+        if waiters is not None:
+            waiters.event.set()
+
+    def poll(self, channel_id, since, timeout, latest_seq):
+        """since より後のイベントを (連番, イベント名, データ) のリストで返す
+
+        まだない場合は最大 timeout 秒待ち、届かなければ空のリストを返す。再送用バッファから消えた
+        範囲を含む場合は None を返し、差分同期APIでの取得を促す。バッファが空の場合（ワーカーの
+        起動直後や静かなチャンネル）だけ latest_seq() でチャンネルの現在の連番を確認する。
+        """
+        deadline = time.monotonic() + timeout
+        waiters = self._acquire(channel_id)
+        try:
+            # 待機用イベントを取得してからバッファを読むため、その間に届いたイベントも取りこぼさない
+            events = replay_buffer.since(channel_id, since)
+            if events is None:
+                if not replay_buffer.is_empty(channel_id) or since < latest_seq():
+                    return None
+            while not events:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not waiters.event.wait(remaining):
+                    return []
+                self._release(channel_id, waiters)
+                waiters = self._acquire(channel_id)
+                events = replay_buffer.since(channel_id, since)
+                if events is None:
+                    # バッファを作り直した後のイベントで、since との間に欠けがある
+                    return None
+            return events
+        finally:
+            self._release(channel_id, waiters)
+
+    def waiting_count(self):
+        with self._lock:
+            return sum(waiters.count for waiters in self._waiters.values())
+
+
+channel_waiters = ChannelWaiters()
+
+metrics.register('longpoll_waiters', channel_waiters.waiting_count)
@@ -0,0 +1,390 @@
+"""オンライン状態（プレゼンス）の管理
+
+Socket.IOの接続・切断とクライアントからのハートビートをもとに、ユーザーごとの接続数と
+最後にハートビートを受け取った時刻をメモリ上に保持する（ハートビートごとのDB書き込みはしない）。
+
+- 切断イベントが届かなかった接続（ワーカーの異常やネットワーク断）は、一定時間ハートビートが
+  なければタイマーホイールで期限切れにする。ハートビートは所属するスロットを移すだけなので、
+  接続数が多くても1回あたりの処理は一定になる
+- チャンネルを開いている接続のユーザーを、そのチャンネルのルームのオンラインユーザーとする
+- 変化（オンライン/オフライン）だけを一定間隔でまとめ、ルームごとに1回の presence_update で送信する。
+  間隔内に戻った変化（再接続など）は送信しない
+
+接続の状態はワーカーごとに保持し、チャンネルごとのオンラインユーザーだけを presence_sync イベントで
+他のワーカーと共有する（中継用のルームに送るため、クライアントには届かない）。他のワーカーに同じ
+ユーザーの接続が残っている間はオフラインを送らず、そのワーカーで接続がなくなった時点で送る。
+共有した状態は一定間隔で全体を送り直し、期限までに届かなくなったワーカーの分は破棄する。
+"""
+import math
+import threading
+import time
+import uuid
+from app import socketio
+from app.metrics import metrics
+from app.realtime import publish_channel_event
+
+# 他のワーカーとオンラインユーザーを共有するイベントと、それを中継するルーム（クライアントは参加しない）
+PRESENCE_SYNC_EVENT = 'presence_sync'
+PRESENCE_SYNC_ROOM = 'presence:sync'
+
+
+class _UserPresence:
+    """ユーザーごとの接続と最後のハートビート"""
+    __slots__ = ('sids', 'last_seen', 'slot')
+
+    def __init__(self, now):
+        self.sids = set()
+        self.last_seen = now
+        self.slot = None
+
+
+class _RemoteWorker:
+    """他のワーカーのチャンネルごとのオンラインユーザーと、最後に共有を受け取った時刻"""
+    __slots__ = ('channels', 'seen')
+
+    def __init__(self):
+        # チャンネルID -> {ユーザーID}
+        self.channels = {}
+        self.seen = None
+
+
+class PresenceTracker:
+    """接続ごとの開いているチャンネルとユーザーごとのオンライン状態を管理する"""
+
+    def __init__(self, timeout=90, tick=1.0):
+        self._lock = threading.Lock()
+        self._started = False
+        self.worker_id = uuid.uuid4().hex
+        self.configure(timeout, tick)
+
+    def configure(self, timeout, tick):
+        """ハートビートの期限（秒）と期限切れの確認・変化の送信の間隔（秒）を設定し、状態を破棄する"""
+        with self._lock:
+            self.timeout = timeout
+            self.tick_interval = tick
+            # sid -> [ユーザーID, 開いているチャンネルID]
+            self._connections = {}
+            # ユーザーID -> _UserPresence
+            self._users = {}
+            # チャンネルID -> {ユーザーID: 接続数}
+            self._rooms = {}
+            # 送信待ちの変化（チャンネルID -> {ユーザーID: 前回送信時にオンラインだったか}）
+            self._changes = {}
+            # タイマーホイール（1周で期限の時間になるようスロット数を決める）
+            self._wheel = [set() for _ in range(math.ceil(timeout / tick) + 1)]
+            self._cursor = 0
+            # 他のワーカーの状態（ワーカーID -> _RemoteWorker）と、全体を送り直す間隔（秒）
+            self._remote = {}
+            self.sync_interval = max(timeout / 3, tick)
+            self._synced_at = None
+            # 他のワーカーに送っていない変化のあったチャンネル
+            self._dirty = set()
+            # 他のワーカーに接続が残っているためオフラインを送らなかった (チャンネルID, ユーザーID)
+            self._suppressed = set()
+            # このワーカーがオフラインを送ったユーザー（チャンネルID -> {ユーザーID}、次の共有で知らせる）
+            self._announced = {}
+
+    def connect(self, sid, user_id, now=None):
+        """ログイン済みの接続を登録する"""
+        with self._lock:
+            self._track(sid, user_id, now)
+
+    def enter(self, sid, channel_id):
+        """接続が開いているチャンネルを変更する"""
+        with self._lock:
+            connection = self._connections.get(sid)
+            if connection is None or connection[1] == channel_id:
+                return
+            if connection[1] is not None:
+                self._room_remove(connection[1], connection[0])
+            connection[1] = channel_id
+            self._room_add(channel_id, connection[0])
+
+    def leave(self, sid, channel_id):
+        """接続がチャンネルを閉じたことを記録する"""
+        with self._lock:
+            connection = self._connections.get(sid)
+            if connection is None or connection[1] != channel_id:
+                return
+            connection[1] = None
+            self._room_remove(channel_id, connection[0])
+
+    def disconnect(self, sid):
+        """切断された接続を削除する"""
+        with self._lock:
+            connection = self._connections.pop(sid, None)
+            if connection is None:
+                return
+            user_id, channel_id = connection
+            if channel_id is not None:
+                self._room_remove(channel_id, user_id)
+            presence = self._users.get(user_id)
+            if presence is not None:
+                presence.sids.discard(sid)
+                if not presence.sids:
+                    self._remove_user(user_id)
+
+    def heartbeat(self, sid, user_id, channel_id=None, now=None):
+        """クライアントからのハートビートを記録する
+
+        期限切れで削除した接続からのハートビートの場合は登録し直す。
+        """
+        with self._lock:
+            if sid not in self._connections:
+                self._track(sid, user_id, now)
+                if channel_id is not None:
+                    self._connections[sid][1] = channel_id
+                    self._room_add(channel_id, user_id)
+                return
+            owner = self._connections[sid][0]
+            presence = self._users[owner]
+            presence.last_seen = time.monotonic() if now is None else now
+            self._schedule(owner, presence)
+
+    def online_users(self, channel_id, now=None):
+        """チャンネルを開いているユーザーのID（他のワーカーに接続しているユーザーを含む）"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            users = set(self._rooms.get(channel_id, ()))
+            for remote in self._live_remotes(now):
+                users.update(remote.channels.get(channel_id, ()))
+            return sorted(users)
+
+    def is_online(self, user_id):
+        with self._lock:
+            return user_id in self._users
+
+    def tick(self, now=None):
+        """タイマーホイールを1つ進め、期限までハートビートのなかったユーザーを削除する"""
+        now = time.monotonic() if now is None else now
+        expired = 0
+        with self._lock:
+            self._cursor = (self._cursor + 1) % len(self._wheel)
+            due, self._wheel[self._cursor] = self._wheel[self._cursor], set()
+            for user_id in due:
+                presence = self._users.get(user_id)
+                if presence is None:
+                    continue
+                presence.slot = None
+                if now - presence.last_seen < self.timeout:
+                    # 期限より前に1周した場合（ティックの遅れなど）は入れ直す
+                    self._schedule(user_id, presence)
+                    continue
+                for sid in presence.sids:
+                    channel_id = self._connections.pop(sid)[1]
+                    if channel_id is not None:
+                        self._room_remove(channel_id, user_id)
+                self._remove_user(user_id)
+                expired += 1
+            self._expire_remotes(now)
+        if expired:
+            metrics.increment('presence_expired_total', expired)
+        return expired
+
+    def take_changes(self, now=None):
+        """前回から変化したユーザーをチャンネルごとに返す（{チャンネルID: {'online': [...], 'offline': [...]}}）
+
+        このワーカーで接続がなくなっても、他のワーカーに接続が残っているユーザーはオフラインにしない。
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            changes, self._changes = self._changes, {}
+            self._dirty.update(changes)
+            result = {}
+            for channel_id, users in changes.items():
+                present = self._rooms.get(channel_id, {})
+                online = sorted(user_id for user_id, was_online in users.items()
+                                if not was_online and user_id in present)
+                offline = []
+                for user_id in sorted(users):
+                    if not users[user_id] or user_id in present:
+                        continue
+                    if self._remote_has(channel_id, user_id, now):
+                        self._suppressed.add((channel_id, user_id))
+                    else:
+                        offline.append(user_id)
+                for user_id in online:
+                    self._suppressed.discard((channel_id, user_id))
+                if offline:
+                    self._announced.setdefault(channel_id, set()).update(offline)
+                if online or offline:
+                    result[channel_id] = {'online': online, 'offline': offline}
+            return result
+
+    def sync_payload(self, now=None):
+        """他のワーカーに送る presence_sync のデータ（送るものがない場合は None）
+
+        sync_interval ごとに全てのチャンネルを送り（他のワーカーでの期限の延長も兼ねる）、
+        それ以外は変化のあったチャンネルだけを送る。このワーカーがオフラインを送ったユーザーも知らせ、
+        他のワーカーが同じユーザーのオフラインを重ねて送らないようにする。
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._synced_at is None or now - self._synced_at >= self.sync_interval:
+                self._synced_at = now
+                self._dirty.clear()
+                channels = self._rooms
+                full = True
+            elif self._dirty:
+                channels = {channel_id: self._rooms.get(channel_id, ()) for channel_id in self._dirty}
+                self._dirty = set()
+                full = False
+            else:
+                return None
+            announced, self._announced = self._announced, {}
+            return {
+                'worker': self.worker_id,
+                'full': full,
+                'channels': {channel_id: sorted(users) for channel_id, users in channels.items()},
+                'offline': {channel_id: sorted(users) for channel_id, users in announced.items()},
+            }
+
+    def receive_sync(self, event, payload, room, now=None):
+        """他のワーカーから中継された presence_sync を取り込む（クライアントマネージャーのリスナー）"""
+        if event != PRESENCE_SYNC_EVENT or not isinstance(payload, dict) or payload.get('worker') == self.worker_id:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            remote = self._remote.get(payload['worker'])
+            if remote is None:
+                remote = self._remote[payload['worker']] = _RemoteWorker()
+            if payload.get('full'):
+                # 全体が送られてきた場合、含まれないチャンネルにはオンラインのユーザーがいない
+                for channel_id, users in remote.channels.items():
+                    if channel_id not in payload['channels']:
+                        self._suppress_absent(channel_id, users)
+                remote.channels = {}
+            for channel_id, users in payload['channels'].items():
+                if users:
+                    remote.channels[channel_id] = set(users)
+                else:
+                    remote.channels.pop(channel_id, None)
+            remote.seen = now
+            # 送信元のワーカーがオフラインを送ったユーザーは、このワーカーから送る必要がない
+            for channel_id, users in payload.get('offline', {}).items():
+                self._suppressed.difference_update((channel_id, user_id) for user_id in users)
+            self._release_suppressed(now)
+
+    def flush(self, now=None):
+        """変化をルームごとにまとめて送信し、他のワーカーにオンラインユーザーを共有する"""
+        changes = self.take_changes(now)
+        payload = self.sync_payload(now)
+        if payload is not None:
+            socketio.emit(PRESENCE_SYNC_EVENT, payload, to=PRESENCE_SYNC_ROOM)
+        for channel_id, change in changes.items():
+            publish_channel_event('presence_update', dict(change, channel_id=channel_id), channel_id)
+        return len(changes)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._users),
+                'connections': len(self._connections),
+                'channels': len(self._rooms),
+                'remote_workers': len(self._remote),
+            }
+
+    def connection_count(self, user_id):
+        with self._lock:
+            presence = self._users.get(user_id)
+            return len(presence.sids) if presence else 0
+
+    def start(self):
+        """期限切れの確認と変化の送信をバックグラウンドで開始する（起動済みの場合は何もしない）"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.tick_interval)
+            try:
+                self.tick()
+                self.flush()
+            except Exception as e:
+                print(f"プレゼンスの更新エラー: {str(e)}")
+
+    # 以下はロックを取得して呼び出す
+
+    def _track(self, sid, user_id, now):
+        if sid in self._connections:
+            return
+        self._connections[sid] = [user_id, None]
+        presence = self._users.get(user_id)
+        if presence is None:
+            presence = self._users[user_id] = _UserPresence(time.monotonic() if now is None else now)
+        presence.sids.add(sid)
+        presence.last_seen = time.monotonic() if now is None else now
+        self._schedule(user_id, presence)
+
+    def _schedule(self, user_id, presence):
+        # 現在のスロットの1つ手前（1周後に確認される位置）に移す
+        slot = (self._cursor - 1) % len(self._wheel)
+        if presence.slot == slot:
+            return
+        if presence.slot is not None:
+            self._wheel[presence.slot].discard(user_id)
+        self._wheel[slot].add(user_id)
+        presence.slot = slot
+
+    def _remove_user(self, user_id):
+        presence = self._users.pop(user_id)
+        if presence.slot is not None:
+            self._wheel[presence.slot].discard(user_id)
+
+    def _live_remotes(self, now):
+        return [remote for remote in self._remote.values() if now - remote.seen <= self.timeout]
+
+    def _remote_has(self, channel_id, user_id, now):
+        return any(user_id in remote.channels.get(channel_id, ()) for remote in self._live_remotes(now))
+
+    def _suppress_absent(self, channel_id, users):
+        """他のワーカーで消えたユーザーのうち、このワーカーに接続のないものを確認の対象にする"""
+        present = self._rooms.get(channel_id, {})
+        self._suppressed.update((channel_id, user_id) for user_id in users if user_id not in present)
+
+    def _release_suppressed(self, now):
+        """オフラインを送らなかったユーザーのうち、どのワーカーにも接続がなくなったものの変化を記録する"""
+        for channel_id, user_id in list(self._suppressed):
+            if user_id in self._rooms.get(channel_id, {}):
+                self._suppressed.discard((channel_id, user_id))
+            elif not self._remote_has(channel_id, user_id, now):
+                self._suppressed.discard((channel_id, user_id))
+                self._changes.setdefault(channel_id, {}).setdefault(user_id, True)
+
+    def _expire_remotes(self, now):
+        """期限まで共有が届かなかったワーカー（停止・異常終了）の状態を破棄する
+
+        そのワーカーにだけ接続していたユーザーは、残っている全てのワーカーがオフラインを送る。
+        """
+        for worker_id, remote in list(self._remote.items()):
+            if now - remote.seen <= self.timeout:
+                continue
+            del self._remote[worker_id]
+            for channel_id, users in remote.channels.items():
+                self._suppress_absent(channel_id, users)
+        self._release_suppressed(now)
+
+    def _room_add(self, channel_id, user_id):
+        users = self._rooms.setdefault(channel_id, {})
+        if user_id not in users:
+            self._changes.setdefault(channel_id, {}).setdefault(user_id, False)
+        users[user_id] = users.get(user_id, 0) + 1
+
+    def _room_remove(self, channel_id, user_id):
+        users = self._rooms.get(channel_id)
+        if not users or user_id not in users:
+            return
+        users[user_id] -= 1
+        if users[user_id] <= 0:
+            del users[user_id]
+            self._changes.setdefault(channel_id, {}).setdefault(user_id, True)
+            if not users:
+                del self._rooms[channel_id]
+
+
+presence_tracker = PresenceTracker()
+
+metrics.register('presence', presence_tracker.stats)
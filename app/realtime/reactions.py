@@ -0,0 +1,73 @@
+"""リアクション更新の配信
+
+連打などで同じメッセージのリアクションが短時間に何度も切り替えられても、
+一定時間（window）内の変更を1回の update_reactions イベントにまとめて送信する。
+送信時点のカウンターを読み込むため、イベントには最終的なリアクション数が含まれ、
+配信コストはクリック数ではなくメッセージ数に比例する。
+"""
+import threading
+from flask import current_app
+from app import db, socketio
+from app.reaction_counts import load_reaction_counts
+from app.realtime import publish_channel_event
+
+
+class ReactionBroadcaster:
+    """メッセージごとにリアクション更新の送信をまとめる"""
+
+    def __init__(self, window=0.1):
+        # まとめる時間（秒、0以下で即時送信）
+        self.window = window
+        # 送信待ちのメッセージID -> チャンネルID
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def configure(self, window):
+        """まとめる時間を設定して送信待ちを破棄する"""
+        with self._lock:
+            self.window = window
+            self._pending.clear()
+
+    def schedule(self, message_id, channel_id):
+        """リアクションの変更を通知する（コミット後に呼び出す）
+
+        同じメッセージの送信が既に予約されている場合は何もしない。
+        """
+        with self._lock:
+            if message_id in self._pending:
+                return
+            self._pending[message_id] = channel_id
+
+        app = current_app._get_current_object()
+        if self.window <= 0:
+            self.flush(app, message_id)
+        else:
+            socketio.start_background_task(self._flush_later, app, message_id)
+
+    def _flush_later(self, app, message_id):
+        socketio.sleep(self.window)
+        self.flush(app, message_id)
+
+    def flush(self, app, message_id):
+        """送信待ちのメッセージの現在のリアクション数を送信する"""
+        # 読み込み前に予約を外し、読み込み中にコミットされた変更は次の送信に回す
+        with self._lock:
+            channel_id = self._pending.pop(message_id, None)
+        if channel_id is None:
+            return
+
+        with app.app_context():
+            try:
+                reactions = load_reaction_counts([message_id])[message_id]
+            except Exception as e:
+                db.session.rollback()
+                print(f"リアクション数の取得エラー: {str(e)}")
+                return
+            publish_channel_event('update_reactions', {
+                'message_id': message_id,
+                'channel_id': channel_id,
+                'reactions': reactions
+            }, channel_id)
+
+
+reaction_broadcaster = ReactionBroadcaster()
@@ -0,0 +1,73 @@
+"""再接続時のイベント再送用リングバッファ
+
+チャンネルごとに直近に送信したイベントを連番付きで保持し、短い切断から復帰した
+クライアントには取りこぼした分だけをメモリから再送する。
+"""
+import threading
+from collections import OrderedDict, deque
+
+
+class ReplayBuffer:
+    """チャンネルごとの直近イベントを保持する上限付きバッファ"""
+
+    def __init__(self, capacity=256, max_channels=1024):
+        self.capacity = capacity
+        self.max_channels = max_channels
+        self._channels = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, capacity, max_channels):
+        """バッファサイズを設定して内容を破棄する"""
+        with self._lock:
+            self.capacity = capacity
+            self.max_channels = max_channels
+            self._channels.clear()
+
+    def append(self, channel_id, seq, event, payload):
+        """送信したイベントを記録する
+
+        連番が連続しない場合（取りこぼしがある場合）はバッファを作り直し、
+        再送される範囲が常に欠けのない連続したものになるようにする。
+        """
+        with self._lock:
+            events = self._channels.get(channel_id)
+            if events is None:
+                events = deque(maxlen=self.capacity)
+                self._channels[channel_id] = events
+            elif events:
+                latest_seq = events[-1][0]
+                if seq <= latest_seq:
+                    # 記録済みのイベント（重複）
+                    return
+                if seq != latest_seq + 1:
+                    events.clear()
+            events.append((seq, event, payload))
+            self._channels.move_to_end(channel_id)
+            # 古いチャンネルから破棄してチャンネル数の上限を守る
+            while len(self._channels) > self.max_channels:
+                self._channels.popitem(last=False)
+
+    def since(self, channel_id, last_seq):
+        """last_seq より後のイベントを返す
+
+        バッファから消えた範囲を含む場合は None を返し、全体の再同期を促す。
+        """
+        with self._lock:
+            events = self._channels.get(channel_id)
+            if not events:
+                return None
+            oldest_seq = events[0][0]
+            latest_seq = events[-1][0]
+            if last_seq > latest_seq:
+                return None
+            if last_seq < oldest_seq - 1:
+                return None
+            return [entry for entry in events if entry[0] > last_seq]
+
+    def is_empty(self, channel_id):
+        """チャンネルのイベントを1つも保持していないか"""
+        with self._lock:
+            return not self._channels.get(channel_id)
+
+
+replay_buffer = ReplayBuffer()
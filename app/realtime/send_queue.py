@@ -0,0 +1,257 @@
+"""接続ごとの送信キューの上限と遅いクライアントの扱い
+
+Engine.IO は接続ごとの送信キューに上限を持たないため、受信が追いつかないクライアント
+（回線の遅いモバイル端末など）がいると、送信待ちのイベントが際限なく溜まってメモリを圧迫する。
+ここでは送信キューが上限に達した接続へのイベントを、設定した方針に従って扱う。
+
+- coalesce: 送信待ちとして保持し、同じメッセージのリアクション更新・編集は最新のものだけを残す。
+  キューが空いたら順番に送信する。保持しきれなくなった場合は resync と同じ扱いにする
+- resync: イベントを破棄し、キューが空いたら resync_required を送って差分同期を求める
+- disconnect: 接続を切断する（クライアントは再接続時の再送・差分同期で取得し直す）
+
+一度破棄を始めた接続には、resync_required を送るまで以降のイベントも送らない
+（新しいイベントだけ届くと、クライアントの連番が進んで破棄した分を取得できなくなるため）。
+"""
+import itertools
+import threading
+from collections import OrderedDict
+from app import socketio
+from app.metrics import metrics
+from app.realtime.shards import ShardedFanoutManager
+
+SEND_QUEUE_POLICIES = ('coalesce', 'resync', 'disconnect')
+
+# 最新のものだけを送ればよいイベントと、同じ対象かを判定するペイロードのキー
+COALESCE_KEYS = {
+    'update_reactions': 'message_id',
+    'message_edited': 'message_id',
+}
+
+
+class _Overflow:
+    """送信キューがあふれた接続の状態"""
+
+    def __init__(self, eio_sid, namespace):
+        self.eio_sid = eio_sid
+        self.namespace = namespace
+        # 送信待ちのイベント（キー -> (イベント名, データ)）
+        self.pending = OrderedDict()
+        # イベントを破棄したため、キューが空いたら resync_required を送る
+        self.resync = False
+
+
+class SendQueueManager(ShardedFanoutManager):
+    """送信キューの上限を超えた接続へのイベントを方針に従って扱うクライアントマネージャー
+
+    PubSubManager と組み合わせる場合は PubSubManager より後に継承する
+    （他のワーカーから中継されたイベントも、この接続ごとの確認を通るようにするため）。
+    """
+
+    # 送信待ちのイベントを確認する間隔（秒）
+    DRAIN_INTERVAL = 0.1
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 接続ごとの送信キューの上限（0以下で無制限）
+        self.max_queue = 0
+        self.policy = 'coalesce'
+        # sid -> _Overflow
+        self._overflow = {}
+        # sid -> 破棄したイベント数
+        self._dropped = {}
+        self._keys = itertools.count()
+        # 送信中に切断の処理が呼ばれることがあるため再入可能にする
+        self._lock = threading.RLock()
+        self._drain_started = False
+        # ルームへの送信を受け取る関数（Socket.IO以外の配信経路用）
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """このワーカーで送信される全てのイベントを listener(event, data, room) で受け取る
+
+        他のワーカーから中継されたイベントも含む。
+        """
+        self._listeners.append(listener)
+
+    def configure_send_queue(self, max_queue, policy):
+        """送信キューの上限とあふれた場合の方針を設定する"""
+        if policy not in SEND_QUEUE_POLICIES:
+            raise ValueError(f'不明な送信キューの方針です: {policy}（{", ".join(SEND_QUEUE_POLICIES)} のいずれか）')
+        self.max_queue = max_queue
+        self.policy = policy
+
+    def queue_depth(self, eio_sid):
+        """接続の送信キューに溜まっているパケット数"""
+        eio_socket = self.server.eio.sockets.get(eio_sid)
+        if eio_socket is None:
+            return 0
+        return eio_socket.queue.qsize()
+
+    def emit(self, event, data, namespace=None, room=None, skip_sid=None,
+             callback=None, to=None, **kwargs):
+        # 固定している python-socketio の Manager.emit は to を受け取らないため、room に揃えて渡す
+        room = to or room
+        if not callback:
+            for listener in self._listeners:
+                listener(event, data, room)
+        # 分割して送信するルームは配信用スレッドが接続ごとに admit で確認する
+        if self.max_queue <= 0 or callback or namespace not in self.rooms or self.is_sharded(namespace, room):
+            return super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                callback=callback, **kwargs)
+
+        skip_sid = list(skip_sid) if isinstance(skip_sid, list) else [skip_sid]
+        to_disconnect = []
+        with self._lock:
+            for sid, eio_sid in self.get_participants(namespace, room):
+                if sid in skip_sid:
+                    continue
+                if sid not in self._overflow and self.queue_depth(eio_sid) < self.max_queue:
+                    continue
+                # 上限を超えた接続には直接送らない
+                skip_sid.append(sid)
+                if self.policy == 'disconnect':
+                    to_disconnect.append(eio_sid)
+                else:
+                    self._hold(sid, eio_sid, namespace, event, data)
+
+        super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                     callback=callback, **kwargs)
+        for eio_sid in to_disconnect:
+            self._disconnect_slow_consumer(eio_sid)
+
+    def admit(self, sid, eio_sid, namespace, event, data):
+        """サブルームの接続への送信の前に送信キューの上限を確認する"""
+        if self.max_queue <= 0:
+            return True
+        with self._lock:
+            if sid not in self._overflow and self.queue_depth(eio_sid) < self.max_queue:
+                return True
+            if self.policy != 'disconnect':
+                self._hold(sid, eio_sid, namespace, event, data)
+                return False
+        self._disconnect_slow_consumer(eio_sid)
+        return False
+
+    def _hold(self, sid, eio_sid, namespace, event, data):
+        """上限を超えた接続へのイベントを保持または破棄する（ロックを取得して呼び出す）"""
+        state = self._overflow.get(sid)
+        if state is None:
+            state = self._overflow[sid] = _Overflow(eio_sid, namespace)
+            self._start_drain()
+
+        if self.policy == 'coalesce' and not state.resync:
+            coalesce_key = COALESCE_KEYS.get(event)
+            if coalesce_key is not None and isinstance(data, dict) and data.get(coalesce_key) is not None:
+                key = (event, data[coalesce_key])
+                if key in state.pending:
+                    metrics.increment('socketio_send_queue_coalesced_total')
+                    del state.pending[key]
+            else:
+                key = next(self._keys)
+            state.pending[key] = (event, data)
+            if len(state.pending) <= self.max_queue:
+                return
+            # 保持しきれなくなった場合は破棄して再同期を求める
+            self._drop(sid, len(state.pending))
+            state.pending.clear()
+            state.resync = True
+            return
+
+        self._drop(sid, 1)
+        state.resync = True
+
+    def _drop(self, sid, count):
+        self._dropped[sid] = self._dropped.get(sid, 0) + count
+        metrics.increment('socketio_send_queue_dropped_total', count)
+
+    def _disconnect_slow_consumer(self, eio_sid):
+        """溜まった送信キューを待たずに接続を閉じる"""
+        eio_socket = self.server.eio.sockets.pop(eio_sid, None)
+        if eio_socket is None:
+            return
+        self._get_logger().warning(f'送信キューが上限に達したため切断します: {eio_sid}')
+        metrics.increment('socketio_slow_consumer_disconnects_total')
+        eio_socket.close(wait=False, abort=True)
+
+    def _start_drain(self):
+        if not self._drain_started:
+            self._drain_started = True
+            self.server.start_background_task(self._drain_loop)
+
+    def _drain_loop(self):
+        while True:
+            self.server.sleep(self.DRAIN_INTERVAL)
+            try:
+                self.drain()
+            except Exception as e:
+                self._get_logger().error(f'送信待ちのイベントの送信エラー: {e}')
+
+    def drain(self):
+        """キューが空いた接続に送信待ちのイベントを送る
+
+        上限ぎりぎりで送信と保持を繰り返さないよう、キューが上限の半分を下回ってから送る。
+        """
+        with self._lock:
+            for sid, state in list(self._overflow.items()):
+                if not self.is_connected(sid, state.namespace):
+                    del self._overflow[sid]
+                    continue
+                depth = self.queue_depth(state.eio_sid)
+                if depth >= max(self.max_queue // 2, 1):
+                    continue
+
+                if state.resync:
+                    del self._overflow[sid]
+                    metrics.increment('socketio_resync_requested_total')
+                    super().emit('resync_required', {}, state.namespace, room=sid)
+                    continue
+
+                for _ in range(self.max_queue - depth):
+                    if not state.pending:
+                        break
+                    _, (event, data) = state.pending.popitem(last=False)
+                    super().emit(event, data, state.namespace, room=sid)
+                if not state.pending:
+                    del self._overflow[sid]
+
+    def disconnect(self, sid, namespace, **kwargs):
+        with self._lock:
+            self._overflow.pop(sid, None)
+            self._dropped.pop(sid, None)
+        return super().disconnect(sid, namespace, **kwargs)
+
+    def queue_stats(self, limit=20):
+        """送信キューの状況（溜まっている接続は多い順に limit 件まで）"""
+        connections = []
+        with self._lock:
+            for eio_sid, eio_socket in list(self.server.eio.sockets.items()):
+                sid = self.sid_from_eio_sid(eio_sid, '/')
+                state = self._overflow.get(sid)
+                connections.append({
+                    'sid': sid,
+                    'depth': eio_socket.queue.qsize(),
+                    'pending': len(state.pending) if state else 0,
+                    'dropped': self._dropped.get(sid, 0),
+                })
+        busy = sorted(
+            (c for c in connections if c['depth'] or c['pending'] or c['dropped']),
+            key=lambda c: (c['depth'], c['pending']), reverse=True
+        )
+        return {
+            'connections': len(connections),
+            'max_depth': max((c['depth'] for c in connections), default=0),
+            'max_queue': self.max_queue,
+            'policy': self.policy,
+            'busy': busy[:limit],
+        }
+
+
+def send_queue_stats():
+    """/metrics 用の送信キューの状況（SendQueueManager を使っていない場合は None）"""
+    manager = socketio.server.manager if socketio.server else None
+    if not isinstance(manager, SendQueueManager):
+        return None
+    return manager.queue_stats()
+
+
+metrics.register('socketio_send_queues', send_queue_stats)
@@ -0,0 +1,192 @@
+"""大きなルームへの配信の分割（サブルーム）
+
+デフォルトチャンネル（general）のように全ユーザーが参加するルームに1回送信すると、
+数千の接続への書き込みが1つのグリーンスレッドで続き、その間は他のチャンネルの配信も止まる。
+ここでは参加者が一定数を超えたルームを固定サイズのサブルームに分け、送信を上限付きの
+配信用グリーンスレッドに任せる。
+
+- サブルームは参加・退出のたびに更新し、送信時に参加者を分割し直さない
+- 同じサブルームは常に同じ配信用スレッドが処理するため、接続ごとのイベントの順番は保たれる
+- 配信用スレッドは一定数の接続に書き込むごとに他のグリーンスレッドに処理を譲る
+- 送信するパケットはルームごとに1回だけ作成し、全てのサブルームで共有する
+
+参加者が上限以下のルームへの送信はこれまでどおりその場で行う。
+"""
+import threading
+from engineio import packet as eio_packet
+from socketio import Manager, packet
+from app import socketio
+from app.metrics import metrics
+
+
+class _RoomShards:
+    """ルームの参加者のサブルームへの割り当て"""
+
+    def __init__(self):
+        # サブルームごとの {sid: eio_sid}
+        self.shards = []
+        # sid -> サブルームの番号
+        self.index = {}
+        # 空きのあるサブルームの番号（最後のサブルームを除く）
+        self.holes = set()
+
+
+class ShardedFanoutManager(Manager):
+    """参加者の多いルームへの送信をサブルームに分けて配信用スレッドで行うクライアントマネージャー"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # サブルームの参加者数（0以下で分割しない）
+        self.shard_size = 0
+        # 配信用スレッドの数と、処理を譲るまでに書き込む接続数
+        self.fanout_workers = 4
+        self.yield_every = 50
+        # (名前空間, ルーム) -> _RoomShards
+        self._shards = {}
+        self._shards_lock = threading.Lock()
+        # 配信用スレッドごとの送信待ちのキュー
+        self._fanout_queues = None
+        self._fanout_lock = threading.Lock()
+
+    def configure_fanout(self, shard_size, workers, yield_every):
+        """サブルームの参加者数・配信用スレッドの数・処理を譲る間隔（接続数）を設定する"""
+        self.shard_size = shard_size
+        self.fanout_workers = max(workers, 1)
+        self.yield_every = max(yield_every, 1)
+
+    def basic_enter_room(self, sid, namespace, room, eio_sid=None):
+        super().basic_enter_room(sid, namespace, room, eio_sid=eio_sid)
+        if self.shard_size <= 0 or room is None or room == sid:
+            return
+        with self._shards_lock:
+            state = self._shards.setdefault((namespace, room), _RoomShards())
+            if sid in state.index:
+                return
+            if state.holes:
+                number = min(state.holes)
+            elif state.shards and len(state.shards[-1]) < self.shard_size:
+                number = len(state.shards) - 1
+            else:
+                number = len(state.shards)
+                state.shards.append({})
+            state.shards[number][sid] = self.rooms[namespace][room][sid]
+            state.index[sid] = number
+            if len(state.shards[number]) >= self.shard_size:
+                state.holes.discard(number)
+
+    def basic_leave_room(self, sid, namespace, room):
+        super().basic_leave_room(sid, namespace, room)
+        with self._shards_lock:
+            state = self._shards.get((namespace, room))
+            if state is None or sid not in state.index:
+                return
+            number = state.index.pop(sid)
+            del state.shards[number][sid]
+            # 末尾の空のサブルームは削除し、それ以外は次の参加者で埋める
+            while state.shards and not state.shards[-1]:
+                state.shards.pop()
+                state.holes.discard(len(state.shards))
+            last = len(state.shards) - 1
+            # 最後のサブルームは末尾への追加で埋まるため空きとして扱わない
+            state.holes.discard(last)
+            if number < last:
+                state.holes.add(number)
+            if not state.shards:
+                del self._shards[(namespace, room)]
+
+    def is_sharded(self, namespace, room):
+        """参加者が多く、分割して送信するルームか"""
+        if self.shard_size <= 0 or not isinstance(room, str):
+            return False
+        state = self._shards.get((namespace, room))
+        return state is not None and len(state.shards) > 1
+
+    def _snapshot(self, namespace, room):
+        """送信時点のサブルームごとの参加者（分割しないルームの場合は None）"""
+        with self._shards_lock:
+            state = self._shards.get((namespace, room))
+            if state is None or len(state.shards) < 2:
+                return None
+            return [(number, list(shard.items())) for number, shard in enumerate(state.shards)]
+
+    def emit(self, event, data, namespace, room=None, skip_sid=None,
+             callback=None, to=None, **kwargs):
+        # to は room として扱う（5.11 の Manager.emit には to がない）
+        room = to or room
+        shards = None
+        if not callback and self.is_sharded(namespace, room):
+            shards = self._snapshot(namespace, room)
+        if shards is None:
+            return super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                callback=callback, **kwargs)
+
+        if isinstance(data, tuple):
+            args = list(data)
+        elif data is not None:
+            args = [data]
+        else:
+            args = []
+        encoded = self.server.packet_class(packet.EVENT, namespace=namespace, data=[event] + args).encode()
+        if not isinstance(encoded, list):
+            encoded = [encoded]
+        eio_packets = [eio_packet.Packet(eio_packet.MESSAGE, p) for p in encoded]
+        skip_sid = set(skip_sid) if isinstance(skip_sid, list) else {skip_sid}
+
+        queues = self._start_fanout()
+        for number, participants in shards:
+            queues[number % len(queues)].put((namespace, event, data, participants, skip_sid, eio_packets))
+
+    def admit(self, sid, eio_sid, namespace, event, data):
+        """サブルームの接続に送信してよいかを返す（送信キューの上限などはサブクラスで確認する）"""
+        return True
+
+    def _start_fanout(self):
+        with self._fanout_lock:
+            if self._fanout_queues is None:
+                self._fanout_queues = [self.server.eio.create_queue() for _ in range(self.fanout_workers)]
+                for queue in self._fanout_queues:
+                    self.server.start_background_task(self._fanout_loop, queue)
+            return self._fanout_queues
+
+    def _fanout_loop(self, queue):
+        while True:
+            namespace, event, data, participants, skip_sid, eio_packets = queue.get()
+            try:
+                self._deliver(namespace, event, data, participants, skip_sid, eio_packets)
+            except Exception as e:
+                self._get_logger().error(f'サブルームへの配信エラー: {e}')
+
+    def _deliver(self, namespace, event, data, participants, skip_sid, eio_packets):
+        """サブルームの接続にパケットを書き込む（一定数ごとに処理を譲る）"""
+        for count, (sid, eio_sid) in enumerate(participants, 1):
+            if sid not in skip_sid and self.is_connected(sid, namespace) \
+                    and self.admit(sid, eio_sid, namespace, event, data):
+                for p in eio_packets:
+                    self.server._send_eio_packet(eio_sid, p)
+            if count % self.yield_every == 0:
+                self.server.sleep(0)
+
+    def fanout_stats(self):
+        """分割しているルームと送信待ちの状況"""
+        with self._shards_lock:
+            rooms = [(room, len(state.shards), len(state.index))
+                     for (_, room), state in self._shards.items() if len(state.shards) > 1]
+        queues = self._fanout_queues or []
+        return {
+            'shard_size': self.shard_size,
+            'workers': len(queues),
+            'pending': sum(queue.qsize() for queue in queues),
+            'sharded_rooms': [{'room': room, 'shards': count, 'participants': participants}
+                              for room, count, participants in sorted(rooms, key=lambda r: -r[2])[:20]],
+        }
+
+
+def fanout_stats():
+    """/metrics 用の分割配信の状況（ShardedFanoutManager を使っていない場合は None）"""
+    manager = socketio.server.manager if socketio.server else None
+    if not isinstance(manager, ShardedFanoutManager):
+        return None
+    return manager.fanout_stats()
+
+
+metrics.register('socketio_fanout', fanout_stats)
@@ -0,0 +1,139 @@
+"""Server-Sent Events によるチャンネルのイベント配信（読み取り専用）
+
+ダッシュボードやキオスク端末のように受信だけを行うクライアント向けに、Socket.IOの
+セッション（Engine.IOのハンドシェイクやping）を持たずにチャンネルのイベントを配信する。
+
+Socket.IOのクライアントマネージャーがチャンネルのルームに送信するイベントをそのまま受け取るため、
+他のワーカーから中継されたイベントも同じように届く。イベントは1回だけSSEの形式に変換し、
+購読中の全ての接続で共有する。
+
+連番付きのイベントは連番をイベントIDとして送り、再接続時の Last-Event-ID から
+再送用バッファで取りこぼした分を送る。バッファから消えている場合は resync イベントで
+差分同期APIからの取得を求める。
+"""
+import json
+import threading
+from app import socketio
+from app.metrics import metrics
+from app.realtime import channel_id_from_room
+from app.realtime.replay import replay_buffer
+
+
+def format_event(event, payload):
+    """SSEの1イベント分の文字列（連番付きの場合はIDを付ける）"""
+    lines = []
+    seq = payload.get('seq') if isinstance(payload, dict) else None
+    if seq is not None:
+        lines.append(f'id: {seq}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(payload, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
+
+
+class _Subscriber:
+    """SSEの1接続分の送信待ちキュー"""
+
+    def __init__(self, queue):
+        self.queue = queue
+        # 送信待ちがあふれてイベントを取りこぼした
+        self.overflowed = False
+
+
+class ChannelStreamHub:
+    """チャンネルごとのSSE購読者にイベントを配る"""
+
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        # チャンネルID -> 購読者の集合
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def configure(self, queue_size):
+        self.queue_size = queue_size
+
+    def subscribe(self, channel_id):
+        """購読を開始して購読者を返す（ワーカーの非同期モードに合ったキューを使う）"""
+        subscriber = _Subscriber(socketio.server.eio.create_queue(maxsize=self.queue_size))
+        with self._lock:
+            self._subscribers.setdefault(channel_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(channel_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[channel_id]
+
+    def publish(self, event, payload, room):
+        """ルームに送信されたイベントを、そのチャンネルの購読者に配る"""
+        channel_id = channel_id_from_room(room)
+        if channel_id is None:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel_id, ()))
+        if not subscribers:
+            return
+
+        seq = payload.get('seq') if isinstance(payload, dict) else None
+        frame = format_event(event, payload)
+        for subscriber in subscribers:
+            if subscriber.overflowed:
+                continue
+            try:
+                subscriber.queue.put_nowait((seq, frame))
+            except Exception:
+                # 受信の遅い接続は再接続させ、Last-Event-ID からの再送に任せる
+                subscriber.overflowed = True
+                metrics.increment('sse_overflow_disconnects_total')
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def stream(self, channel_id, last_event_id=None, keepalive=15):
+        """SSEのレスポンス本文を返すジェネレーター
+
+        購読を始めてから再送用バッファを読むため、その間に届いたイベントは連番で重複を除く。
+        keepalive 秒ごとにコメント行を送り、プロキシによる切断と切断済みの接続を検出する。
+        """
+        subscriber = self.subscribe(channel_id)
+        queue_empty = socketio.server.eio.get_queue_empty_exception()
+        try:
+            last_seq = None
+            head = 'retry: 3000\n\n'
+            if last_event_id is not None:
+                events = replay_buffer.since(channel_id, last_event_id)
+                if events is None:
+                    head += format_event('resync', {'channel_id': channel_id, 'last_event_id': last_event_id})
+                else:
+                    last_seq = last_event_id
+                    for seq, event, payload in events:
+                        head += format_event(event, payload)
+                        last_seq = seq
+            yield head
+
+            while True:
+                # あふれた後は溜まっている分だけを送って終了する
+                try:
+                    seq, frame = subscriber.queue.get(block=not subscriber.overflowed, timeout=keepalive)
+                except queue_empty:
+                    if subscriber.overflowed:
+                        break
+                    yield ': keep-alive\n\n'
+                    continue
+                if seq is not None:
+                    if last_seq is not None and seq <= last_seq:
+                        continue
+                    last_seq = seq
+                yield frame
+            yield format_event('resync', {'channel_id': channel_id, 'last_event_id': last_seq})
+        finally:
+            self.unsubscribe(channel_id, subscriber)
+
+
+channel_streams = ChannelStreamHub()
+
+metrics.register('sse_subscribers', channel_streams.subscriber_count)
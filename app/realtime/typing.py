@@ -0,0 +1,107 @@
+"""入力中表示（「〇〇さんが入力中…」）の配信
+
+クライアントは入力中に typing_start、送信や入力欄を空にしたときに typing_stop を送る。
+サーバーはチャンネルごとの入力中のユーザーと期限だけを記録し、一定間隔ごとに変化のあった
+チャンネルにだけ入力中のユーザーの一覧を1回送信する。キー入力が速くてもイベントごとの処理は
+辞書の更新だけで、送信回数はチャンネル数と間隔で決まる。
+typing_stop が届かないまま切断したクライアントの入力中表示は期限切れで消える。
+"""
+import threading
+import time
+from app import socketio
+from app.metrics import metrics
+from app.realtime import publish_channel_event
+
+
+class TypingTracker:
+    """チャンネルごとの入力中のユーザーを管理する"""
+
+    def __init__(self, timeout=5.0, throttle=1.0, interval=0.5):
+        self._lock = threading.Lock()
+        self._started = False
+        self.configure(timeout, throttle, interval)
+
+    def configure(self, timeout, throttle, interval):
+        """入力中とみなす時間・同じユーザーの typing_start を受け付ける間隔・送信間隔（秒）を設定する"""
+        with self._lock:
+            self.timeout = timeout
+            self.throttle = throttle
+            self.interval = interval
+            # チャンネルID -> {ユーザーID: [ユーザー名, 期限, 受け付けた時刻]}
+            self._typing = {}
+            # 一覧が変わったチャンネル
+            self._dirty = set()
+
+    def start_typing(self, channel_id, user_id, username, now=None):
+        """入力中として記録する（間隔内の繰り返しは無視して False を返す）"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            users = self._typing.setdefault(channel_id, {})
+            entry = users.get(user_id)
+            if entry is not None and now - entry[2] < self.throttle:
+                metrics.increment('typing_events_throttled_total')
+                return False
+            if entry is None:
+                self._dirty.add(channel_id)
+            users[user_id] = [username, now + self.timeout, now]
+        return True
+
+    def stop_typing(self, channel_id, user_id):
+        """入力中の記録を削除する"""
+        with self._lock:
+            users = self._typing.get(channel_id)
+            if not users or users.pop(user_id, None) is None:
+                return
+            self._dirty.add(channel_id)
+            if not users:
+                del self._typing[channel_id]
+
+    def typing_users(self, channel_id):
+        """チャンネルで入力中のユーザー（[{'user_id': ..., 'username': ...}]）"""
+        with self._lock:
+            return self._users(channel_id)
+
+    def take_updates(self, now=None):
+        """期限切れを削除し、一覧が変わったチャンネルの入力中のユーザーを返す"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for channel_id, users in list(self._typing.items()):
+                expired = [user_id for user_id, entry in users.items() if entry[1] <= now]
+                for user_id in expired:
+                    del users[user_id]
+                if expired:
+                    self._dirty.add(channel_id)
+                if not users:
+                    del self._typing[channel_id]
+            dirty, self._dirty = self._dirty, set()
+            return {channel_id: self._users(channel_id) for channel_id in dirty}
+
+    def flush(self, now=None):
+        """一覧が変わったチャンネルに typing_update を送信する"""
+        updates = self.take_updates(now)
+        for channel_id, users in updates.items():
+            publish_channel_event('typing_update', {'channel_id': channel_id, 'users': users}, channel_id)
+        return len(updates)
+
+    def start(self):
+        """期限切れの確認と送信をバックグラウンドで開始する（起動済みの場合は何もしない）"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"入力中表示の送信エラー: {str(e)}")
+
+    def _users(self, channel_id):
+        users = self._typing.get(channel_id, {})
+        return [{'user_id': user_id, 'username': entry[0]} for user_id, entry in sorted(users.items())]
+
+
+typing_tracker = TypingTracker()
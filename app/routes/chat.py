@@ -1,6 +1,21 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, abort, current_app, send_from_directory
-from app.models import Message, Channel, User, Reaction
+from flask import Blueprint, Response, render_template, request, redirect, url_for, flash, session, jsonify, abort, current_app, send_from_directory
+from app.models import Message, Channel, User, Reaction, ChannelParticipant, MessageTombstone
 from app import db, socketio
+from app.outbox import enqueue_event
+from app.messaging import MessageError, validate_new_message, find_sent_message, post_message
+from app.realtime.reactions import reaction_broadcaster
+from app.realtime.stream import channel_streams
+from app.realtime.longpoll import channel_waiters
+from app.pagination import paginate_messages, get_page_size, InvalidCursor
+from app.channel_cache import channel_cache, DEFAULT_CHANNEL_NAME
+from app.participants import get_participants
+from app.reaction_counts import (
+    increment_reaction_count, decrement_reaction_count, delete_reaction_counts, delete_channel_reaction_counts
+)
+from app.sync import next_change_seq, current_change_seq, record_tombstone, get_changes
+from app.serializers import (
+    MessageBatch, format_messages, format_reactions, format_timestamp, prerender_message
+)
 from datetime import datetime, UTC, timedelta
 from sqlalchemy import func
 import uuid
@@ -57,66 +72,41 @@ def login_required(f):
     return decorated_function
 
 def get_or_create_default_channel():
-    default_channel = Channel.query.filter_by(name='general').first()
+    default_channel = Channel.query.filter_by(name=DEFAULT_CHANNEL_NAME).first()
     if not default_channel:
         default_channel = Channel(
             id=str(uuid.uuid4()),
-            name='general',
+            name=DEFAULT_CHANNEL_NAME,
             created_by=session['user_id']
         )
         db.session.add(default_channel)
         db.session.commit()
+        channel_cache.invalidate()
     return default_channel
 
-def format_reactions(message):
-    """メッセージのリアクションを集計してフォーマット"""
-    reactions = db.session.query(
-        Reaction.emoji,
-        func.count(Reaction.user_id).label('count')
-    ).filter_by(message_id=message.id).group_by(Reaction.emoji).all()
-    
-    return [{'emoji': r.emoji, 'count': r.count} for r in reactions]
+def get_default_channel_id():
+    """デフォルトチャンネルのIDをキャッシュから取得（未作成の場合は作成）"""
+    default_channel_id = channel_cache.default_channel_id()
+    if default_channel_id is None:
+        default_channel_id = get_or_create_default_channel().id
+    return default_channel_id
 
-def format_message(message):
-    """メッセージをJSON形式にフォーマット"""
-    content = message.content
-    # メンションをスパンに変換
-    mentions = re.findall(r'@(\w+)', content)
-    for username in mentions:
-        user = User.query.filter_by(username=username).first()
-        if user:
-            content = content.replace(
-                f'@{username}',
-                f'<span class="mention">@{username}</span>'
-            )
-    
-    # UTCから東京時間に変換
-    created_at_jst = message.created_at.replace(tzinfo=UTC).astimezone(JST)
-    
-    return {
-        'id': message.id,
-        'content': content,
-        'raw_content': message.content,
-        'user_id': message.user_id,
-        'username': message.author.username,
-        'avatar_bg_color': message.author.avatar_bg_color,
-        'avatar_text_color': message.author.avatar_text_color,
-        'created_at': created_at_jst.strftime('%Y年%m月%d日 %H:%M'),
-        'is_edited': message.is_edited,
-        'image_url': message.image_url,
-        'reactions': format_reactions(message)
-    }
+def get_channel_or_404(channel_id):
+    """チャンネルをキャッシュから取得（他のワーカーで作成された場合はDBを参照）"""
+    channel = channel_cache.get_or_load(channel_id)
+    if channel is None:
+        abort(404)
+    return channel
 
 @bp.route('/messages')
 @bp.route('/messages/<channel_id>')
 @login_required
 def messages(channel_id=None):
-    # 全チャンネルを取得
-    channels = Channel.query.order_by(Channel.name).all()
-    
     # チャンネルIDが指定されていない場合はデフォルトチャンネルを使用
     if channel_id is None:
-        default_channel = get_or_create_default_channel()
+        default_channel_id = get_default_channel_id()
+        # 全チャンネルを取得（プロセス内キャッシュ）
+        channels = channel_cache.list()
         # AJAXリクエストの場合はリダイレクトせずにJSONでチャンネル一覧を返す
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             channels_data = [{
@@ -130,26 +120,43 @@ def messages(channel_id=None):
             return jsonify({
                 'status': 'success',
                 'channels': channels_data,
-                'default_channel_id': default_channel.id
+                'default_channel_id': default_channel_id
             })
         
-        return redirect(url_for('chat.messages', channel_id=default_channel.id))
+        return redirect(url_for('chat.messages', channel_id=default_channel_id))
     
     # 現在のチャンネルを取得
-    current_channel = Channel.query.get_or_404(channel_id)
+    current_channel = get_channel_or_404(channel_id)
     
-    # チャンネルのメッセージを取得
-    messages = Message.query.filter_by(channel_id=channel_id).order_by(Message.created_at.asc()).all()
+    # 全チャンネルを取得（プロセス内キャッシュ）
+    channels = channel_cache.list()
     
-    # 各メッセージの処理
+    # 差分同期の起点となる連番（ページ取得より先に読み、取りこぼしを防ぐ）
+    sync_seq = current_change_seq(channel_id)
+    
+    # チャンネルのメッセージを1ページ分取得（before/afterカーソルで前後のページへ移動）
+    try:
+        page = paginate_messages(
+            channel_id,
+            before=request.args.get('before'),
+            after=request.args.get('after'),
+            limit=request.args.get('limit', type=int)
+        )
+    except InvalidCursor:
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'error': '不正なカーソルが指定されました'}), 400
+        abort(400)
+    messages = page.messages
+    
+    # 作成者・メンション・リアクションをページ単位でまとめて取得
+    batch = MessageBatch(messages)
     for message in messages:
         # メンションタグを適用
-        message.display_content = format_mentions(message.content)
+        message.display_content = batch.content(message)
+        message.display_reactions = batch.message_reactions(message)
     
-    # 現在のチャンネルに投稿したユーザーのリストを取得（重複なし）
-    channel_users = db.session.query(User).join(Message).filter(
-        Message.channel_id == channel_id
-    ).distinct().all()
+    # 現在のチャンネルに投稿したユーザーのリストを取得（参加者テーブルから）
+    channel_users = get_participants(channel_id)
     
     users_data = [{'id': user.id, 'username': user.username} for user in channel_users]
     
@@ -163,7 +170,7 @@ def messages(channel_id=None):
             'updated_at': ch.updated_at.isoformat() if ch.updated_at else None
         } for ch in channels]
         
-        messages_data = [format_message(msg) for msg in messages]
+        messages_data = format_messages(messages)
         
         return jsonify({
             'status': 'success',
@@ -176,7 +183,9 @@ def messages(channel_id=None):
             },
             'channels': channels_data,
             'messages': messages_data,
-            'users': users_data
+            'users': users_data,
+            'pagination': page.to_dict(),
+            'sync_seq': sync_seq
         })
     
     return render_template('chat/messages.html', 
@@ -184,21 +193,116 @@ def messages(channel_id=None):
                          channels=channels,
                          current_channel=current_channel,
                          users=users_data,
+                         pagination=page.to_dict(),
+                         sync_seq=sync_seq,
                          utc=UTC,
                          jst=JST)
 
-def format_mentions(content):
-    """メッセージコンテンツ内のメンションをHTMLタグに変換"""
-    mentions = re.findall(r'@(\w+)', content)
-    result = content
-    for username in mentions:
-        user = User.query.filter_by(username=username).first()
-        if user:
-            result = result.replace(
-                f'@{username}',
-                f'<span class="mention">@{username}</span>'
-            )
-    return result
+@bp.route('/channels/<string:channel_id>/messages/older')
+@login_required
+def older_messages(channel_id):
+    """スクロールアップ時に過去のメッセージを1ページ分返す"""
+    get_channel_or_404(channel_id)
+    
+    try:
+        page = paginate_messages(
+            channel_id,
+            before=request.args.get('before'),
+            limit=request.args.get('limit', type=int)
+        )
+    except InvalidCursor:
+        return jsonify({'error': '不正なカーソルが指定されました'}), 400
+    
+    return jsonify({
+        'status': 'success',
+        'messages': format_messages(page.messages),
+        'pagination': page.to_dict()
+    })
+
+@bp.route('/channels/<string:channel_id>/changes')
+@login_required
+def channel_changes(channel_id):
+    """再接続時の差分同期: since 以降に作成・編集・削除されたメッセージを返す"""
+    get_channel_or_404(channel_id)
+    
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({'error': 'sinceパラメータが不正です'}), 400
+    
+    changed_messages, deleted, next_since, has_more = get_changes(
+        channel_id, since, get_page_size(request.args.get('limit', type=int))
+    )
+    
+    return jsonify({
+        'status': 'success',
+        'channel_id': channel_id,
+        'since': since,
+        'next_since': next_since,
+        'has_more': has_more,
+        'messages': format_messages(changed_messages),
+        'deleted': [{'message_id': t.message_id, 'seq': t.change_seq} for t in deleted]
+    })
+
+@bp.route('/channels/<string:channel_id>/stream')
+@login_required
+def channel_stream(channel_id):
+    """チャンネルのイベントを Server-Sent Events で配信する（受信専用のクライアント向け）"""
+    get_channel_or_404(channel_id)
+    
+    # 再接続時はブラウザが最後に受け取ったイベントID（連番）を Last-Event-ID で送る
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return jsonify({'error': 'Last-Event-IDが不正です'}), 400
+    
+    # 配信中はリクエストのコンテキストやDBのセッションを保持しない
+    stream = channel_streams.stream(
+        channel_id, last_event_id, current_app.config.get('SSE_KEEPALIVE_SECONDS', 15)
+    )
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@bp.route('/channels/<string:channel_id>/poll')
+@login_required
+def channel_poll(channel_id):
+    """since より後のチャンネルのイベントを、届くまで待ってから返す（WebSocketを使えないクライアント向け）"""
+    get_channel_or_404(channel_id)
+    
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({'error': 'sinceパラメータが不正です'}), 400
+    
+    def latest_seq():
+        # 待機中はDBの接続を保持しない
+        try:
+            return current_change_seq(channel_id)
+        finally:
+            db.session.close()
+    
+    events = channel_waiters.poll(
+        channel_id, since, current_app.config.get('LONG_POLL_TIMEOUT_SECONDS', 25), latest_seq
+    )
+    if events is None:
+        # 再送用バッファから消えた範囲は差分同期APIで取得してもらう
+        return jsonify({
+            'status': 'resync',
+            'channel_id': channel_id,
+            'since': since,
+            'events': [],
+            'last_seq': since
+        })
+    
+    return jsonify({
+        'status': 'success',
+        'channel_id': channel_id,
+        'since': since,
+        'events': [{'seq': seq, 'event': event, 'data': payload} for seq, event, payload in events],
+        'last_seq': events[-1][0] if events else since
+    })
 
 @bp.route('/send', methods=['POST'])
 @login_required
@@ -216,29 +320,42 @@ def send_message():
         channel_id = request.form.get('channel_id')
         print(f"チャンネルID: {channel_id}")
         
-        if not channel_id:
-            error_msg = 'チャンネルIDが指定されていません'
-            print(f"エラー: {error_msg}")
-            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                return jsonify({'error': error_msg}), 400
-            flash(error_msg, 'error')
-            return redirect(url_for('chat.messages'))
-        
         # メッセージ内容と画像の取得
         content = request.form.get('message', '').strip()
         image_file = request.files.get('image')
         print(f"メッセージ内容: {content}")
         print(f"画像ファイル: {image_file.filename if image_file else None}")
         
-        # メッセージも画像も空の場合はエラー
-        if not content and (not image_file or not image_file.filename):
-            error_msg = 'メッセージまたは画像を入力してください'
+        # 再送時の重複を防ぐ送信キー（任意）
+        client_message_id = request.form.get('client_message_id') or request.headers.get('Idempotency-Key')
+        
+        # 入力内容の検証（WebSocketからの送信と共通）
+        try:
+            validate_new_message(
+                channel_id, content,
+                has_image=bool(image_file and image_file.filename),
+                client_message_id=client_message_id
+            )
+            # 送信済みの場合は画像を保存し直さずに保存済みのメッセージを返す
+            sent_message = find_sent_message(session.get('user_id'), client_message_id)
+        except MessageError as e:
+            error_msg = str(e)
             print(f"エラー: {error_msg}")
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return jsonify({'error': error_msg}), 400
             flash(error_msg, 'error')
             return redirect(url_for('chat.messages', channel_id=channel_id))
         
+        if sent_message is not None:
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return jsonify({
+                    'status': 'success',
+                    'message': 'メッセージを送信しました',
+                    'data': sent_message
+                })
+            flash('メッセージを送信しました', 'success')
+            return redirect(url_for('chat.messages', channel_id=channel_id))
+        
         # 画像処理
         image_url = None
         if image_file and image_file.filename:
@@ -279,29 +396,13 @@ def send_message():
                 flash(error_msg, 'error')
                 return redirect(url_for('chat.messages', channel_id=channel_id))
         
-        # メッセージ作成
-        message = Message(
-            id=str(uuid.uuid4()),
-            content=content,
-            user_id=session.get('user_id'),
-            channel_id=channel_id,
-            image_url=image_url
-        )
-        
-        # メンション処理
-        mentioned_usernames = []
-        if content:
-            for match in re.finditer(r'@(\w+)', content):
-                username = match.group(1)
-                user = User.query.filter_by(username=username).first()
-                if user:
-                    mentioned_usernames.append(username)
-        
-        # データベースに保存
+        # データベースに保存（配信するイベントも同じトランザクションでアウトボックスに追加）
         try:
-            db.session.add(message)
-            db.session.commit()
-            print(f"メッセージをDBに保存: ID={message.id}")
+            formatted_message = post_message(
+                session.get('user_id'), channel_id, content,
+                image_url=image_url, client_message_id=client_message_id
+            )
+            print(f"メッセージをDBに保存: ID={formatted_message['id']}")
         except Exception as e:
             error_msg = f'データベース保存エラー: {str(e)}'
             print(f"例外: {error_msg}")
@@ -311,20 +412,6 @@ def send_message():
             flash(error_msg, 'error')
             return redirect(url_for('chat.messages', channel_id=channel_id))
         
-        # メッセージフォーマット
-        formatted_message = format_message(message)
-        formatted_message['mentions'] = mentioned_usernames
-        formatted_message['channel_id'] = channel_id  # channel_idを明示的に追加
-        
-        # WebSocketでブロードキャスト
-        try:
-            socketio.emit('new_message', formatted_message)
-            print(f"WebSocketでメッセージを送信")
-        except Exception as e:
-            print(f"WebSocket送信エラー: {str(e)}")
-            print(traceback.format_exc())
-            # WebSocketエラーは無視して処理を続行
-        
         # AJAXリクエストの場合はJSONを返す
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             response_data = {
@@ -405,14 +492,19 @@ def edit_message(message_id):
         message.content = content
         message.is_edited = True
         message.updated_at = datetime.now(UTC)
-        db.session.commit()
+        # 表示用HTMLを再生成
+        prerender_message(message)
+        message.change_seq = next_change_seq(message.channel_id)
         
-        # WebSocketで編集済みメッセージを送信
-        socketio.emit('message_edited', {
+        # 編集済みメッセージの通知（表示用HTML）をコミット後に配信
+        enqueue_event('message_edited', {
             'message_id': message.id,
-            'content': message.content,
-            'is_edited': message.is_edited
-        })
+            'channel_id': message.channel_id,
+            'content': message.content_html,
+            'is_edited': message.is_edited,
+            'seq': message.change_seq
+        }, message.channel_id)
+        db.session.commit()
         
         if is_ajax:
             return jsonify({
@@ -454,16 +546,21 @@ def delete_message(message_id):
         # 関連するリアクションを先に削除
         try:
             Reaction.query.filter_by(message_id=message_id).delete()
+            delete_reaction_counts(message_id)
         except Exception as e:
             print(f"リアクション削除エラー: {str(e)}")
         
+        # 差分同期用に削除を記録
+        seq = record_tombstone(message)
         db.session.delete(message)
-        db.session.commit()
         
-        # WebSocketでメッセージ削除を通知
-        socketio.emit('message_deleted', {
-            'message_id': message_id
-        })
+        # メッセージ削除の通知をコミット後に配信
+        enqueue_event('message_deleted', {
+            'message_id': message_id,
+            'channel_id': channel_id,
+            'seq': seq
+        }, channel_id)
+        db.session.commit()
         
         if is_ajax:
             return jsonify({'success': True, 'message': 'メッセージを削除しました'})
@@ -494,15 +591,19 @@ def delete_message_api(message_id):
     
     # 関連するリアクションを先に削除
     Reaction.query.filter_by(message_id=message_id).delete()
+    delete_reaction_counts(message_id)
     
-    # メッセージを削除
+    # 差分同期用に削除を記録してからメッセージを削除
+    seq = record_tombstone(message)
     db.session.delete(message)
-    db.session.commit()
     
-    # WebSocketで削除をブロードキャスト
-    socketio.emit('message_deleted', {
-        'message_id': message_id
-    })
+    # 削除の通知をコミット後に配信
+    enqueue_event('message_deleted', {
+        'message_id': message_id,
+        'channel_id': channel_id,
+        'seq': seq
+    }, channel_id)
+    db.session.commit()
     
     return jsonify({'message': 'Message deleted successfully'})
 
@@ -531,9 +632,11 @@ def toggle_reaction(message_id):
         # 既存のリアクションがあり、同じ絵文字の場合は削除
         if existing_reaction and existing_reaction.emoji == emoji:
             db.session.delete(existing_reaction)
+            decrement_reaction_count(message_id, emoji)
             db.session.commit()
+            reaction_broadcaster.schedule(message_id, message.channel_id)
             
-            # 現在のリアクション数を集計して返す
+            # 現在のリアクション数を返す
             reactions = format_reactions(message)
             return jsonify({
                 'status': 'success',
@@ -543,6 +646,7 @@ def toggle_reaction(message_id):
         
         # 既存のリアクションがあり、異なる絵文字の場合は更新
         if existing_reaction:
+            decrement_reaction_count(message_id, existing_reaction.emoji)
             existing_reaction.emoji = emoji
             existing_reaction.created_at = datetime.now(UTC)
         else:
@@ -554,10 +658,12 @@ def toggle_reaction(message_id):
                 created_at=datetime.now(UTC)
             )
             db.session.add(new_reaction)
+        increment_reaction_count(message_id, emoji)
         
         db.session.commit()
+        reaction_broadcaster.schedule(message_id, message.channel_id)
         
-        # 現在のリアクション数を集計して返す
+        # 現在のリアクション数を返す
         reactions = format_reactions(message)
         return jsonify({
             'status': 'success',
@@ -605,6 +711,7 @@ def create_channel():
         )
         db.session.add(channel)
         db.session.commit()
+        channel_cache.invalidate()
         print(f"チャンネル作成成功: id={channel.id}, name={channel.name}")
         
         # AJAXリクエストの場合はJSONレスポンスを返す
@@ -646,8 +753,8 @@ def delete_channel(channel_id):
         return redirect(url_for('chat.messages', channel_id=channel_id))
     
     # デフォルトチャンネルは削除できないようにする
-    default_channel = get_or_create_default_channel()
-    if channel.id == default_channel.id:
+    default_channel_id = get_default_channel_id()
+    if channel.id == default_channel_id:
         # AJAXリクエストの場合はJSONレスポンスを返す
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return jsonify({'error': 'デフォルトチャンネルは削除できません'}), 400
@@ -655,23 +762,30 @@ def delete_channel(channel_id):
         return redirect(url_for('chat.messages', channel_id=channel_id))
     
     try:
-        # チャンネルに関連するメッセージを削除
+        # チャンネルに関連するメッセージ・削除の記録・参加者を削除
+        # （メッセージを参照するリアクションとリアクション数を先に削除する）
+        channel_message_ids = db.session.query(Message.id).filter(Message.channel_id == channel.id)
+        Reaction.query.filter(Reaction.message_id.in_(channel_message_ids)).delete(synchronize_session=False)
+        delete_channel_reaction_counts(channel.id)
         Message.query.filter_by(channel_id=channel.id).delete()
+        MessageTombstone.query.filter_by(channel_id=channel.id).delete()
+        ChannelParticipant.query.filter_by(channel_id=channel.id).delete()
         
         # チャンネルを削除
         db.session.delete(channel)
         db.session.commit()
+        channel_cache.invalidate()
         
         # AJAXリクエストの場合はJSONレスポンスを返す
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return jsonify({
                 'success': True,
                 'message': 'チャンネルを削除しました',
-                'redirect_to': url_for('chat.messages', channel_id=default_channel.id)
+                'redirect_to': url_for('chat.messages', channel_id=default_channel_id)
             }), 200
             
         flash('チャンネルを削除しました', 'success')
-        return redirect(url_for('chat.messages', channel_id=default_channel.id))
+        return redirect(url_for('chat.messages', channel_id=default_channel_id))
     except Exception as e:
         db.session.rollback()
         
@@ -697,8 +811,7 @@ def edit_channel(channel_id):
         return redirect(url_for('chat.messages', channel_id=channel_id))
     
     # デフォルトチャンネルは編集できないようにする
-    default_channel = get_or_create_default_channel()
-    if channel.id == default_channel.id:
+    if channel.id == get_default_channel_id():
         # AJAXリクエストの場合はJSONレスポンスを返す
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return jsonify({'error': 'デフォルトチャンネルは編集できません'}), 400
@@ -730,6 +843,7 @@ def edit_channel(channel_id):
             channel.name = new_name
             channel.updated_at = datetime.now(UTC)
             db.session.commit()
+            channel_cache.invalidate()
             
             # AJAXリクエストの場合はJSONレスポンスを返す
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -772,8 +886,7 @@ def edit_channel(channel_id):
 def simple_test():
     """シンプルなテストページ"""
     # デフォルトチャンネルを取得
-    default_channel = get_or_create_default_channel()
-    return render_template('simple_test.html', channel_id=default_channel.id)
+    return render_template('simple_test.html', channel_id=get_default_channel_id())
 
 # 画像表示用のエンドポイントを追加
 @bp.route('/uploads/<filename>')
@@ -797,21 +910,18 @@ def search_messages():
         Message.content.ilike(f'%{keyword}%')
     ).order_by(Message.created_at.desc()).all()
     
+    # 作成者とメンションをまとめて取得（リアクションは検索結果に不要）
+    batch = MessageBatch(messages, with_reactions=False)
+    
     # 検索結果をフォーマット
     result = []
     for message in messages:
-        # メッセージの作成日時をJSTに変換
-        created_at_jst = message.created_at.replace(tzinfo=UTC).astimezone(JST)
-        timestamp = created_at_jst.strftime('%Y年%m月%d日 %H:%M')
-        
-        # メンションを処理したコンテンツを取得
-        content = format_mentions(message.content)
-        
+        author = batch.author(message)
         result.append({
             'id': message.id,
-            'username': message.author.username,
-            'content': content,
-            'timestamp': timestamp,
+            'username': author.username if author else None,
+            'content': batch.content(message),
+            'timestamp': format_timestamp(message.created_at),
             'is_edited': message.is_edited
         })
     
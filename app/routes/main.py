@@ -1,4 +1,5 @@
-from flask import Blueprint, render_template, abort
+from flask import Blueprint, render_template, abort, jsonify
+from app.metrics import metrics
 
 bp = Blueprint('main', __name__)
 
@@ -6,6 +7,11 @@ bp = Blueprint('main', __name__)
 def index():
     return render_template('index.html')
 
+@bp.route('/metrics')
+def show_metrics():
+    """運用監視用のメトリクスをJSONで返す"""
+    return jsonify(metrics.snapshot())
+
 @bp.route('/test-errors')
 def test_errors():
     """エラー画面をテストするための一時的なルート"""
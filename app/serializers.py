@@ -0,0 +1,147 @@
+"""メッセージのJSONシリアライズ
+
+作成者・メンション・リアクション数をページ単位でまとめて取得し、
+メッセージ件数に関係なく一定回数のクエリでシリアライズする。
+"""
+import re
+from datetime import UTC
+import pytz
+from app import db
+from app.models import User
+from app.mentions import username_index
+from app.reaction_counts import load_reaction_counts
+
+# 東京タイムゾーンの定義
+JST = pytz.timezone('Asia/Tokyo')
+
+MENTION_PATTERN = re.compile(r'@(\w+)')
+
+# メッセージ表示用HTMLの生成ルールのバージョン
+# ルールを変更した場合はこの値を上げ、`flask messages rerender` で既存データを再生成する
+RENDER_VERSION = 1
+
+
+def find_existing_usernames(usernames):
+    """指定したユーザー名のうち実在するものを取得
+
+    メモリ上のユーザー名インデックスで判定し、インデックスにない名前（未読み込みの場合は全て）だけを
+    1クエリでDBに確認する。他のワーカーで作成されたユーザーは再読み込みまでインデックスにないため。
+    """
+    usernames = set(usernames)
+    if not usernames:
+        return set()
+    existing = username_index.filter_existing(usernames)
+    if existing is None:
+        existing = set()
+    missing = usernames - existing
+    if missing:
+        rows = db.session.query(User.username).filter(User.username.in_(missing)).all()
+        existing |= {row.username for row in rows}
+    return existing
+
+
+def extract_mentions(content):
+    """コンテンツ内の @ユーザー名 を出現順に抽出"""
+    return MENTION_PATTERN.findall(content or '')
+
+
+def render_mentions(content, existing_usernames):
+    """実在するユーザーへのメンションを1回の走査でHTMLタグに変換"""
+    def replace(match):
+        username = match.group(1)
+        if username in existing_usernames:
+            return f'<span class="mention">@{username}</span>'
+        return match.group(0)
+    return MENTION_PATTERN.sub(replace, content or '')
+
+
+def prerender_message(message):
+    """メッセージの表示用HTMLを生成して保存（送信・編集時に呼び出す）"""
+    existing_usernames = find_existing_usernames(extract_mentions(message.content))
+    message.content_html = render_mentions(message.content, existing_usernames)
+    message.render_version = RENDER_VERSION
+
+
+def needs_render(message):
+    """保存済みのHTMLが無いか、古いルールで生成されているか"""
+    return message.content_html is None or message.render_version != RENDER_VERSION
+
+
+def load_authors(messages):
+    """メッセージの作成者を1クエリで取得して {user_id: User} を返す"""
+    user_ids = {message.user_id for message in messages}
+    if not user_ids:
+        return {}
+    return {user.id: user for user in User.query.filter(User.id.in_(user_ids)).all()}
+
+
+def format_reactions(message):
+    """メッセージのリアクションを集計してフォーマット"""
+    return load_reaction_counts([message.id])[message.id]
+
+
+def format_mentions(content):
+    """メッセージコンテンツ内のメンションをHTMLタグに変換"""
+    return render_mentions(content, find_existing_usernames(extract_mentions(content)))
+
+
+def format_timestamp(value):
+    """UTCの日時を東京時間の表示用文字列に変換"""
+    return value.replace(tzinfo=UTC).astimezone(JST).strftime('%Y年%m月%d日 %H:%M')
+
+
+class MessageBatch:
+    """メッセージ一覧の表示に必要な関連データをまとめて読み込む"""
+
+    def __init__(self, messages, with_reactions=True):
+        self.messages = list(messages)
+        self.authors = load_authors(self.messages)
+        # 表示用HTMLが保存済みのメッセージはメンションの解決が不要
+        mentions = set()
+        for message in self.messages:
+            if needs_render(message):
+                mentions.update(extract_mentions(message.content))
+        self.existing_usernames = find_existing_usernames(mentions)
+        if with_reactions:
+            self.reactions = load_reaction_counts([message.id for message in self.messages])
+        else:
+            self.reactions = {}
+
+    def author(self, message):
+        return self.authors.get(message.user_id)
+
+    def content(self, message):
+        if not needs_render(message):
+            return message.content_html
+        return render_mentions(message.content, self.existing_usernames)
+
+    def message_reactions(self, message):
+        return self.reactions.get(message.id, [])
+
+
+def format_messages(messages):
+    """複数のメッセージを一定回数のクエリでJSON形式にフォーマット"""
+    batch = MessageBatch(messages)
+    result = []
+    for message in batch.messages:
+        author = batch.author(message)
+        result.append({
+            'id': message.id,
+            'content': batch.content(message),
+            'raw_content': message.content,
+            'user_id': message.user_id,
+            'username': author.username if author else None,
+            'avatar_bg_color': author.avatar_bg_color if author else None,
+            'avatar_text_color': author.avatar_text_color if author else None,
+            'created_at': format_timestamp(message.created_at),
+            'is_edited': message.is_edited,
+            'image_url': message.image_url,
+            'reactions': batch.message_reactions(message),
+            'seq': message.change_seq
+        })
+    return result
+
+
+def format_message(message):
+    """メッセージをJSON形式にフォーマット"""
+    return format_messages([message])[0]
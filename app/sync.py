@@ -0,0 +1,73 @@
+"""チャンネルの差分同期
+
+チャンネルごとの単調増加する連番（Channel.change_seq）をメッセージの作成・編集・削除時に
+採番し、再接続したクライアントが「since 以降の変更」だけを取得できるようにする。
+削除は MessageTombstone として記録する。
+"""
+from sqlalchemy import select, update
+from app import db
+from app.models import Channel, Message, MessageTombstone
+
+
+def next_change_seq(channel_id):
+    """チャンネルの連番を1つ進めて返す
+
+    呼び出し元のトランザクション内でチャンネル行を更新するため、コミットまで行ロックが保持され、
+    同じチャンネルへの変更はコミット順に連番が振られる。
+    """
+    db.session.execute(
+        update(Channel)
+        .where(Channel.id == channel_id)
+        .values(change_seq=Channel.change_seq + 1, updated_at=Channel.updated_at)
+    )
+    return db.session.execute(
+        select(Channel.change_seq).where(Channel.id == channel_id)
+    ).scalar()
+
+
+def current_change_seq(channel_id):
+    """チャンネルの現在の連番"""
+    return db.session.execute(
+        select(Channel.change_seq).where(Channel.id == channel_id)
+    ).scalar() or 0
+
+
+def record_tombstone(message):
+    """メッセージの削除を記録して採番した連番を返す（コミットは呼び出し元で行う）"""
+    seq = next_change_seq(message.channel_id)
+    tombstone = db.session.get(MessageTombstone, message.id)
+    if tombstone is None:
+        tombstone = MessageTombstone(message_id=message.id, channel_id=message.channel_id)
+        db.session.add(tombstone)
+    tombstone.change_seq = seq
+    return seq
+
+
+def get_changes(channel_id, since, limit):
+    """since より後の変更を連番順に最大 limit 件取得する
+
+    戻り値は (変更されたメッセージ, 削除の記録, 次回の since, 続きがあるか)。
+    """
+    # 先に上限を確定させ、取得中にコミットされた変更を次回に回す
+    upper = current_change_seq(channel_id)
+
+    messages = Message.query.filter(
+        Message.channel_id == channel_id,
+        Message.change_seq > since,
+        Message.change_seq <= upper
+    ).order_by(Message.change_seq.asc()).limit(limit + 1).all()
+
+    tombstones = MessageTombstone.query.filter(
+        MessageTombstone.channel_id == channel_id,
+        MessageTombstone.change_seq > since,
+        MessageTombstone.change_seq <= upper
+    ).order_by(MessageTombstone.change_seq.asc()).limit(limit + 1).all()
+
+    changes = sorted(messages + tombstones, key=lambda change: change.change_seq)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    next_since = changes[-1].change_seq if has_more else max(upper, since)
+    changed_messages = [c for c in changes if isinstance(c, Message)]
+    deleted = [c for c in changes if isinstance(c, MessageTombstone)]
+    return changed_messages, deleted, next_since, has_more
@@ -0,0 +1,120 @@
+"""メッセージ送信から受信までの遅延の計測
+
+HTTP（/chat/send）とWebSocket（send_message イベント）のそれぞれで、
+送信者が保存結果を受け取るまでの時間（応答）と、同じチャンネルの別のクライアントが
+new_message を受け取るまでの時間（配信）を計測する。
+ネットワークを挟まずにアプリ内の処理だけを比較するため、テストクライアントを使う。
+
+使い方:
+    FLASK_ENV=development python benchmarks/send_latency.py --count 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask_socketio import SocketIOTestClient
+from config import Config
+from app import create_app, db, socketio
+from app.models import User, Channel
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    OUTBOX_POLL_INTERVAL = 0.1
+
+
+def create_user(username):
+    user = User(id=str(uuid.uuid4()), username=username, password_hash='dummy_hash')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def login(app, user):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user.id
+        session['username'] = user.username
+    return client
+
+
+def wait_for_message(receiver, message_id, timeout=5):
+    """受信側のクライアントが指定したメッセージを受け取るまで待つ"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        for packet in receiver.get_received():
+            if packet['name'] == 'new_message' and packet['args'][0]['id'] == message_id:
+                return
+        time.sleep(0.0002)
+    raise TimeoutError(f'メッセージを受信できませんでした: {message_id}')
+
+
+def send_http(sender_http, sender_socket, channel_id, content):
+    # ブラウザと同じく multipart/form-data で送信する
+    response = sender_http.post('/chat/send', data={
+        'message': content,
+        'channel_id': channel_id
+    }, headers={'X-Requested-With': 'XMLHttpRequest'}, content_type='multipart/form-data')
+    return response.get_json()['data']['id']
+
+
+def send_socket(sender_http, sender_socket, channel_id, content):
+    ack = sender_socket.emit('send_message', {'channel_id': channel_id, 'message': content}, callback=True)
+    return ack['data']['id']
+
+
+def measure(send, count, sender_http, sender_socket, receiver, channel_id):
+    acked, delivered = [], []
+    for i in range(count):
+        start = time.perf_counter()
+        message_id = send(sender_http, sender_socket, channel_id, f'計測メッセージ{i}')
+        acked.append(time.perf_counter() - start)
+        wait_for_message(receiver, message_id)
+        delivered.append(time.perf_counter() - start)
+    return acked, delivered
+
+
+def summarize(name, samples):
+    samples = sorted(sample * 1000 for sample in samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f'  {name:<6} 中央値 {statistics.median(samples):7.2f} ms  p95 {p95:7.2f} ms  最大 {samples[-1]:7.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=200, help='経路ごとの送信回数')
+    parser.add_argument('--warmup', type=int, default=20, help='計測前に捨てる送信回数')
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        sender = create_user('bench_sender')
+        receiver_user = create_user('bench_receiver')
+        channel = Channel(id=str(uuid.uuid4()), name='benchmark', created_by=sender.id)
+        db.session.add(channel)
+        db.session.commit()
+        channel_id = channel.id
+
+        sender_http = login(app, sender)
+        sender_socket = SocketIOTestClient(app, socketio, flask_test_client=sender_http)
+        receiver = SocketIOTestClient(app, socketio, flask_test_client=login(app, receiver_user))
+        receiver.emit('join_channel', {'channel_id': channel_id})
+        receiver.get_received()
+
+        for name, send in (('HTTP', send_http), ('WebSocket', send_socket)):
+            measure(send, args.warmup, sender_http, sender_socket, receiver, channel_id)
+            acked, delivered = measure(send, args.count, sender_http, sender_socket, receiver, channel_id)
+            print(f'{name}（{args.count}回）')
+            summarize('応答', acked)
+            summarize('配信', delivered)
+
+
+if __name__ == '__main__':
+    main()
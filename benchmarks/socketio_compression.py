@@ -0,0 +1,152 @@
+"""Socket.IOのイベントの圧縮による通信量とCPU時間の計測
+
+チャットで実際に送るイベント（new_message・update_reactions・typing_update・presence_update）を
+アプリのフォーマット処理で作成し、WebSocket のフレームとして送る場合のバイト数と、
+1イベントあたりの圧縮のCPU時間を、圧縮なし・permessage-deflate（閾値ごと）で比較する。
+圧縮は eventlet の permessage-deflate と同じ方法（接続ごとの圧縮の状態を引き継ぐ Z_SYNC_FLUSH）で行う。
+
+使い方:
+    FLASK_ENV=development python benchmarks/socketio_compression.py --messages 500
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+import zlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from socketio import packet
+from config import Config
+from app import create_app, db
+from app.auth import create_user
+from app.messaging import post_message
+from app.models import Channel, Message
+from app.serializers import format_message
+
+CONTENTS = [
+    'おはようございます！',
+    '了解です👍',
+    '@{mention} 明日の打ち合わせは10時からで大丈夫ですか？',
+    '資料を共有フォルダに置きました。確認お願いします。',
+    'lunch?',
+    '先ほどのバグですが、キャッシュの有効期限が切れたタイミングで古いデータを返していたのが原因でした。'
+    '修正をプッシュしたので、レビューをお願いします。テスト環境には夕方に反映予定です。',
+    'https://example.com/docs/release-notes を見てください',
+    'ありがとうございます！助かりました🙏',
+]
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+
+
+def encode_event(event, payload):
+    """WebSocket で送るEngine.IOのメッセージ（4 + Socket.IOのパケット）"""
+    return '4' + packet.Packet(packet.EVENT, namespace='/', data=[event, payload]).encode()
+
+
+def frame_size(payload_size):
+    """サーバーから送るWebSocketのフレームのバイト数（マスクなし）"""
+    if payload_size <= 125:
+        return 2 + payload_size
+    if payload_size <= 65535:
+        return 4 + payload_size
+    return 10 + payload_size
+
+
+def build_events(count):
+    """実際のフォーマット処理で作成したイベントの列（メッセージの合間にリアクション・入力中表示などを挟む）"""
+    app = create_app(BenchmarkConfig)
+    events = []
+    with app.app_context():
+        users = [create_user(f'bench_user{i}', 'password') for i in range(5)]
+        channel = Channel(id=str(uuid.uuid4()), name='benchmark', created_by=users[0].id)
+        db.session.add(channel)
+        db.session.commit()
+
+        rng = random.Random(0)
+        for i in range(count):
+            user = rng.choice(users)
+            content = rng.choice(CONTENTS).format(mention=rng.choice(users).username)
+            if rng.random() < 0.5:
+                content += f' ({rng.randint(1, 10000)})'
+            post_message(user.id, channel.id, content)
+            message = Message.query.order_by(Message.change_seq.desc()).first()
+            events.append(('new_message', format_message(message)))
+            if i % 3 == 0:
+                events.append(('update_reactions', {
+                    'message_id': message.id, 'channel_id': channel.id,
+                    'reactions': [{'emoji': '👍', 'count': rng.randint(1, 5), 'users': [user.username]}],
+                }))
+            if i % 2 == 0:
+                events.append(('typing_update', {
+                    'channel_id': channel.id,
+                    'users': [{'user_id': user.id, 'username': user.username}],
+                }))
+            if i % 10 == 0:
+                events.append(('presence_update', {'channel_id': channel.id, 'online': [user.id], 'offline': []}))
+    return [(name, encode_event(name, payload).encode('utf-8')) for name, payload in events]
+
+
+def deflate(messages, threshold, context_takeover=True):
+    """閾値以上のメッセージを permessage-deflate で圧縮したフレームのバイト数の一覧"""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    sizes = []
+    for message in messages:
+        if threshold is None or len(message) < threshold:
+            sizes.append(frame_size(len(message)))
+            continue
+        if not context_takeover:
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data = compressor.compress(message) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        sizes.append(frame_size(len(data) - 4))
+    return sizes
+
+
+def measure(messages, threshold, context_takeover, repeat):
+    sizes = deflate(messages, threshold, context_takeover)
+    start = time.process_time()
+    for _ in range(repeat):
+        deflate(messages, threshold, context_takeover)
+    cpu = (time.process_time() - start) / repeat / len(messages)
+    return sizes, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=500, help='作成するメッセージ数')
+    parser.add_argument('--repeat', type=int, default=20, help='CPU時間の計測の繰り返し回数')
+    parser.add_argument('--thresholds', default='0,128,256,512,1024', help='比較する閾値（バイト、カンマ区切り）')
+    parser.add_argument('--connections', type=int, default=10000, help='1イベントを配信する接続数（CPU時間の合計の目安）')
+    args = parser.parse_args()
+
+    events = build_events(args.messages)
+    messages = [data for _, data in events]
+    is_message = [name == 'new_message' for name, _ in events]
+    print(f'イベント数 {len(events)}（new_message {sum(is_message)}）'
+          f'  new_message の平均 {sum(len(m) for m, n in zip(messages, is_message) if n) / sum(is_message):.0f} バイト')
+    # permessage-deflate は接続ごとに圧縮するため、CPU時間は配信先の接続数に比例する
+    print(f'{"方式":<36}{"合計":>10}{"削減率":>8}{"new_message":>14}{"その他":>10}{"CPU/イベント":>14}'
+          f'{f"{args.connections}接続":>12}')
+
+    modes = [('圧縮なし', None, True)]
+    modes += [(f'deflate 閾値{t}', t, True) for t in map(int, args.thresholds.split(','))]
+    modes += [('deflate 閾値0 no_context_takeover', 0, False)]
+    baseline = None
+    for name, threshold, context_takeover in modes:
+        sizes, cpu = measure(messages, threshold, context_takeover, args.repeat)
+        total = sum(sizes)
+        baseline = baseline or total
+        chat = [s for s, n in zip(sizes, is_message) if n]
+        other = [s for s, n in zip(sizes, is_message) if not n]
+        print(f'{name:<36}{total:>10}{1 - total / baseline:>8.1%}{sum(chat) / len(chat):>12.0f} B'
+              f'{sum(other) / max(len(other), 1):>8.0f} B{cpu * 1e6:>11.1f} µs{cpu * args.connections * 1000:>9.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
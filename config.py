@@ -49,6 +49,79 @@ class Config:
     
     # アプリケーション設定
     APP_PORT = int(os.getenv('APP_PORT', 5000))
+    
+    # メッセージ履歴のページング設定（1ページあたりの件数）
+    MESSAGES_PAGE_SIZE = int(os.getenv('MESSAGES_PAGE_SIZE', 50))
+    MESSAGES_MAX_PAGE_SIZE = int(os.getenv('MESSAGES_MAX_PAGE_SIZE', 200))
+    
+    # メンション用ユーザー名インデックスの再読み込み間隔（秒、0で無効）
+    USERNAME_INDEX_REFRESH_SECONDS = int(os.getenv('USERNAME_INDEX_REFRESH_SECONDS', 300))
+    
+    # チャンネル一覧キャッシュの有効期間（秒、0で無期限）
+    CHANNEL_CACHE_TTL_SECONDS = int(os.getenv('CHANNEL_CACHE_TTL_SECONDS', 30))
+    
+    # 再接続時に再送するためにチャンネルごとに保持するイベント数と、保持するチャンネル数の上限
+    REPLAY_BUFFER_SIZE = int(os.getenv('REPLAY_BUFFER_SIZE', 256))
+    REPLAY_BUFFER_MAX_CHANNELS = int(os.getenv('REPLAY_BUFFER_MAX_CHANNELS', 1024))
+    
+    # 同じメッセージへのリアクション更新をまとめて送信する時間（ミリ秒、0で即時送信）
+    REACTION_BROADCAST_WINDOW_MS = int(os.getenv('REACTION_BROADCAST_WINDOW_MS', 100))
+    
+    # ワーカー間のイベント中継（local: 中継なし / ipc: Unixソケットのブローカー / postgres: LISTEN/NOTIFY）
+    SOCKETIO_FANOUT_BACKEND = os.getenv('SOCKETIO_FANOUT_BACKEND', 'local')
+    SOCKETIO_FANOUT_CHANNEL = os.getenv('SOCKETIO_FANOUT_CHANNEL', 'easychat_socketio')
+    SOCKETIO_IPC_PATH = os.getenv('SOCKETIO_IPC_PATH', '/tmp/easychat-socketio.sock')
+    # postgres の場合の接続先（未設定の場合はSQLALCHEMY_DATABASE_URI）
+    SOCKETIO_FANOUT_URL = os.getenv('SOCKETIO_FANOUT_URL')
+    # プロセスの役割（all: HTTPとSocket.IOの両方 / http: HTTPのみ、イベントは中継に送る / gateway: Socket.IOとSSEのみ）
+    REALTIME_ROLE = os.getenv('REALTIME_ROLE', 'all')
+    
+    # 接続ごとの送信キューの上限（パケット数、0で無制限）と、上限に達した場合の方針
+    # （coalesce: 保持して同じメッセージの更新をまとめる / resync: 破棄して再同期を求める / disconnect: 切断する）
+    SOCKETIO_SEND_QUEUE_SIZE = int(os.getenv('SOCKETIO_SEND_QUEUE_SIZE', 256))
+    SOCKETIO_SEND_QUEUE_POLICY = os.getenv('SOCKETIO_SEND_QUEUE_POLICY', 'coalesce')
+    
+    # Socket.IOの通信の圧縮（long-pollingのHTTP圧縮とWebSocketのpermessage-deflate）と、圧縮する最小のバイト数
+    SOCKETIO_COMPRESSION = os.getenv('SOCKETIO_COMPRESSION', 'true').lower() == 'true'
+    SOCKETIO_COMPRESSION_THRESHOLD = int(os.getenv('SOCKETIO_COMPRESSION_THRESHOLD', 128))
+    
+    # 参加者の多いルームへの送信の分割：サブルームの参加者数（0で分割しない）、配信用スレッドの数、
+    # 配信用スレッドが他の処理に譲るまでに書き込む接続数
+    SOCKETIO_FANOUT_SHARD_SIZE = int(os.getenv('SOCKETIO_FANOUT_SHARD_SIZE', 500))
+    SOCKETIO_FANOUT_WORKERS = int(os.getenv('SOCKETIO_FANOUT_WORKERS', 4))
+    SOCKETIO_FANOUT_YIELD_EVERY = int(os.getenv('SOCKETIO_FANOUT_YIELD_EVERY', 50))
+    
+    # Socket.IOの接続の受け付け制限（デプロイ直後の再接続の集中対策）：1秒あたりに受け付ける接続数（0で制限しない）、
+    # 連続して受け付ける上限、断った接続の再接続を分散させる時間（秒）
+    SOCKETIO_CONNECT_RATE = float(os.getenv('SOCKETIO_CONNECT_RATE', 100))
+    SOCKETIO_CONNECT_BURST = int(os.getenv('SOCKETIO_CONNECT_BURST', 200))
+    SOCKETIO_RECONNECT_WINDOW_SECONDS = float(os.getenv('SOCKETIO_RECONNECT_WINDOW_SECONDS', 30))
+    
+    # SSE（/chat/channels/<id>/stream）：キープアライブの間隔（秒）と、接続ごとの送信待ちの上限（超えた場合は再接続させる）
+    SSE_KEEPALIVE_SECONDS = float(os.getenv('SSE_KEEPALIVE_SECONDS', 15))
+    SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', 256))
+    
+    # long-polling（/chat/channels/<id>/poll）：新しいイベントを待つ最大の時間（秒）。プロキシのタイムアウトより短くする
+    LONG_POLL_TIMEOUT_SECONDS = float(os.getenv('LONG_POLL_TIMEOUT_SECONDS', 25))
+    
+    # オンライン状態：クライアントのハートビートの間隔（秒）、ハートビートがない場合にオフラインとするまでの時間（秒）、
+    # 変化をまとめて送信する間隔（秒）
+    PRESENCE_HEARTBEAT_SECONDS = int(os.getenv('PRESENCE_HEARTBEAT_SECONDS', 30))
+    PRESENCE_TIMEOUT_SECONDS = int(os.getenv('PRESENCE_TIMEOUT_SECONDS', 90))
+    PRESENCE_BROADCAST_INTERVAL = float(os.getenv('PRESENCE_BROADCAST_INTERVAL', 1.0))
+    
+    # 入力中表示：入力中とみなす時間（秒）、同じユーザーの通知を受け付ける間隔（秒）、チャンネルごとの送信間隔（秒）
+    TYPING_TIMEOUT_SECONDS = float(os.getenv('TYPING_TIMEOUT_SECONDS', 5.0))
+    TYPING_THROTTLE_SECONDS = float(os.getenv('TYPING_THROTTLE_SECONDS', 1.0))
+    TYPING_BROADCAST_INTERVAL = float(os.getenv('TYPING_BROADCAST_INTERVAL', 0.5))
+    
+    # アウトボックスから1回にまとめて配信するイベント数と、コミットの通知がない間に
+    # 取り残された未配信を確認する間隔（秒）
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 100))
+    OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 30.0))
+    
+    # 再送されたメッセージを同じ送信キーで重複と判定する期間（秒）
+    MESSAGE_IDEMPOTENCY_WINDOW_SECONDS = int(os.getenv('MESSAGE_IDEMPOTENCY_WINDOW_SECONDS', 86400))
 
 class TestConfig(Config):
     TESTING = True
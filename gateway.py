@@ -0,0 +1,27 @@
+"""
+リアルタイム配信専用のゲートウェイ（Socket.IOとSSEの接続だけを受け付ける）のエントリーポイント
+
+ページの表示・画像のアップロード・ログインの負荷でイベントの配信が止まらないよう、
+HTTPのワーカー（wsgi.py）と別のプロセスで起動する。HTTPのワーカーは REALTIME_ROLE=http で起動し、
+イベントをブローカー（flask realtime broker）経由でゲートウェイに送る。
+
+    flask realtime broker &
+    REALTIME_ROLE=http gunicorn --worker-class eventlet -w 4 -b 127.0.0.1:8000 wsgi:app &
+    gunicorn --worker-class eventlet -w 1 -b 127.0.0.1:8100 gateway:app &
+"""
+import os
+from config import Config
+from app import create_app, socketio
+
+
+class GatewayConfig(Config):
+    REALTIME_ROLE = 'gateway'
+    # 同じマシン上のHTTPのワーカーからUnixソケットのブローカー経由でイベントを受け取る
+    SOCKETIO_FANOUT_BACKEND = os.getenv('SOCKETIO_FANOUT_BACKEND', 'ipc')
+
+
+application = create_app(GatewayConfig)
+app = application
+
+if __name__ == "__main__":
+    socketio.run(app, port=8100)
@@ -1,18 +1,21 @@
 import pytest
-from app import create_app, db
-from config import TestConfig
+from flask_socketio import SocketIOTestClient
+from sqlalchemy import event
+from app import create_app, db, socketio
+from app.models import User, Channel
+from app.outbox import outbox_dispatcher
+from datetime import datetime, UTC
 import os
-import sys
 from dotenv import load_dotenv
 
 def pytest_configure(config):
     """テスト開始前の設定"""
     # テスト環境であることを明示的に設定
     os.environ['FLASK_ENV'] = 'testing'
-    
+
     # .env.testファイルを明示的に読み込む
     load_dotenv('.env.test', override=True)
-    
+
     # 環境変数からデータベース名を取得（環境変数が設定されていればそれを優先）
     test_db = os.environ.get('MYSQL_DATABASE')
     if test_db:
@@ -20,89 +23,127 @@ def pytest_configure(config):
     else:
         test_db = os.getenv('MYSQL_DATABASE')
         print(f"[pytest_configure] .env.testから取得したデータベース: {test_db}")
-    
+
     print(f"[pytest_configure] MYSQL_USER: {os.getenv('MYSQL_USER')}")
     print(f"[pytest_configure] MYSQL_HOST: {os.getenv('MYSQL_HOST')}")
     print(f"[pytest_configure] MYSQL_PORT: {os.getenv('MYSQL_PORT')}")
 
-class CustomTestConfig(TestConfig):
-    @property
-    def SQLALCHEMY_DATABASE_URI(self):
-        # 環境変数からデータベース名を取得
-        test_db = os.environ.get('MYSQL_DATABASE', os.getenv('MYSQL_DATABASE'))
-        return f"mysql://{os.getenv('MYSQL_USER')}:{os.getenv('MYSQL_PASSWORD', '')}@{os.getenv('MYSQL_HOST')}:{os.getenv('MYSQL_PORT')}/{test_db}"
-
-@pytest.fixture(scope='session')
+@pytest.fixture
 def app():
-    """テスト用のアプリケーションを作成"""
-    # テスト環境であることを明示的に設定
-    os.environ['FLASK_ENV'] = 'testing'
-    
-    # CustomTestConfigを使用してアプリケーションを作成
-    app = create_app(CustomTestConfig())
-    
-    # 使用されるデータベースURIを確認
-    print(f"[app fixture] Database URI: {app.config['SQLALCHEMY_DATABASE_URI']}")
-    print(f"[app fixture] TESTING: {app.config['TESTING']}")
-    
+    """テスト用のアプリケーションインスタンスを作成"""
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+
     with app.app_context():
-        # テスト用データベースの初期化
-        db.drop_all()  # 既存のテーブルを削除
-        db.create_all()  # テーブルを再作成
-        
-        # テーブルが作成されたことを確認
-        tables = db.engine.table_names()
-        print(f"[app fixture] Created tables: {tables}")
-        
         yield app
-        db.session.remove()
+        db.session.rollback()
+
+@pytest.fixture(autouse=True)
+def setup_test_transaction(request):
+    """アプリケーションを使うテストの前に全てのテーブルを空にし、テスト後にロールバックする"""
+    if 'app' not in request.fixturenames:
+        yield
+        return
+    # テストファイルで上書きした app も含め、テストが使うアプリケーションのデータベースを空にする
+    app = request.getfixturevalue('app')
+    with app.app_context():
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+    try:
+        yield
+    finally:
+        # テストの終了後にバックグラウンドの送信がログを出したりDBに触れたりしないよう止める
+        outbox_dispatcher.stop()
+        with app.app_context():
+            db.session.rollback()
+            db.session.remove()
 
 @pytest.fixture
 def client(app):
     """テスト用のクライアントを作成"""
     return app.test_client()
 
-@pytest.fixture(autouse=True)
-def setup_test_transaction():
-    """各テストの前にトランザクションを開始し、テスト後にロールバックする"""
-    # テーブルをクリーンアップ
-    for table in reversed(db.metadata.sorted_tables):
-        db.session.execute(table.delete())
-    db.session.commit()
+@pytest.fixture
+def test_user(app):
+    """テスト用のユーザーを作成"""
+    with app.app_context():
+        user = User(
+            id='test-user-id',
+            username='testuser',
+            password_hash='dummy_hash',
+            created_at=datetime.now(UTC),
+            updated_at=datetime.now(UTC)
+        )
+        db.session.add(user)
+        db.session.commit()
+        return user.id
 
-    try:
-        yield
-    finally:
-        db.session.rollback()
-        db.session.remove()
+@pytest.fixture
+def test_channel(app, test_user):
+    """テスト用のチャンネルを作成"""
+    with app.app_context():
+        channel = Channel(
+            id='test-channel-id',
+            name='testchannel',
+            created_by=test_user,
+            created_at=datetime.now(UTC),
+            updated_at=datetime.now(UTC)
+        )
+        db.session.add(channel)
+        db.session.commit()
+        return channel.id
 
 @pytest.fixture
-def auth_client(client, app):
+def auth_client(client, test_user, app):
     """認証済みのテストクライアント"""
-    from flask_login import login_user
-    from app.models.user import User
-    
-    # テスト用ユーザーを作成
     with app.app_context():
-        # まず既存のユーザーを確認
-        user = User.query.filter_by(username='testuser').first()
-        if not user:
-            # ユーザーが存在しない場合は作成
-            user = User(
-                id='test-user-id',
-                username='testuser',
-                password_hash='dummy_hash'
-            )
-            db.session.add(user)
-            db.session.commit()
-        
-        # ユーザーをログイン状態にする
+        user = db.session.get(User, test_user)
         with client.session_transaction() as session:
             session['user_id'] = user.id
-            
-        # Flask-Loginでログイン
-        with app.test_request_context():
-            login_user(user)
-            client.get('/')  # セッションを確立するための呼び出し
-            
-    return client 
\ No newline at end of file
+            session['username'] = user.username
+    return client
+
+@pytest.fixture
+def api_headers():
+    """APIリクエスト用のヘッダー"""
+    return {'X-Requested-With': 'XMLHttpRequest'}
+
+@pytest.fixture
+def socket_client(app, auth_client):
+    """ログイン済みセッションのSocketIOテストクライアント"""
+    socket_client = SocketIOTestClient(app, socketio, flask_test_client=auth_client)
+    yield socket_client
+    socket_client.disconnect()
+
+@pytest.fixture
+def other_socket_client(app, test_channel):
+    """別のユーザーのSocketIOテストクライアント"""
+    with app.app_context():
+        user = User(id='other-user-id', username='otheruser', password_hash='dummy_hash')
+        db.session.add(user)
+        db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 'other-user-id'
+        session['username'] = 'otheruser'
+    socket_client = SocketIOTestClient(app, socketio, flask_test_client=client)
+    yield socket_client
+    if socket_client.is_connected():
+        socket_client.disconnect()
+
+@pytest.fixture
+def foreign_keys(app):
+    """SQLiteでも外部キー制約を検査する（MySQL・PostgreSQLと同じ動作にする）"""
+    def enable(dbapi_connection, connection_record):
+        dbapi_connection.execute('PRAGMA foreign_keys=ON')
+
+    event.listen(db.engine, 'connect', enable)
+    db.session.remove()
+    db.engine.dispose()
+    yield
+    event.remove(db.engine, 'connect', enable)
+    db.session.remove()
+    db.engine.dispose()
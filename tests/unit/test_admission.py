@@ -0,0 +1,65 @@
+import json
+import time
+import pytest
+from app.metrics import metrics
+from app.realtime.admission import ConnectAdmission, TokenBucket, connect_admission
+
+@pytest.fixture
+def limited_admission(app):
+    """1件だけ受け付け、以降は断る設定にする"""
+    connect_admission.configure(0.01, 1, 2)
+    yield connect_admission
+    connect_admission.configure(
+        app.config['SOCKETIO_CONNECT_RATE'],
+        app.config['SOCKETIO_CONNECT_BURST'],
+        app.config['SOCKETIO_RECONNECT_WINDOW_SECONDS']
+    )
+
+def test_token_bucket():
+    """上限まで連続して取得でき、以降は補充されるまでの時間を返すことのテスト"""
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    wait = bucket.take()
+    assert 0 < wait <= 0.1
+
+    time.sleep(0.15)
+    assert bucket.take() == 0
+
+def test_retry_after_is_jittered():
+    """断った接続の待ち時間がジッターで分散されることのテスト"""
+    admission = ConnectAdmission(rate=1, burst=1, window=5)
+    assert admission.admit() is None
+
+    hints = [admission.admit() for _ in range(50)]
+    assert all(0.1 <= hint <= 6 for hint in hints)
+    assert len(set(hints)) > 10
+    assert admission.stats()['burst'] == 1
+
+def test_admission_disabled():
+    """制限しない設定では全ての接続を受け付けることのテスト"""
+    admission = ConnectAdmission(rate=0, burst=0, window=30)
+    assert all(admission.admit() is None for _ in range(1000))
+    assert admission.stats() is None
+
+def polling_connect(client):
+    """Engine.IOのlong-pollingで接続し、Socket.IOの接続の応答を返す"""
+    response = client.get('/socket.io/?EIO=4&transport=polling')
+    sid = json.loads(response.get_data(as_text=True)[1:])['sid']
+    client.post(f'/socket.io/?EIO=4&transport=polling&sid={sid}', data='40')
+    return client.get(f'/socket.io/?EIO=4&transport=polling&sid={sid}').get_data(as_text=True)
+
+def test_connect_refused_with_retry_after(app, auth_client, limited_admission):
+    """受け付けの上限を超えた接続が retry_after 付きで断られることのテスト"""
+    rejected = metrics.snapshot().get('socketio_connects_rejected_total', 0)
+
+    # 40: 接続の受け付け
+    assert polling_connect(auth_client).startswith('40')
+
+    packets = polling_connect(auth_client)
+    # 44: 接続の拒否
+    assert packets.startswith('44')
+    error = json.loads(packets[2:])
+    assert error['message'] == 'busy'
+    assert 0.1 <= error['data']['retry_after'] <= 102
+    assert metrics.snapshot()['socketio_connects_rejected_total'] == rejected + 1
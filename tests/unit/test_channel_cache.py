@@ -0,0 +1,87 @@
+import pytest
+from sqlalchemy import event
+from app import db
+from app.models import Channel
+from app.channel_cache import channel_cache
+from datetime import datetime, UTC
+
+@pytest.fixture
+def test_channels(app, test_user):
+    """デフォルトチャンネルと通常のチャンネルを作成"""
+    with app.app_context():
+        for channel_id, name in [('general-id', 'general'), ('test-channel-id', 'testchannel')]:
+            db.session.add(Channel(
+                id=channel_id,
+                name=name,
+                created_by=test_user,
+                created_at=datetime.now(UTC),
+                updated_at=datetime.now(UTC)
+            ))
+        db.session.commit()
+        channel_cache.invalidate()
+        return ['general-id', 'test-channel-id']
+
+def count_channel_queries(func):
+    """関数の実行中に発行されたchannelsテーブルへのSQLの数を数える"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM channels' in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        func()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return len(statements)
+
+def test_cached_reads_without_query(auth_client, test_channels, app, api_headers):
+    """キャッシュ読み込み後はチャンネル一覧の取得でクエリが発行されないことのテスト"""
+    with app.app_context():
+        auth_client.get('/chat/messages', headers=api_headers)
+
+        count = count_channel_queries(
+            lambda: auth_client.get('/chat/messages', headers=api_headers)
+        )
+        assert count == 0
+        assert channel_cache.default_channel_id() == 'general-id'
+        assert [ch.name for ch in channel_cache.list()] == ['general', 'testchannel']
+
+def test_create_channel_invalidates(auth_client, test_channels, app, api_headers):
+    """チャンネル作成でキャッシュが更新されることのテスト"""
+    with app.app_context():
+        channel_cache.list()
+        version = channel_cache.version
+
+        response = auth_client.post('/chat/channels/create', data={'name': 'newchannel'}, headers=api_headers)
+        assert response.status_code == 200
+
+        assert channel_cache.version > version
+        assert 'newchannel' in [ch.name for ch in channel_cache.list()]
+
+def test_edit_and_delete_channel_invalidate(auth_client, test_channels, app, api_headers):
+    """チャンネル編集・削除でキャッシュが更新されることのテスト"""
+    with app.app_context():
+        auth_client.post('/chat/channels/test-channel-id/edit', data={'name': 'renamed'}, headers=api_headers)
+        assert channel_cache.get('test-channel-id').name == 'renamed'
+
+        auth_client.post('/chat/channels/test-channel-id/delete', headers=api_headers)
+        assert channel_cache.get('test-channel-id') is None
+
+def test_uncached_channel_falls_back_to_db(auth_client, test_channels, test_user, app, api_headers):
+    """キャッシュに無いチャンネルもDBから取得できることのテスト"""
+    with app.app_context():
+        channel_cache.list()
+        db.session.add(Channel(
+            id='other-channel-id',
+            name='other',
+            created_by=test_user,
+            created_at=datetime.now(UTC),
+            updated_at=datetime.now(UTC)
+        ))
+        db.session.commit()
+
+        response = auth_client.get('/chat/messages/other-channel-id', headers=api_headers)
+        assert response.status_code == 200
+        assert response.get_json()['current_channel']['name'] == 'other'
@@ -0,0 +1,97 @@
+import pytest
+from app import db
+from app.channel_cache import channel_cache
+from app.models import Channel
+from app.outbox import outbox_dispatcher
+from datetime import datetime, UTC
+
+@pytest.fixture
+def other_channel(app, test_user):
+    """別のテスト用チャンネルを作成"""
+    with app.app_context():
+        channel = Channel(
+            id='other-channel-id',
+            name='otherchannel',
+            created_by=test_user,
+            created_at=datetime.now(UTC),
+            updated_at=datetime.now(UTC)
+        )
+        db.session.add(channel)
+        db.session.commit()
+        return channel.id
+
+def send(client, channel_id, content, headers):
+    """メッセージを送信し、アウトボックスのイベントを配信する"""
+    response = client.post('/chat/send', data={
+        'message': content,
+        'channel_id': channel_id
+    }, headers=headers)
+    assert response.status_code == 200
+    outbox_dispatcher.flush()
+
+def received_channels(socket_client):
+    """受信したnew_messageイベントのチャンネルIDを返す"""
+    return [r['args'][0]['channel_id'] for r in socket_client.get_received() if r['name'] == 'new_message']
+
+def test_events_only_reach_joined_channel(socket_client, auth_client, test_channel, other_channel, app, api_headers):
+    """参加したチャンネルのイベントだけを受信することのテスト"""
+    with app.app_context():
+        ack = socket_client.emit('join_channel', {'channel_id': test_channel}, callback=True)
+        assert ack == {'status': 'joined', 'online': ['test-user-id']}
+        socket_client.get_received()
+
+        send(auth_client, test_channel, '参加中のチャンネル', api_headers)
+        send(auth_client, other_channel, '別のチャンネル', api_headers)
+        assert received_channels(socket_client) == [test_channel]
+
+def test_join_switches_channel(socket_client, auth_client, test_channel, other_channel, app, api_headers):
+    """別のチャンネルに参加すると元のチャンネルのイベントを受信しなくなることのテスト"""
+    with app.app_context():
+        socket_client.emit('join_channel', {'channel_id': test_channel})
+        socket_client.emit('join_channel', {'channel_id': other_channel})
+        socket_client.get_received()
+
+        send(auth_client, test_channel, '元のチャンネル', api_headers)
+        send(auth_client, other_channel, '新しいチャンネル', api_headers)
+        assert received_channels(socket_client) == [other_channel]
+
+        socket_client.emit('leave_channel', {'channel_id': other_channel})
+        send(auth_client, other_channel, '退出後', api_headers)
+        assert received_channels(socket_client) == []
+
+def test_join_unknown_channel(socket_client, app):
+    """存在しないチャンネルには参加できないことのテスト"""
+    with app.app_context():
+        ack = socket_client.emit('join_channel', {'channel_id': 'missing'}, callback=True)
+        assert ack['status'] == 'error'
+
+@pytest.mark.parametrize('payload', ['channel', ['channel'], 1, {'channel_id': ['channel']}])
+def test_invalid_payload(socket_client, test_channel, app, payload):
+    """辞書でないデータや文字列でないチャンネルIDの場合もチャンネルがない場合と同じ応答を返すことのテスト"""
+    with app.app_context():
+        ack = socket_client.emit('join_channel', payload, callback=True)
+        assert ack == {'status': 'error', 'message': 'チャンネルが見つかりません'}
+        ack = socket_client.emit('leave_channel', payload, callback=True)
+        assert ack == {'status': 'left'}
+        ack = socket_client.emit('resume', payload, callback=True)
+        assert ack == {'status': 'error', 'message': 'last_seqが不正です'}
+        if isinstance(payload, dict):
+            ack = socket_client.emit('resume', dict(payload, last_seq=0), callback=True)
+            assert ack == {'status': 'error', 'message': 'チャンネルが見つかりません'}
+
+def test_join_channel_created_on_other_worker(socket_client, test_user, app):
+    """キャッシュにないチャンネル（他のワーカーで作成）にもDBを確認して参加・再開できることのテスト"""
+    with app.app_context():
+        channel_cache.list()
+        db.session.add(Channel(id='new-channel-id', name='newchannel', created_by=test_user))
+        db.session.commit()
+
+        ack = socket_client.emit('join_channel', {'channel_id': 'new-channel-id'}, callback=True)
+        assert ack['status'] == 'joined'
+
+        channel_cache.list()
+        db.session.add(Channel(id='resumed-channel-id', name='resumedchannel', created_by=test_user))
+        db.session.commit()
+
+        ack = socket_client.emit('resume', {'channel_id': 'resumed-channel-id', 'last_seq': 0}, callback=True)
+        assert ack['status'] != 'error'
@@ -0,0 +1,218 @@
+import base64
+import gzip
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+import zlib
+from types import SimpleNamespace
+import pytest
+from app import socketio
+from app.realtime import publish_channel_event
+from app.realtime.compression import configure_compression
+
+def open_polling(client, channel_id):
+    """long-pollingで接続してチャンネルに参加し、Engine.IOのsidを返す"""
+    response = client.get('/socket.io/?EIO=4&transport=polling')
+    sid = json.loads(response.get_data(as_text=True)[1:])['sid']
+    client.post(f'/socket.io/?EIO=4&transport=polling&sid={sid}', data='40')
+    client.get(f'/socket.io/?EIO=4&transport=polling&sid={sid}')
+    client.post(f'/socket.io/?EIO=4&transport=polling&sid={sid}',
+                data='421' + json.dumps(['join_channel', {'channel_id': channel_id}]))
+    client.get(f'/socket.io/?EIO=4&transport=polling&sid={sid}')
+    return sid
+
+def poll_message(client, sid, channel_id):
+    publish_channel_event('new_message', {'id': 'compressed', 'content': 'あ' * 200, 'channel_id': channel_id}, channel_id)
+    return client.get(f'/socket.io/?EIO=4&transport=polling&sid={sid}', headers={'Accept-Encoding': 'gzip'})
+
+def test_polling_response_compressed(app, auth_client, test_channel):
+    """閾値以上のlong-pollingの応答が圧縮されることのテスト"""
+    sid = open_polling(auth_client, test_channel)
+    response = poll_message(auth_client, sid, test_channel)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'compressed' in gzip.decompress(response.get_data()).decode()
+
+def test_polling_compression_disabled(app, auth_client, test_channel):
+    """圧縮を無効にした場合は圧縮しないことのテスト"""
+    configure_compression(socketio.server, False, 128)
+    sid = open_polling(auth_client, test_channel)
+    response = poll_message(auth_client, sid, test_channel)
+    assert 'Content-Encoding' not in response.headers
+    assert 'compressed' in response.get_data(as_text=True)
+
+def test_websocket_deflate_threshold(app):
+    """閾値未満のWebSocketのメッセージは圧縮せず、圧縮の状態も進めないことのテスト"""
+    pytest.importorskip('eventlet')
+    from app.realtime.compression import _threshold_websocket
+    from eventlet.websocket import RFC6455WebSocket
+
+    websocket = _threshold_websocket(True, 128)(lambda ws: None, socketio.server.eio)
+    assert websocket._negotiate_permessage_deflate({'permessage-deflate': [{}]}) is not None
+    disabled = _threshold_websocket(False, 128)(lambda ws: None, socketio.server.eio)
+    assert disabled._negotiate_permessage_deflate({'permessage-deflate': [{}]}) is None
+
+    ws = websocket.wrap(RFC6455WebSocket(None, {}, extensions={'permessage-deflate': {}}))
+    # RSV1（0x40）が圧縮したメッセージの印
+    assert ws._pack_message('3')[0] & 0x40 == 0
+    large = '42' + json.dumps(['new_message', {'content': 'あ' * 100}])
+    first = ws._pack_message(large)
+    assert first[0] & 0x40
+    # 同じ内容の2回目は圧縮の状態を引き継いでさらに小さくなる
+    assert len(ws._pack_message(large)) < len(first) < len(large.encode())
+
+def fake_eventlet_server(drivers):
+    """async_mode が eventlet の Socket.IO のサーバーの代わり"""
+    return SimpleNamespace(eio=SimpleNamespace(async_mode='eventlet', _async=drivers),
+                           logger=logging.getLogger('test_compression'))
+
+def test_websocket_threshold_applied(app):
+    """eventlet で動かす場合はこのサーバーの WebSocket だけを差し替えることのテスト"""
+    pytest.importorskip('eventlet')
+    stock = object()
+    drivers = {'websocket': stock}
+    server = fake_eventlet_server(drivers)
+    configure_compression(server, True, 128)
+    assert server.eio._async['websocket'] is not stock
+    # モジュール共通の辞書は書き換えない
+    assert drivers == {'websocket': stock}
+
+@pytest.mark.parametrize('owner, name', [
+    ('eventlet.websocket.RFC6455WebSocket', '_pack_message'),
+    ('eventlet.websocket.RFC6455WebSocket', '_get_permessage_deflate_enc'),
+    ('engineio.async_drivers.eventlet.WebSocketWSGI', '_handle_hybi_request'),
+    ('engineio.async_drivers.eventlet.WebSocketWSGI', '_negotiate_permessage_deflate'),
+])
+def test_websocket_falls_back_without_internals(app, monkeypatch, caplog, owner, name):
+    """置き換えるメソッドがない eventlet・python-engineio では標準の WebSocket のまま警告することのテスト"""
+    pytest.importorskip('eventlet')
+    monkeypatch.setattr(f'{owner}.{name}', None)
+    stock = object()
+    server = fake_eventlet_server({'websocket': stock})
+    with caplog.at_level(logging.WARNING, logger='test_compression'):
+        configure_compression(server, True, 128)
+    assert server.eio._async == {'websocket': stock}
+    assert 'WebSocketの圧縮の設定を適用できません' in caplog.text
+    assert server.eio.http_compression is True
+
+def test_websocket_falls_back_without_driver_table(app, caplog):
+    """ドライバーの設定の形が変わった場合も標準の動作のまま警告することのテスト"""
+    pytest.importorskip('eventlet')
+    server = fake_eventlet_server(None)
+    with caplog.at_level(logging.WARNING, logger='test_compression'):
+        configure_compression(server, True, 128)
+    assert server.eio._async is None
+    assert 'WebSocketの圧縮の設定を適用できません' in caplog.text
+
+EVENTLET_SERVER = """
+import sys
+import eventlet
+eventlet.monkey_patch()
+from config import Config
+from app import create_app, socketio
+
+class CompressionConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SOCKETIO_COMPRESSION_THRESHOLD = 128
+
+app = create_app(CompressionConfig)
+
+@socketio.on('echo')
+def echo(data):
+    return data
+
+socketio.run(app, host='127.0.0.1', port=int(sys.argv[1]))
+"""
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def open_websocket(port):
+    """permessage-deflate を提示して WebSocket で接続し、ソケットと応答のヘッダーを返す"""
+    deadline = time.monotonic() + 15
+    while True:
+        try:
+            sock = socket.create_connection(('127.0.0.1', port), timeout=5)
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall((
+        'GET /socket.io/?EIO=4&transport=websocket HTTP/1.1\r\n'
+        f'Host: 127.0.0.1:{port}\r\n'
+        'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+        f'Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n'
+        'Sec-WebSocket-Extensions: permessage-deflate\r\n\r\n'
+    ).encode())
+    headers = b''
+    while b'\r\n\r\n' not in headers:
+        headers += sock.recv(1)
+    return sock, headers.decode()
+
+def recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        assert chunk, 'WebSocketが切断されました'
+        data += chunk
+    return data
+
+def recv_frame(sock):
+    """サーバーからのフレームを1つ読み、(圧縮されていたか, ペイロード) を返す"""
+    first, second = recv_exact(sock, 2)
+    size = second & 0x7f
+    if size == 126:
+        size = int.from_bytes(recv_exact(sock, 2), 'big')
+    elif size == 127:
+        size = int.from_bytes(recv_exact(sock, 8), 'big')
+    return bool(first & 0x40), recv_exact(sock, size)
+
+def send_text(sock, text):
+    """クライアントからのテキストのフレームを（マスクして）送る"""
+    payload = text.encode()
+    mask = os.urandom(4)
+    header = bytes([0x81])
+    if len(payload) < 126:
+        header += bytes([0x80 | len(payload)])
+    else:
+        header += bytes([0x80 | 126]) + len(payload).to_bytes(2, 'big')
+    sock.sendall(header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+
+def test_websocket_threshold_on_eventlet_server(tmp_path):
+    """eventlet のサーバーの WebSocket で閾値以上のメッセージだけが圧縮されることのテスト"""
+    pytest.importorskip('eventlet')
+    script = tmp_path / 'server.py'
+    script.write_text(EVENTLET_SERVER)
+    port = free_port()
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+    server = subprocess.Popen([sys.executable, str(script), str(port)], cwd=root, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        sock, headers = open_websocket(port)
+        assert 'permessage-deflate' in headers
+        with sock:
+            recv_frame(sock)  # Engine.IO の open
+            send_text(sock, '40')
+            recv_frame(sock)  # Socket.IO の接続
+            send_text(sock, '421' + json.dumps(['echo', 'x']))
+            compressed, payload = recv_frame(sock)
+            assert not compressed
+            assert payload.decode() == '431["x"]'
+
+            large = 'あ' * 100
+            send_text(sock, '422' + json.dumps(['echo', large]))
+            compressed, payload = recv_frame(sock)
+            assert compressed
+            message = zlib.decompressobj(-zlib.MAX_WBITS).decompress(payload + b'\x00\x00\xff\xff')
+            assert json.loads(message.decode()[3:]) == [large]
+    finally:
+        server.terminate()
+        server.wait(10)
@@ -0,0 +1,228 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+import pytest
+from config import Config
+from app import create_app, db
+from app.auth import create_user
+from app.models import Channel
+from app.realtime import publish_channel_event
+from app.realtime.fanout import create_client_manager, IPCManager
+from app.realtime.send_queue import SendQueueManager
+from socketio import PubSubManager
+from datetime import datetime, UTC
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+BROKER_SCRIPT = '''
+import sys
+from app.realtime.broker import IPCBroker
+IPCBroker(sys.argv[1]).serve_forever()
+'''
+
+# 別プロセスのワーカーとしてアプリを起動する（本番のeventletワーカーと同様にmonkey patchを当てる）
+WORKER_SCRIPT = '''
+import sys
+try:
+    import eventlet
+    eventlet.monkey_patch()
+except ImportError:
+    pass
+from config import Config
+from app import create_app, socketio
+
+class FanoutConfig(Config):
+    SOCKETIO_FANOUT_BACKEND = 'ipc'
+    SOCKETIO_IPC_PATH = sys.argv[1]
+
+app = create_app(FanoutConfig)
+socketio.run(app, host='127.0.0.1', port=int(sys.argv[2]), allow_unsafe_werkzeug=True)
+'''
+
+def free_port():
+    """空いているポート番号を返す"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_until(condition, timeout=30):
+    """条件を満たすまで待つ"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+class PollingClient:
+    """Engine.IO（v4）のlong-pollingで接続する最小限のSocket.IOクライアント"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        self.sid = None
+
+    def login(self, username, password):
+        data = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+        request = urllib.request.Request(f'{self.base_url}/login', data=data,
+                                         headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.opener.open(request, timeout=10).read()
+
+    def _url(self):
+        url = f'{self.base_url}/socket.io/?EIO=4&transport=polling&t={time.time()}'
+        if self.sid:
+            url += f'&sid={self.sid}'
+        return url
+
+    def send(self, packet):
+        request = urllib.request.Request(self._url(), data=packet.encode(),
+                                         headers={'Content-Type': 'text/plain;charset=UTF-8'})
+        self.opener.open(request, timeout=10).read()
+
+    def poll(self, timeout=5):
+        """受信したSocket.IOのパケットを返す（pingには応答する）"""
+        try:
+            body = self.opener.open(self._url(), timeout=timeout).read().decode()
+        except (socket.timeout, urllib.error.URLError):
+            return []
+        packets = []
+        for packet in body.split('\x1e'):
+            if packet == '2':
+                self.send('3')
+            elif packet.startswith('0{'):
+                self.sid = json.loads(packet[1:])['sid']
+            elif packet.startswith('4'):
+                packets.append(packet[1:])
+        return packets
+
+    def connect(self):
+        self.poll()
+        self.send('40')
+        assert any(p.startswith('0') for p in self.poll())
+
+    def events(self, timeout=5):
+        """受信したイベントを (名前, 引数) のリストで返す"""
+        events = []
+        for packet in self.poll(timeout):
+            if packet.startswith('2'):
+                name, *args = json.loads(packet[1:])
+                events.append((name, args))
+        return events
+
+@pytest.fixture
+def ipc_path():
+    """ブローカーを別プロセスで起動してソケットのパスを返す"""
+    path = os.path.join(tempfile.mkdtemp(), 'fanout.sock')
+    broker = subprocess.Popen([sys.executable, '-c', BROKER_SCRIPT, path], cwd=ROOT_DIR,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    assert wait_until(lambda: os.path.exists(path))
+    yield path
+    broker.terminate()
+    broker.wait()
+
+@pytest.fixture
+def app(ipc_path):
+    """IPCブローカー経由で中継するアプリケーションインスタンスを作成"""
+    class FanoutConfig(Config):
+        SOCKETIO_FANOUT_BACKEND = 'ipc'
+        SOCKETIO_IPC_PATH = ipc_path
+
+    app = create_app(FanoutConfig)
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        yield app
+        db.session.rollback()
+
+@pytest.fixture
+def test_channel(app):
+    """ログイン可能なユーザーとテスト用のチャンネルを作成"""
+    with app.app_context():
+        user = create_user('fanoutuser', 'password')
+        channel = Channel(
+            id='test-channel-id',
+            name='testchannel',
+            created_by=user.id,
+            created_at=datetime.now(UTC),
+            updated_at=datetime.now(UTC)
+        )
+        db.session.add(channel)
+        db.session.commit()
+        return channel.id
+
+@pytest.fixture
+def worker_url(ipc_path, test_channel):
+    """別プロセスのワーカーを起動してURLを返す"""
+    port = free_port()
+    worker = subprocess.Popen([sys.executable, '-c', WORKER_SCRIPT, ipc_path, str(port)], cwd=ROOT_DIR,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def is_ready():
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    assert wait_until(is_ready)
+    yield f'http://127.0.0.1:{port}'
+    worker.terminate()
+    worker.wait()
+
+def test_create_client_manager():
+    """設定に応じたマネージャーが作成されることのテスト"""
+    manager = create_client_manager({'SOCKETIO_FANOUT_BACKEND': 'local'})
+    assert isinstance(manager, SendQueueManager)
+    assert not isinstance(manager, PubSubManager)
+    manager = create_client_manager({'SOCKETIO_FANOUT_BACKEND': 'ipc', 'SOCKETIO_IPC_PATH': '/tmp/test.sock'})
+    assert isinstance(manager, IPCManager)
+    # 他のワーカーから中継されたイベントも送信キューの上限の確認を通る
+    assert isinstance(manager, SendQueueManager)
+    with pytest.raises(ValueError):
+        create_client_manager({'SOCKETIO_FANOUT_BACKEND': 'unknown'})
+
+def test_event_reaches_other_worker(app, test_channel, worker_url):
+    """このプロセスで送信したイベントが別プロセスのワーカーの接続に届くことのテスト"""
+    with app.app_context():
+        client = PollingClient(worker_url)
+        client.login('fanoutuser', 'password')
+        client.connect()
+        client.send('421' + json.dumps(['join_channel', {'channel_id': test_channel}]))
+        assert any(p.startswith('31') for p in client.poll())
+
+        # 別ワーカーがブローカーに接続するまでは届かないため、受信できるまで送信を繰り返す
+        received = []
+        deadline = time.monotonic() + 30
+        while not received and time.monotonic() < deadline:
+            publish_channel_event('new_message', {'id': 'remote-message', 'channel_id': test_channel}, test_channel)
+            received = [args for name, args in client.events(timeout=1) if name == 'new_message']
+
+        assert received
+        assert received[0] == [{'id': 'remote-message', 'channel_id': test_channel}]
+
+def test_postgres_payload_chunking():
+    """NOTIFYの上限を超えるメッセージが分割・結合されることのテスト"""
+    pytest.importorskip('psycopg2')
+    from app.realtime.fanout import PostgresManager
+    manager = PostgresManager('postgresql+psycopg2://localhost/easychat')
+    assert manager.url == 'postgresql://localhost/easychat'
+
+    payload = '{"data": "' + 'あ' * 5000 + '"}'
+    chunks = manager._split(payload)
+    assert len(chunks) > 1
+    assert all(len(chunk.encode('utf-8')) < 8000 for chunk in chunks)
+
+    partial = {}
+    results = [manager._assemble(chunk, partial) for chunk in chunks]
+    assert results[:-1] == [None] * (len(chunks) - 1)
+    assert results[-1] == payload
+    assert partial == {}
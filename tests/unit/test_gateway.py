@@ -0,0 +1,241 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from http.cookiejar import CookieJar
+import pytest
+from config import Config
+from app import create_app, db
+from app.outbox import outbox_dispatcher
+from app.realtime import publish_channel_event, record_channel_event
+from app.realtime.fanout import create_client_manager
+from app.realtime.replay import replay_buffer
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+BROKER_SCRIPT = '''
+import sys
+from app.realtime.broker import IPCBroker
+IPCBroker(sys.argv[1]).serve_forever()
+'''
+
+# 別プロセスで gateway.py のアプリを起動する（本番のeventletワーカーと同様にmonkey patchを当てる）
+GATEWAY_SCRIPT = '''
+import sys
+try:
+    import eventlet
+    eventlet.monkey_patch()
+except ImportError:
+    pass
+from app import socketio
+from gateway import app
+socketio.run(app, host='127.0.0.1', port=int(sys.argv[1]), allow_unsafe_werkzeug=True)
+'''
+
+def free_port():
+    """空いているポート番号を返す"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_until(condition, timeout=30):
+    """条件を満たすまで待つ"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+class PollingClient:
+    """Engine.IO（v4）のlong-pollingで接続する最小限のSocket.IOクライアント"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        self.sid = None
+
+    def _url(self):
+        url = f'{self.base_url}/socket.io/?EIO=4&transport=polling&t={time.time()}'
+        if self.sid:
+            url += f'&sid={self.sid}'
+        return url
+
+    def send(self, packet):
+        request = urllib.request.Request(self._url(), data=packet.encode(),
+                                         headers={'Content-Type': 'text/plain;charset=UTF-8'})
+        self.opener.open(request, timeout=10).read()
+
+    def poll(self, timeout=5):
+        """受信したSocket.IOのパケットを返す（pingには応答する）"""
+        try:
+            body = self.opener.open(self._url(), timeout=timeout).read().decode()
+        except (socket.timeout, urllib.error.URLError):
+            return []
+        packets = []
+        for packet in body.split('\x1e'):
+            if packet == '2':
+                self.send('3')
+            elif packet.startswith('0{'):
+                self.sid = json.loads(packet[1:])['sid']
+            elif packet.startswith('4'):
+                packets.append(packet[1:])
+        return packets
+
+    def connect(self):
+        self.poll()
+        self.send('40')
+        assert any(p.startswith('0') for p in self.poll())
+
+    def events(self, timeout=5):
+        """受信したイベントを (名前, 引数) のリストで返す"""
+        events = []
+        for packet in self.poll(timeout):
+            if packet.startswith('2'):
+                name, *args = json.loads(packet[1:])
+                events.append((name, args))
+        return events
+
+@pytest.fixture
+def ipc_path():
+    """ブローカーを別プロセスで起動してソケットのパスを返す"""
+    path = os.path.join(tempfile.mkdtemp(), 'gateway.sock')
+    broker = subprocess.Popen([sys.executable, '-c', BROKER_SCRIPT, path], cwd=ROOT_DIR,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    assert wait_until(lambda: os.path.exists(path))
+    yield path
+    broker.terminate()
+    broker.wait()
+
+def make_app(ipc_path, role):
+    class RoleConfig(Config):
+        SOCKETIO_FANOUT_BACKEND = 'ipc'
+        SOCKETIO_IPC_PATH = ipc_path
+        REALTIME_ROLE = role
+
+    app = create_app(RoleConfig)
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    return app
+
+@pytest.fixture
+def app(ipc_path):
+    """HTTP専用のワーカー（REALTIME_ROLE=http）として動くアプリケーションインスタンスを作成"""
+    app = make_app(ipc_path, 'http')
+    with app.app_context():
+        yield app
+        db.session.rollback()
+
+@pytest.fixture
+def gateway_url(ipc_path, test_channel):
+    """gateway.py を別プロセスで起動してURLを返す"""
+    port = free_port()
+    env = dict(os.environ, SOCKETIO_IPC_PATH=ipc_path)
+    gateway = subprocess.Popen([sys.executable, '-c', GATEWAY_SCRIPT, str(port)], cwd=ROOT_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def is_ready():
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    assert wait_until(is_ready)
+    yield f'http://127.0.0.1:{port}'
+    gateway.terminate()
+    gateway.wait()
+
+def test_create_client_manager_roles():
+    """役割に応じて中継からの受信の有無が切り替わることのテスト"""
+    config = {'SOCKETIO_FANOUT_BACKEND': 'ipc', 'SOCKETIO_IPC_PATH': '/tmp/test.sock'}
+    assert not create_client_manager(config).write_only
+    assert create_client_manager(dict(config, REALTIME_ROLE='http')).write_only
+    assert not create_client_manager(dict(config, REALTIME_ROLE='gateway')).write_only
+
+    # 中継なしではゲートウェイにイベントが届かない
+    with pytest.raises(ValueError):
+        create_client_manager({'SOCKETIO_FANOUT_BACKEND': 'local', 'REALTIME_ROLE': 'gateway'})
+    with pytest.raises(ValueError):
+        create_client_manager(dict(config, REALTIME_ROLE='unknown'))
+
+def test_record_channel_event():
+    """クライアントマネージャーが送信した連番付きのイベントだけが再送用に記録されることのテスト"""
+    replay_buffer.configure(16, 16)
+    record_channel_event('new_message', {'id': 'm1', 'seq': 1}, 'channel:record-channel')
+    record_channel_event('typing_update', {'users': []}, 'channel:record-channel')
+    record_channel_event('new_message', {'id': 'm2', 'seq': 1}, 'some-sid')
+    assert replay_buffer.since('record-channel', 0) == [(1, 'new_message', {'id': 'm1', 'seq': 1})]
+
+def test_http_worker_rejects_socket_connections(app, test_user):
+    """HTTP専用のワーカーがSocket.IOの接続を受け付けないことのテスト"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = test_user
+    response = client.get('/socket.io/?EIO=4&transport=polling')
+    sid = json.loads(response.get_data(as_text=True)[1:])['sid']
+    client.post(f'/socket.io/?EIO=4&transport=polling&sid={sid}', data='40')
+    packets = client.get(f'/socket.io/?EIO=4&transport=polling&sid={sid}').get_data(as_text=True)
+    # 44: 接続の拒否
+    assert packets.startswith('44')
+
+def test_http_worker_refuses_event_streams(auth_client, test_channel):
+    """HTTP専用のワーカーがイベントの届かないSSE・long-pollingに404を返すことのテスト"""
+    assert auth_client.get(f'/chat/channels/{test_channel}/stream').status_code == 404
+    assert auth_client.get(f'/chat/channels/{test_channel}/poll?since=0').status_code == 404
+    assert auth_client.get(f'/chat/channels/{test_channel}/changes?since=0').status_code == 200
+
+def test_gateway_serves_only_realtime_endpoints(ipc_path, test_channel, test_user):
+    """ゲートウェイがSSE・long-polling・メトリクス以外のページに404を返すことのテスト"""
+    gateway = make_app(ipc_path, 'gateway')
+    client = gateway.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = test_user
+        session['username'] = 'testuser'
+
+    assert client.get('/').status_code == 404
+    assert client.get('/login').status_code == 404
+    assert client.get('/chat/').status_code == 404
+    assert client.get('/metrics').status_code == 200
+
+    gateway.config['LONG_POLL_TIMEOUT_SECONDS'] = 0
+    response = client.get(f'/chat/channels/{test_channel}/poll?since=0')
+    assert response.status_code == 200
+
+    response = client.get(f'/chat/channels/{test_channel}/stream', buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    response.close()
+
+def test_message_from_http_worker_reaches_gateway(app, auth_client, test_channel, gateway_url):
+    """HTTP専用のワーカーで投稿したメッセージがゲートウェイの接続に届くことのテスト"""
+    client = PollingClient(gateway_url)
+    client.opener.addheaders.append(('Cookie', f"session={auth_client.get_cookie('session').value}"))
+    client.connect()
+    client.send('421' + json.dumps(['join_channel', {'channel_id': test_channel}]))
+    assert any(p.startswith('31') for p in client.poll())
+
+    # ゲートウェイがブローカーに接続するまでは届かないため、受信できるまで送信を繰り返す
+    ready = []
+    deadline = time.monotonic() + 30
+    while not ready and time.monotonic() < deadline:
+        publish_channel_event('gateway_ready', {'channel_id': test_channel}, test_channel)
+        ready = [args for name, args in client.events(timeout=1) if name == 'gateway_ready']
+    assert ready
+
+    response = auth_client.post('/chat/send', data={'channel_id': test_channel, 'message': 'ゲートウェイ経由'},
+                                headers={'X-Requested-With': 'XMLHttpRequest'})
+    assert response.status_code == 200
+    outbox_dispatcher.flush()
+
+    received = []
+    deadline = time.monotonic() + 10
+    while not received and time.monotonic() < deadline:
+        received = [args for name, args in client.events(timeout=1) if name == 'new_message']
+    assert received
+    assert received[0][0]['content'] == 'ゲートウェイ経由'
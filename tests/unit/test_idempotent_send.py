@@ -0,0 +1,123 @@
+from app import db
+from app.models import Message, MessageIdempotencyKey
+from app.messaging import prune_idempotency_keys
+from app.outbox import outbox_dispatcher
+from datetime import datetime, timedelta
+
+def test_http_retry_returns_same_message(auth_client, test_channel, api_headers, app):
+    """同じ送信キーで再送した場合に保存済みのメッセージが返されることのテスト"""
+    with app.app_context():
+        data = {'message': '再送テスト', 'channel_id': test_channel, 'client_message_id': 'key-1'}
+        first = auth_client.post('/chat/send', data=data, headers=api_headers)
+        second = auth_client.post('/chat/send', data=data, headers=api_headers)
+
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert first.get_json()['data']['id'] == second.get_json()['data']['id']
+        assert Message.query.filter_by(channel_id=test_channel).count() == 1
+        assert MessageIdempotencyKey.query.count() == 1
+
+def test_idempotency_key_header(auth_client, test_channel, api_headers, app):
+    """Idempotency-Key ヘッダーでも送信キーを指定できることのテスト"""
+    with app.app_context():
+        headers = dict(api_headers, **{'Idempotency-Key': 'header-key'})
+        data = {'message': 'ヘッダーテスト', 'channel_id': test_channel}
+        first = auth_client.post('/chat/send', data=data, headers=headers)
+        second = auth_client.post('/chat/send', data=data, headers=headers)
+
+        assert first.get_json()['data']['id'] == second.get_json()['data']['id']
+        assert Message.query.filter_by(channel_id=test_channel).count() == 1
+
+def test_different_keys_create_messages(auth_client, test_channel, api_headers, app):
+    """送信キーが異なる場合は別のメッセージとして保存されることのテスト"""
+    with app.app_context():
+        for key in ('key-a', 'key-b'):
+            auth_client.post('/chat/send', data={
+                'message': '同じ内容', 'channel_id': test_channel, 'client_message_id': key
+            }, headers=api_headers)
+        assert Message.query.filter_by(channel_id=test_channel).count() == 2
+
+def test_socket_retry_after_http(socket_client, auth_client, test_channel, api_headers, app):
+    """WebSocketとHTTPで同じ送信キーを使った場合も1件だけ保存されることのテスト"""
+    with app.app_context():
+        ack = socket_client.emit('send_message', {
+            'channel_id': test_channel,
+            'message': 'タイムアウト後の再送',
+            'client_message_id': 'shared-key'
+        }, callback=True)
+        response = auth_client.post('/chat/send', data={
+            'message': 'タイムアウト後の再送', 'channel_id': test_channel, 'client_message_id': 'shared-key'
+        }, headers=api_headers)
+
+        assert ack['status'] == 'success'
+        assert response.get_json()['data']['id'] == ack['data']['id']
+        assert Message.query.filter_by(channel_id=test_channel).count() == 1
+
+def test_socket_retry_not_broadcast_twice(socket_client, test_channel, app):
+    """再送したメッセージが再び配信されないことのテスト"""
+    with app.app_context():
+        socket_client.emit('join_channel', {'channel_id': test_channel})
+        payload = {'channel_id': test_channel, 'message': '配信テスト', 'client_message_id': 'broadcast-key'}
+        socket_client.emit('send_message', payload, callback=True)
+        socket_client.emit('send_message', payload, callback=True)
+        outbox_dispatcher.flush()
+
+        received = [p for p in socket_client.get_received() if p['name'] == 'new_message']
+        assert len(received) == 1
+
+def test_invalid_key_rejected(auth_client, test_channel, api_headers, app):
+    """不正な送信キーが拒否されることのテスト"""
+    with app.app_context():
+        response = auth_client.post('/chat/send', data={
+            'message': 'テスト', 'channel_id': test_channel, 'client_message_id': 'bad key!'
+        }, headers=api_headers)
+
+        assert response.status_code == 400
+        assert Message.query.filter_by(channel_id=test_channel).count() == 0
+
+def test_expired_key_allows_new_message(auth_client, test_user, test_channel, api_headers, app):
+    """期限切れの送信キーでは新しいメッセージとして保存されることのテスト"""
+    with app.app_context():
+        data = {'message': '期限切れテスト', 'channel_id': test_channel, 'client_message_id': 'old-key'}
+        first = auth_client.post('/chat/send', data=data, headers=api_headers).get_json()['data']['id']
+
+        sent = db.session.get(MessageIdempotencyKey, (test_user, 'old-key'))
+        sent.created_at = datetime.utcnow() - timedelta(seconds=app.config['MESSAGE_IDEMPOTENCY_WINDOW_SECONDS'] + 1)
+        db.session.commit()
+
+        second = auth_client.post('/chat/send', data=data, headers=api_headers).get_json()['data']['id']
+        assert first != second
+        assert db.session.get(MessageIdempotencyKey, (test_user, 'old-key')).message_id == second
+
+def test_retry_after_delete(auth_client, test_channel, api_headers, app):
+    """送信後に削除されたメッセージを再送した場合にエラーになることのテスト"""
+    with app.app_context():
+        data = {'message': '削除テスト', 'channel_id': test_channel, 'client_message_id': 'deleted-key'}
+        message_id = auth_client.post('/chat/send', data=data, headers=api_headers).get_json()['data']['id']
+        auth_client.post(f'/chat/messages/{message_id}/delete', headers=api_headers)
+
+        response = auth_client.post('/chat/send', data=data, headers=api_headers)
+        assert response.status_code == 400
+        assert Message.query.filter_by(channel_id=test_channel).count() == 0
+
+def test_prune_idempotency_keys(test_user, app):
+    """期限切れの送信キーだけが削除されることのテスト"""
+    with app.app_context():
+        expired_at = datetime.utcnow() - timedelta(seconds=app.config['MESSAGE_IDEMPOTENCY_WINDOW_SECONDS'] + 1)
+        db.session.add(MessageIdempotencyKey(user_id=test_user, key='expired', message_id='m1', created_at=expired_at))
+        db.session.add(MessageIdempotencyKey(user_id=test_user, key='fresh', message_id='m2'))
+        db.session.commit()
+
+        assert prune_idempotency_keys(force=True) == 1
+        assert db.session.get(MessageIdempotencyKey, (test_user, 'expired')) is None
+        assert db.session.get(MessageIdempotencyKey, (test_user, 'fresh')) is not None
+
+def test_socket_non_string_key(socket_client, test_channel, app):
+    """WebSocketで文字列以外の送信キーを送った場合に検証エラーになることのテスト"""
+    with app.app_context():
+        for key in (123, ['key'], {'key': 'value'}):
+            ack = socket_client.emit('send_message', {
+                'channel_id': test_channel, 'message': 'こんにちは', 'client_message_id': key
+            }, callback=True)
+            assert ack == {'status': 'error', 'message': '送信キーが不正です'}
+        assert Message.query.count() == 0
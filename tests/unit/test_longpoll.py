@@ -0,0 +1,100 @@
+import threading
+import time
+import pytest
+from app import db
+from app.models import Channel
+from app.outbox import outbox_dispatcher
+from app.realtime import publish_channel_event
+from app.realtime.longpoll import channel_waiters
+
+@pytest.fixture
+def app(app):
+    """待機の上限を短くしたアプリケーション"""
+    app.config['LONG_POLL_TIMEOUT_SECONDS'] = 0.5
+    return app
+
+def poll(client, channel_id, since):
+    response = client.get(f'/chat/channels/{channel_id}/poll?since={since}')
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_poll_returns_buffered_events(auth_client, test_channel, app):
+    """since より後のイベントが再送用バッファから待たずに返されることのテスト"""
+    with app.app_context():
+        for seq in range(1, 4):
+            publish_channel_event('new_message', {'id': f'm{seq}', 'seq': seq}, test_channel)
+
+        data = poll(auth_client, test_channel, 1)
+        assert data['status'] == 'success'
+        assert [(e['seq'], e['event'], e['data']['id']) for e in data['events']] == [
+            (2, 'new_message', 'm2'), (3, 'new_message', 'm3')
+        ]
+        assert data['last_seq'] == 3
+
+def test_poll_waits_for_new_events(auth_client, test_channel, app):
+    """待機中のリクエストが送信されたメッセージで起こされることのテスト"""
+    with app.app_context():
+        app.config['LONG_POLL_TIMEOUT_SECONDS'] = 10
+        def send_message():
+            # リクエストが待機を始めてから送信する
+            while channel_waiters.waiting_count() == 0:
+                time.sleep(0.01)
+            publish_channel_event('new_message', {'id': 'm1', 'seq': 1}, test_channel)
+
+        sender = threading.Thread(target=send_message)
+        sender.start()
+        data = poll(auth_client, test_channel, 0)
+        sender.join()
+
+        assert [(e['seq'], e['data']['id']) for e in data['events']] == [(1, 'm1')]
+        assert data['last_seq'] == 1
+        assert channel_waiters.waiting_count() == 0
+
+def test_poll_receives_outbox_events(auth_client, test_channel, api_headers, app):
+    """HTTPで送信したメッセージがアウトボックス経由でlong-pollingに届くことのテスト"""
+    with app.app_context():
+        sent = auth_client.post('/chat/send', data={
+            'message': 'long-pollingテスト', 'channel_id': test_channel
+        }, headers=api_headers).get_json()['data']
+        outbox_dispatcher.flush()
+
+        data = poll(auth_client, test_channel, sent['seq'] - 1)
+        assert [(e['event'], e['data']['id']) for e in data['events']] == [('new_message', sent['id'])]
+
+def test_poll_timeout(auth_client, test_channel, app):
+    """イベントが届かない場合は空の結果を返し、待機が解除されることのテスト"""
+    with app.app_context():
+        # 連番のないイベントでは起こさない
+        publish_channel_event('typing_update', {'channel_id': test_channel, 'users': []}, test_channel)
+        data = poll(auth_client, test_channel, 0)
+        assert data['status'] == 'success'
+        assert data['events'] == []
+        assert data['last_seq'] == 0
+        assert channel_waiters.waiting_count() == 0
+
+def test_poll_requests_resync(auth_client, test_user, test_channel, app):
+    """再送用バッファに無い範囲を要求した場合に差分同期を求めることのテスト"""
+    with app.app_context():
+        for seq in range(5, 7):
+            publish_channel_event('new_message', {'id': f'm{seq}', 'seq': seq}, test_channel)
+        data = poll(auth_client, test_channel, 2)
+        assert data['status'] == 'resync'
+        assert data['last_seq'] == 2
+
+        # バッファが空でもチャンネルの連番が進んでいれば差分同期を求める
+        other = Channel(id='other-channel-id', name='other', created_by=test_user, change_seq=3)
+        db.session.add(other)
+        db.session.commit()
+        assert poll(auth_client, 'other-channel-id', 1)['status'] == 'resync'
+
+def test_poll_invalid_since(auth_client, test_channel, app):
+    """不正な since が拒否されることのテスト"""
+    with app.app_context():
+        assert auth_client.get(f'/chat/channels/{test_channel}/poll').status_code == 400
+        assert auth_client.get(f'/chat/channels/{test_channel}/poll?since=abc').status_code == 400
+        assert auth_client.get(f'/chat/channels/{test_channel}/poll?since=-1').status_code == 400
+
+def test_poll_requires_login(client, test_channel, app):
+    """未ログインの場合は取得できないことのテスト"""
+    with app.app_context():
+        assert client.get(f'/chat/channels/{test_channel}/poll?since=0').status_code == 403
@@ -0,0 +1,49 @@
+from flask_socketio import SocketIOTestClient
+from app import socketio
+from app.models import OutboxEvent
+from app.outbox import outbox_dispatcher
+
+def mentions(socket_client):
+    return [r['args'][0] for r in socket_client.get_received() if r['name'] == 'mention']
+
+def send(client, channel_id, content, headers):
+    response = client.post('/chat/send', data={'channel_id': channel_id, 'message': content}, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()['data']
+
+def test_mention_sent_to_personal_room(app, auth_client, socket_client, other_socket_client, test_channel, api_headers):
+    """メンションされたユーザーだけに、チャンネルに参加していなくても mention が届くことのテスト"""
+    other_socket_client.get_received()
+    message = send(auth_client, test_channel, '@otheruser 確認お願いします', api_headers)
+    outbox_dispatcher.flush()
+
+    received = other_socket_client.get_received()
+    assert [r['name'] for r in received] == ['mention']
+    assert received[0]['args'][0] == {
+        'message_id': message['id'],
+        'channel_id': test_channel,
+        'channel_name': 'testchannel',
+        'user_id': 'test-user-id',
+        'username': 'testuser',
+        'excerpt': '@otheruser 確認お願いします',
+    }
+    # 投稿者には届かない
+    assert mentions(socket_client) == []
+
+def test_mention_reaches_every_connection(app, auth_client, other_socket_client, test_channel, api_headers):
+    """同じユーザーの全ての接続に mention が届くことのテスト"""
+    second = SocketIOTestClient(app, socketio, flask_test_client=other_socket_client.flask_test_client)
+    send(auth_client, test_channel, '@otheruser どちらの端末にも届く', api_headers)
+    outbox_dispatcher.flush()
+
+    assert len(mentions(other_socket_client)) == 1
+    assert len(mentions(second)) == 1
+    second.disconnect()
+
+def test_no_mention_for_author_or_unknown_users(app, auth_client, socket_client, test_channel, api_headers):
+    """自分自身や存在しないユーザーへのメンションでは mention を送らないことのテスト"""
+    with app.app_context():
+        send(auth_client, test_channel, '@testuser @ghost メモ', api_headers)
+        assert OutboxEvent.query.filter_by(event='mention').count() == 0
+    outbox_dispatcher.flush()
+    assert mentions(socket_client) == []
@@ -0,0 +1,86 @@
+from sqlalchemy import event
+from app import db
+from app.auth import create_user
+from app.mentions import username_index, UsernameIndex
+from app.models import User
+from app.serializers import find_existing_usernames
+
+def test_index_tracks_orm_users(app, test_user):
+    """ORM経由で作成したユーザーがインデックスに反映されることのテスト"""
+    with app.app_context():
+        assert username_index.loaded
+        assert username_index.filter_existing({'testuser', 'nobody'}) == {'testuser'}
+
+def test_index_ignores_rolled_back_users(app):
+    """ロールバックしたユーザーはインデックスに追加されず、メンションにならないことのテスト"""
+    with app.app_context():
+        db.session.add(User(id='ghost-user-id', username='ghostuser', password_hash='dummy_hash'))
+        db.session.flush()
+        # コミットするまではインデックスに反映しない
+        assert username_index.filter_existing({'ghostuser'}) == set()
+        db.session.rollback()
+        assert find_existing_usernames(['ghostuser']) == set()
+
+        db.session.add(User(id='ghost-user-id', username='ghostuser', password_hash='dummy_hash'))
+        db.session.commit()
+        assert username_index.filter_existing({'ghostuser'}) == {'ghostuser'}
+
+def test_index_tracks_create_user(app):
+    """create_userで作成したユーザーがインデックスに反映されることのテスト"""
+    with app.app_context():
+        create_user('newuser', 'password')
+        assert username_index.filter_existing({'newuser'}) == {'newuser'}
+
+def recorded_statements(func):
+    """func の戻り値と、実行中に発行されたSQLのリストを返す"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        return func(), statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+def test_lookup_without_query(app, test_user):
+    """インデックスにある名前だけならDBに問い合わせないことのテスト"""
+    with app.app_context():
+        existing, statements = recorded_statements(lambda: find_existing_usernames(['testuser']))
+        assert existing == {'testuser'}
+        assert statements == []
+
+        # インデックスにない名前だけを1クエリで確認する
+        existing, statements = recorded_statements(
+            lambda: find_existing_usernames(['testuser', 'ghost1', 'ghost2'])
+        )
+        assert existing == {'testuser'}
+        assert len(statements) == 1
+
+def test_lookup_user_from_other_worker(app, test_user):
+    """他のワーカーで作成された（インデックスにない）ユーザーもメンションになることのテスト"""
+    with app.app_context():
+        # ORMのイベントを通らない作成（他のワーカーでの作成と同じくインデックスに反映されない）
+        db.session.execute(User.__table__.insert().values(
+            id='remote-user-id', username='remoteuser', password_hash='dummy_hash'
+        ))
+        db.session.commit()
+        assert username_index.filter_existing({'remoteuser'}) == set()
+        assert find_existing_usernames(['remoteuser', 'ghost']) == {'remoteuser'}
+
+def test_index_tracks_renamed_users(app, test_user):
+    """改名したユーザーの元の名前がインデックスから消えることのテスト"""
+    with app.app_context():
+        user = db.session.get(User, test_user)
+        user.username = 'renameduser'
+        db.session.commit()
+        assert username_index.filter_existing({'testuser', 'renameduser'}) == {'renameduser'}
+        assert find_existing_usernames(['testuser', 'renameduser']) == {'renameduser'}
+
+def test_unloaded_index_falls_back():
+    """未読み込みのインデックスは判定できないことを示すテスト"""
+    index = UsernameIndex()
+    assert index.filter_existing({'testuser'}) is None
+    index.add('testuser')
+    assert index.filter_existing({'testuser'}) is None
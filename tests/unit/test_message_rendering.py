@@ -0,0 +1,128 @@
+from app import db
+from app.models import Message, User
+from app.commands import rerender_messages
+from app.serializers import RENDER_VERSION, render_mentions, format_message, prerender_message
+
+def test_render_mentions_single_pass():
+    """メンションの変換が部分一致しないことのテスト"""
+    content = '@testuser @testuser2 @testuser'
+    result = render_mentions(content, {'testuser'})
+    assert result == (
+        '<span class="mention">@testuser</span> @testuser2 '
+        '<span class="mention">@testuser</span>'
+    )
+
+def test_send_stores_rendered_html(auth_client, test_channel, app):
+    """送信時に表示用HTMLが保存されることのテスト"""
+    with app.app_context():
+        response = auth_client.post('/chat/send', data={
+            'message': 'こんにちは @testuser',
+            'channel_id': test_channel
+        }, headers={'X-Requested-With': 'XMLHttpRequest'})
+        assert response.status_code == 200
+
+        message = Message.query.filter_by(content='こんにちは @testuser').first()
+        assert message.content_html == 'こんにちは <span class="mention">@testuser</span>'
+        assert message.render_version == RENDER_VERSION
+
+def test_prerender_user_from_other_worker(app, test_user, test_channel):
+    """他のワーカーで作成された（インデックスにない）ユーザーへのメンションも保存時に変換されることのテスト"""
+    with app.app_context():
+        db.session.execute(User.__table__.insert().values(
+            id='remote-user-id', username='remoteuser', password_hash='dummy_hash'
+        ))
+        db.session.commit()
+
+        message = Message(content='@remoteuser こんにちは', user_id=test_user, channel_id=test_channel)
+        prerender_message(message)
+        assert message.content_html == '<span class="mention">@remoteuser</span> こんにちは'
+
+def test_edit_rerenders_html(auth_client, test_user, test_channel, app):
+    """編集時に表示用HTMLが再生成されることのテスト"""
+    with app.app_context():
+        message = Message(
+            id='test-message-id',
+            content='元のメッセージ',
+            content_html='元のメッセージ',
+            render_version=RENDER_VERSION,
+            user_id=test_user,
+            channel_id=test_channel
+        )
+        db.session.add(message)
+        db.session.commit()
+
+        auth_client.post(f'/chat/messages/{message.id}/edit', data={
+            'content': '@testuser 編集後'
+        }, headers={'X-Requested-With': 'XMLHttpRequest'})
+
+        edited = db.session.get(Message, 'test-message-id')
+        db.session.refresh(edited)
+        assert edited.content_html == '<span class="mention">@testuser</span> 編集後'
+
+def test_read_uses_stored_html(app, test_user, test_channel):
+    """保存済みの表示用HTMLがそのまま返されることのテスト"""
+    with app.app_context():
+        message = Message(
+            id='test-message-id',
+            content='@testuser',
+            content_html='<b>stored</b>',
+            render_version=RENDER_VERSION,
+            user_id=test_user,
+            channel_id=test_channel
+        )
+        db.session.add(message)
+        db.session.commit()
+
+        assert format_message(message)['content'] == '<b>stored</b>'
+
+def test_rerender_command(app, test_user, test_channel):
+    """古いバージョンのメッセージを再生成するコマンドのテスト"""
+    with app.app_context():
+        for i, version in enumerate([None, RENDER_VERSION - 1, RENDER_VERSION]):
+            db.session.add(Message(
+                id=f'test-message-{i}',
+                content='@testuser',
+                content_html='old' if version is not None else None,
+                render_version=version,
+                user_id=test_user,
+                channel_id=test_channel
+            ))
+        db.session.commit()
+
+        runner = app.test_cli_runner()
+        result = runner.invoke(rerender_messages, ['--batch-size', '1'])
+        assert result.exit_code == 0
+
+        db.session.expire_all()
+        messages = Message.query.order_by(Message.id).all()
+        assert messages[0].content_html == '<span class="mention">@testuser</span>'
+        assert messages[1].content_html == '<span class="mention">@testuser</span>'
+        # 最新バージョンのメッセージは変更されない
+        assert messages[2].content_html == 'old'
+        assert all(m.render_version == RENDER_VERSION for m in messages)
+
+def test_rerender_all_command(app, test_user, test_channel):
+    """--all で最新バージョンのメッセージのメンションも判定し直すことのテスト"""
+    with app.app_context():
+        for i in range(3):
+            db.session.add(Message(
+                id=f'test-message-{i}',
+                content='@testuser',
+                # ユーザーの作成を知らないワーカーで保存された（メンションにならなかった）メッセージ
+                content_html='@testuser',
+                render_version=RENDER_VERSION,
+                user_id=test_user,
+                channel_id=test_channel
+            ))
+        db.session.commit()
+
+        runner = app.test_cli_runner()
+        result = runner.invoke(rerender_messages, ['--all', '--batch-size', '2'])
+        assert result.exit_code == 0
+        assert '合計: 3件' in result.output
+
+        db.session.expire_all()
+        assert all(
+            m.content_html == '<span class="mention">@testuser</span>'
+            for m in Message.query.all()
+        )
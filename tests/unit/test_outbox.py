@@ -0,0 +1,114 @@
+import json
+import time
+from app import db, socketio
+from app.models import Channel, OutboxEvent
+from app.outbox import dispatch_pending, enqueue_event, outbox_dispatcher
+
+def send(client, channel_id, content, headers):
+    """メッセージを送信して整形済みのデータを返す"""
+    response = client.post('/chat/send', data={
+        'message': content,
+        'channel_id': channel_id
+    }, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()['data']
+
+def test_send_enqueues_event(auth_client, test_channel, app, api_headers):
+    """送信したメッセージのイベントがアウトボックスに書き込まれることのテスト"""
+    with app.app_context():
+        with outbox_dispatcher._dispatch_lock:
+            message = send(auth_client, test_channel, 'アウトボックス', api_headers)
+
+            events = OutboxEvent.query.all()
+            assert [e.event for e in events] == ['new_message']
+            assert events[0].channel_id == test_channel
+            assert json.loads(events[0].payload)['id'] == message['id']
+
+def test_dispatch_delivers_in_order(socket_client, auth_client, test_channel, app, api_headers):
+    """アウトボックスのイベントが順番通りに配信され、配信後に削除されることのテスト"""
+    with app.app_context():
+        socket_client.emit('join_channel', {'channel_id': test_channel})
+        socket_client.get_received()
+
+        with outbox_dispatcher._dispatch_lock:
+            first = send(auth_client, test_channel, '1件目', api_headers)
+            auth_client.post(f'/chat/messages/{first["id"]}/edit', data={'content': '1件目（編集）'}, headers=api_headers)
+            auth_client.delete(f'/chat/messages/{first["id"]}', headers=api_headers)
+            # コミット直後はまだ配信されていない
+            assert socket_client.get_received() == []
+
+        outbox_dispatcher.flush()
+        received = socket_client.get_received()
+        assert [r['name'] for r in received] == ['new_message', 'message_edited', 'message_deleted']
+        assert [r['args'][0]['seq'] for r in received] == [first['seq'], first['seq'] + 1, first['seq'] + 2]
+        assert OutboxEvent.query.count() == 0
+
+def test_dispatch_claims_channels_in_order(app, test_user, test_channel, monkeypatch):
+    """チャンネル単位で古い順に取得し、同じチャンネルのイベントの順序を保つことのテスト"""
+    with app.app_context():
+        db.session.add(Channel(id='other-channel-id', name='otherchannel', created_by=test_user))
+        with outbox_dispatcher._dispatch_lock:
+            for seq, channel_id in enumerate([test_channel, 'other-channel-id', test_channel, test_channel], 1):
+                enqueue_event('new_message', {'id': f'm{seq}', 'seq': seq}, channel_id)
+            db.session.commit()
+
+            published = []
+            monkeypatch.setattr(socketio, 'emit', lambda event, payload, to=None: published.append((to, payload['seq'])))
+            # 最も古いイベントのチャンネルから、そのチャンネルのイベントだけを古い順に取得する
+            assert dispatch_pending(2) == 2
+            assert published == [(f'channel:{test_channel}', 1), (f'channel:{test_channel}', 3)]
+            assert dispatch_pending(2) == 2
+            assert published[2:] == [('channel:other-channel-id', 2), (f'channel:{test_channel}', 4)]
+        assert OutboxEvent.query.count() == 0
+
+def test_stop_ends_background_dispatch(auth_client, test_channel, app, api_headers):
+    """stop() でバックグラウンドの送信が終わり、次の通知で再び起動することのテスト"""
+    with app.app_context():
+        send(auth_client, test_channel, '起動', api_headers)
+        task = outbox_dispatcher._task
+        assert task is not None
+
+        outbox_dispatcher.stop()
+        assert not task.is_alive()
+        assert outbox_dispatcher._task is None
+
+        send(auth_client, test_channel, '再起動', api_headers)
+        assert outbox_dispatcher._task is not None and outbox_dispatcher._task is not task
+
+def test_background_dispatch(socket_client, auth_client, test_channel, app, api_headers):
+    """コミットの通知でバックグラウンドのディスパッチャーが配信することのテスト"""
+    with app.app_context():
+        socket_client.emit('join_channel', {'channel_id': test_channel})
+        socket_client.get_received()
+
+        message = send(auth_client, test_channel, 'バックグラウンド', api_headers)
+
+        received = []
+        deadline = time.monotonic() + 5
+        while not received and time.monotonic() < deadline:
+            socketio.sleep(0.05)
+            received = [r for r in socket_client.get_received() if r['name'] == 'new_message']
+        assert received[0]['args'][0]['id'] == message['id']
+
+def test_rollback_discards_event(app, test_channel):
+    """ロールバックしたトランザクションのイベントは配信されないことのテスト"""
+    with app.app_context():
+        enqueue_event('new_message', {'id': 'rolled-back'}, test_channel)
+        db.session.rollback()
+        assert OutboxEvent.query.count() == 0
+
+def test_metrics(auth_client, test_channel, app, api_headers):
+    """キューの長さと配信の遅れがメトリクスで公開されることのテスト"""
+    with app.app_context():
+        with outbox_dispatcher._dispatch_lock:
+            send(auth_client, test_channel, 'メトリクス', api_headers)
+            data = auth_client.get('/metrics').get_json()
+            assert data['outbox_depth'] == 1
+            assert data['outbox_oldest_age_seconds'] >= 0
+
+        outbox_dispatcher.flush()
+        data = auth_client.get('/metrics').get_json()
+        assert data['outbox_depth'] == 0
+        assert data['outbox_oldest_age_seconds'] == 0
+        assert data['outbox_dispatched_total'] >= 1
+        assert data['outbox_dispatch_lag_seconds'] >= 0
@@ -0,0 +1,104 @@
+import pytest
+from app import db
+from app.models import Message
+from datetime import datetime, timedelta
+
+@pytest.fixture
+def test_messages(app, test_user, test_channel):
+    """作成日時の異なるメッセージを5件作成"""
+    with app.app_context():
+        base_time = datetime(2025, 1, 1, 12, 0, 0)
+        messages = []
+        for i in range(5):
+            message = Message(
+                id=f'test-message-{i}',
+                content=f'メッセージ{i}',
+                user_id=test_user,
+                channel_id=test_channel,
+                created_at=base_time + timedelta(minutes=i),
+                updated_at=base_time + timedelta(minutes=i)
+            )
+            db.session.add(message)
+            messages.append(message)
+        db.session.commit()
+        return [m.id for m in messages]
+
+def test_latest_page_api(auth_client, test_channel, test_messages, app, api_headers):
+    """最新ページの取得のAPIテスト"""
+    with app.app_context():
+        response = auth_client.get(f'/chat/messages/{test_channel}?limit=2', headers=api_headers)
+
+        assert response.status_code == 200
+        data = response.get_json()
+        # 最新の2件が古い順に並んでいることを確認
+        assert [m['id'] for m in data['messages']] == ['test-message-3', 'test-message-4']
+        assert data['pagination']['has_older'] is True
+        assert data['pagination']['has_newer'] is False
+        assert data['pagination']['older_cursor'] is not None
+
+def test_older_messages_api(auth_client, test_channel, test_messages, app, api_headers):
+    """過去メッセージ取得エンドポイントでページを遡るAPIテスト"""
+    with app.app_context():
+        response = auth_client.get(f'/chat/messages/{test_channel}?limit=2', headers=api_headers)
+        cursor = response.get_json()['pagination']['older_cursor']
+
+        # 1ページ遡る
+        response = auth_client.get(
+            f'/chat/channels/{test_channel}/messages/older?before={cursor}&limit=2',
+            headers=api_headers
+        )
+        assert response.status_code == 200
+        data = response.get_json()
+        assert [m['id'] for m in data['messages']] == ['test-message-1', 'test-message-2']
+        assert data['pagination']['has_older'] is True
+
+        # 最後のページ
+        cursor = data['pagination']['older_cursor']
+        response = auth_client.get(
+            f'/chat/channels/{test_channel}/messages/older?before={cursor}&limit=2',
+            headers=api_headers
+        )
+        data = response.get_json()
+        assert [m['id'] for m in data['messages']] == ['test-message-0']
+        assert data['pagination']['has_older'] is False
+        assert data['pagination']['older_cursor'] is None
+
+def test_after_cursor_api(auth_client, test_channel, test_messages, app, api_headers):
+    """afterカーソルで新しいメッセージを取得するAPIテスト"""
+    with app.app_context():
+        response = auth_client.get(
+            f'/chat/channels/{test_channel}/messages/older?limit=5',
+            headers=api_headers
+        )
+        first_page = response.get_json()
+        assert len(first_page['messages']) == 5
+
+        # 先頭2件のページのnewer_cursorから残りを取得
+        response = auth_client.get(f'/chat/messages/{test_channel}?limit=2', headers=api_headers)
+        older_cursor = response.get_json()['pagination']['older_cursor']
+        response = auth_client.get(f'/chat/messages/{test_channel}?after={older_cursor}', headers=api_headers)
+        data = response.get_json()
+        assert [m['id'] for m in data['messages']] == ['test-message-4']
+        assert data['pagination']['has_newer'] is False
+
+def test_invalid_cursor_api(auth_client, test_channel, test_messages, app, api_headers):
+    """不正なカーソル指定時のエラーのAPIテスト"""
+    with app.app_context():
+        response = auth_client.get(
+            f'/chat/channels/{test_channel}/messages/older?before=invalid',
+            headers=api_headers
+        )
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+
+def test_before_and_after_cursor_api(auth_client, test_channel, test_messages, app, api_headers):
+    """beforeとafterを同時に指定した場合はエラーになることのAPIテスト"""
+    with app.app_context():
+        response = auth_client.get(f'/chat/messages/{test_channel}?limit=2', headers=api_headers)
+        cursor = response.get_json()['pagination']['older_cursor']
+        response = auth_client.get(
+            f'/chat/messages/{test_channel}?before={cursor}&after={cursor}',
+            headers=api_headers
+        )
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
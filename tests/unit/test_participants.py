@@ -0,0 +1,75 @@
+import pytest
+from app import db
+from app.messaging import post_message
+from app.models import Message, ChannelParticipant, OutboxEvent
+from app.participants import add_participant
+from app.commands import rebuild_channel_participants
+
+def test_send_records_participant(auth_client, test_user, test_channel, app, api_headers):
+    """メッセージ送信で参加者が1件だけ記録されることのテスト"""
+    with app.app_context():
+        for i in range(2):
+            response = auth_client.post('/chat/send', data={
+                'message': f'メッセージ{i}',
+                'channel_id': test_channel
+            }, headers=api_headers)
+            assert response.status_code == 200
+
+        participants = ChannelParticipant.query.filter_by(channel_id=test_channel).all()
+        assert [p.user_id for p in participants] == [test_user]
+
+        response = auth_client.get(f'/chat/messages/{test_channel}', headers=api_headers)
+        assert response.get_json()['users'] == [{'id': test_user, 'username': 'testuser'}]
+
+def test_participant_saved_with_message(test_user, test_channel, app, monkeypatch):
+    """参加者の記録に失敗した場合はメッセージも保存されないことのテスト"""
+    with app.app_context():
+        def fail(channel_id, user_id):
+            raise RuntimeError('参加者の記録に失敗')
+        monkeypatch.setattr('app.messaging.add_participant', fail)
+
+        with pytest.raises(RuntimeError):
+            post_message(test_user, test_channel, '保存されない')
+        assert Message.query.count() == 0
+        assert OutboxEvent.query.count() == 0
+
+def test_add_participant_recorded_concurrently(test_user, test_channel, app, monkeypatch):
+    """同時送信で先に記録された参加者を重ねて記録しても、呼び出し元の変更は残ることのテスト"""
+    with app.app_context():
+        db.session.add(ChannelParticipant(channel_id=test_channel, user_id=test_user))
+        db.session.commit()
+        db.session.expunge_all()
+
+        message = Message(id='concurrent', content='同時送信', user_id=test_user, channel_id=test_channel)
+        db.session.add(message)
+        db.session.flush()
+        # 確認の後に他のリクエストが記録した状態にする
+        monkeypatch.setattr(db.session, 'get', lambda *args, **kwargs: None)
+        assert add_participant(test_channel, test_user) is False
+        monkeypatch.undo()
+        db.session.commit()
+
+        assert db.session.get(Message, 'concurrent') is not None
+        assert ChannelParticipant.query.count() == 1
+
+def test_rebuild_participants_command(app, test_user, test_channel):
+    """既存メッセージから参加者を再構築するコマンドのテスト"""
+    with app.app_context():
+        for i in range(3):
+            db.session.add(Message(
+                id=f'test-message-{i}',
+                content=f'メッセージ{i}',
+                user_id=test_user,
+                channel_id=test_channel
+            ))
+        db.session.commit()
+        assert ChannelParticipant.query.count() == 0
+
+        runner = app.test_cli_runner()
+        result = runner.invoke(rebuild_channel_participants)
+        assert result.exit_code == 0
+
+        participants = ChannelParticipant.query.all()
+        assert len(participants) == 1
+        assert participants[0].channel_id == test_channel
+        assert participants[0].user_id == test_user
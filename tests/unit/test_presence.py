@@ -0,0 +1,221 @@
+from app import socketio
+from app.realtime.presence import PRESENCE_SYNC_EVENT, PRESENCE_SYNC_ROOM, PresenceTracker, presence_tracker
+
+def presence_updates(socket_client):
+    return [r['args'][0] for r in socket_client.get_received() if r['name'] == 'presence_update']
+
+def test_connection_count():
+    """同じユーザーの全ての接続が切れた場合だけオフラインになることのテスト"""
+    tracker = PresenceTracker(timeout=3, tick=1)
+    tracker.connect('sid-1', 'user-1')
+    tracker.connect('sid-2', 'user-1')
+    tracker.enter('sid-1', 'channel-1')
+    tracker.enter('sid-2', 'channel-1')
+    assert tracker.connection_count('user-1') == 2
+    assert tracker.online_users('channel-1') == ['user-1']
+    assert tracker.take_changes() == {'channel-1': {'online': ['user-1'], 'offline': []}}
+
+    tracker.disconnect('sid-1')
+    assert tracker.is_online('user-1')
+    assert tracker.take_changes() == {}
+
+    tracker.disconnect('sid-2')
+    assert not tracker.is_online('user-1')
+    assert tracker.take_changes() == {'channel-1': {'online': [], 'offline': ['user-1']}}
+
+def test_changes_batched_per_channel():
+    """変化がチャンネルごとにまとめられ、間隔内に戻った変化は送信されないことのテスト"""
+    tracker = PresenceTracker(timeout=3, tick=1)
+    tracker.connect('sid-1', 'user-1')
+    tracker.enter('sid-1', 'channel-1')
+    tracker.connect('sid-2', 'user-2')
+    tracker.enter('sid-2', 'channel-1')
+    tracker.connect('sid-3', 'user-3')
+    tracker.enter('sid-3', 'channel-2')
+    assert tracker.take_changes() == {
+        'channel-1': {'online': ['user-1', 'user-2'], 'offline': []},
+        'channel-2': {'online': ['user-3'], 'offline': []},
+    }
+
+    # 再接続（切断してすぐに接続し直す）は変化として送らない
+    tracker.disconnect('sid-1')
+    tracker.connect('sid-4', 'user-1')
+    tracker.enter('sid-4', 'channel-1')
+    # チャンネルの移動は両方のチャンネルの変化になる
+    tracker.enter('sid-2', 'channel-2')
+    assert tracker.take_changes() == {
+        'channel-1': {'online': [], 'offline': ['user-2']},
+        'channel-2': {'online': ['user-2'], 'offline': []},
+    }
+
+def test_expire_without_heartbeat():
+    """ハートビートが期限まで届かないユーザーがオフラインになることのテスト"""
+    tracker = PresenceTracker(timeout=3, tick=1)
+    tracker.connect('sid-1', 'user-1', now=0)
+    tracker.enter('sid-1', 'channel-1')
+    tracker.connect('sid-2', 'user-2', now=0)
+    tracker.enter('sid-2', 'channel-1')
+    tracker.take_changes()
+
+    assert tracker.tick(now=1) == 0
+    assert tracker.tick(now=2) == 0
+    tracker.heartbeat('sid-2', 'user-2', now=2)
+    assert tracker.tick(now=3) == 1
+    assert not tracker.is_online('user-1')
+    assert tracker.is_online('user-2')
+    assert tracker.take_changes() == {'channel-1': {'online': [], 'offline': ['user-1']}}
+
+    # ハートビートで延長したユーザーも最後のハートビートから期限が過ぎれば期限切れになる
+    assert tracker.tick(now=4) == 0
+    assert tracker.tick(now=5) == 1
+    assert tracker.stats() == {'users': 0, 'connections': 0, 'channels': 0, 'remote_workers': 0}
+
+def test_heartbeat_after_expiry():
+    """期限切れになった接続からのハートビートで登録し直されることのテスト"""
+    tracker = PresenceTracker(timeout=1, tick=1)
+    tracker.connect('sid-1', 'user-1', now=0)
+    tracker.enter('sid-1', 'channel-1')
+    tracker.tick(now=1)
+    tracker.tick(now=2)
+    assert not tracker.is_online('user-1')
+
+    tracker.heartbeat('sid-1', 'user-1', 'channel-1', now=3)
+    assert tracker.online_users('channel-1') == ['user-1']
+    # 期限切れと再登録がまとめて1回の変化になる（前回送信時からは変化なし）
+    assert tracker.take_changes() == {'channel-1': {'online': ['user-1'], 'offline': []}}
+
+def sync(source, *targets, now):
+    """source のワーカーの presence_sync を他のワーカーに届ける（中継の代わり）"""
+    payload = source.sync_payload(now=now)
+    if payload is not None:
+        for target in targets:
+            target.receive_sync(PRESENCE_SYNC_EVENT, payload, PRESENCE_SYNC_ROOM, now=now)
+
+def open_channel(tracker, sid, user_id, channel_id, now):
+    tracker.connect(sid, user_id, now=now)
+    tracker.enter(sid, channel_id)
+
+def test_offline_waits_for_other_workers():
+    """他のワーカーに接続が残っている間はオフラインにせず、最後の接続のワーカーだけが送ることのテスト"""
+    worker_a = PresenceTracker(timeout=30, tick=1)
+    worker_b = PresenceTracker(timeout=30, tick=1)
+    open_channel(worker_a, 'sid-a', 'user-1', 'channel-1', now=0)
+    open_channel(worker_b, 'sid-b', 'user-1', 'channel-1', now=0)
+    open_channel(worker_b, 'sid-c', 'user-2', 'channel-1', now=0)
+    worker_a.take_changes(now=0)
+    worker_b.take_changes(now=0)
+    sync(worker_a, worker_b, now=0)
+    sync(worker_b, worker_a, now=0)
+    assert worker_a.online_users('channel-1', now=0) == ['user-1', 'user-2']
+
+    worker_a.disconnect('sid-a')
+    assert worker_a.take_changes(now=1) == {}
+    sync(worker_a, worker_b, now=1)
+
+    worker_b.disconnect('sid-b')
+    assert worker_b.take_changes(now=2) == {'channel-1': {'online': [], 'offline': ['user-1']}}
+    sync(worker_b, worker_a, now=2)
+    # worker_b が送ったため、worker_a からは重ねて送らない
+    assert worker_a.take_changes(now=2) == {}
+    assert worker_a.online_users('channel-1', now=2) == ['user-2']
+
+def test_simultaneous_disconnects_send_offline():
+    """複数のワーカーで同時に接続がなくなってもオフラインが送られることのテスト"""
+    worker_a = PresenceTracker(timeout=30, tick=1)
+    worker_b = PresenceTracker(timeout=30, tick=1)
+    open_channel(worker_a, 'sid-a', 'user-1', 'channel-1', now=0)
+    open_channel(worker_b, 'sid-b', 'user-1', 'channel-1', now=0)
+    worker_a.take_changes(now=0)
+    worker_b.take_changes(now=0)
+    sync(worker_a, worker_b, now=0)
+    sync(worker_b, worker_a, now=0)
+
+    worker_a.disconnect('sid-a')
+    worker_b.disconnect('sid-b')
+    assert worker_a.take_changes(now=1) == {}
+    assert worker_b.take_changes(now=1) == {}
+    payload_a = worker_a.sync_payload(now=1)
+    sync(worker_b, worker_a, now=1)
+    worker_b.receive_sync(PRESENCE_SYNC_EVENT, payload_a, PRESENCE_SYNC_ROOM, now=1)
+
+    offline = {'channel-1': {'online': [], 'offline': ['user-1']}}
+    assert offline in (worker_a.take_changes(now=1), worker_b.take_changes(now=1))
+
+def test_stopped_worker_expires():
+    """共有が届かなくなったワーカーのユーザーは期限後にオフラインになることのテスト"""
+    worker_a = PresenceTracker(timeout=3, tick=1)
+    worker_b = PresenceTracker(timeout=3, tick=1)
+    open_channel(worker_b, 'sid-b', 'user-1', 'channel-1', now=0)
+    worker_b.take_changes(now=0)
+    sync(worker_b, worker_a, now=0)
+    assert worker_a.online_users('channel-1', now=0) == ['user-1']
+    assert worker_a.stats()['remote_workers'] == 1
+
+    for now in range(1, 5):
+        worker_a.tick(now=now)
+    assert worker_a.online_users('channel-1', now=4) == []
+    assert worker_a.stats()['remote_workers'] == 0
+    assert worker_a.take_changes(now=4) == {'channel-1': {'online': [], 'offline': ['user-1']}}
+
+def test_sync_not_delivered_to_clients(socket_client, test_channel, app):
+    """presence_sync がクライアントに届かないことのテスト"""
+    with app.app_context():
+        socket_client.emit('join_channel', {'channel_id': test_channel})
+        presence_tracker.flush()
+        received = socket_client.get_received()
+        assert [r for r in received if r['name'] == PRESENCE_SYNC_EVENT] == []
+
+        remote = PresenceTracker()
+        open_channel(remote, 'remote-sid', 'remote-user-id', test_channel, now=None)
+        remote.take_changes()
+        socketio.emit(PRESENCE_SYNC_EVENT, remote.sync_payload(), to=PRESENCE_SYNC_ROOM)
+        assert socket_client.get_received() == []
+        # 中継された共有はリスナーで取り込まれる
+        assert presence_tracker.online_users(test_channel) == ['remote-user-id', 'test-user-id']
+
+def test_presence_broadcast(socket_client, other_socket_client, test_channel, app):
+    """チャンネルを開いたユーザーと閉じたユーザーが同じチャンネルのクライアントに届くことのテスト"""
+    with app.app_context():
+        ack = socket_client.emit('join_channel', {'channel_id': test_channel}, callback=True)
+        assert ack['online'] == ['test-user-id']
+        presence_tracker.flush()
+        socket_client.get_received()
+
+        ack = other_socket_client.emit('join_channel', {'channel_id': test_channel}, callback=True)
+        assert ack['online'] == ['other-user-id', 'test-user-id']
+        presence_tracker.flush()
+        assert presence_updates(socket_client) == [
+            {'channel_id': test_channel, 'online': ['other-user-id'], 'offline': []}
+        ]
+
+        other_socket_client.disconnect()
+        presence_tracker.flush()
+        assert presence_updates(socket_client) == [
+            {'channel_id': test_channel, 'online': [], 'offline': ['other-user-id']}
+        ]
+
+def test_heartbeat_sends_nothing(socket_client, test_channel, app):
+    """ハートビートでは何も送信されないことのテスト"""
+    with app.app_context():
+        socket_client.emit('join_channel', {'channel_id': test_channel})
+        presence_tracker.flush()
+        socket_client.get_received()
+
+        for _ in range(10):
+            socket_client.emit('heartbeat', {'channel_id': test_channel})
+        presence_tracker.flush()
+        assert socket_client.get_received() == []
+        assert presence_tracker.is_online('test-user-id')
+
+def test_heartbeat_invalid_payload(socket_client, test_channel, app):
+    """辞書でないデータのハートビートもチャンネルIDがない場合と同じく記録だけされることのテスト"""
+    with app.app_context():
+        socket_client.emit('join_channel', {'channel_id': test_channel})
+        presence_tracker.flush()
+        socket_client.get_received()
+
+        for payload in ('channel', ['channel'], 1, {'channel_id': ['channel']}):
+            socket_client.emit('heartbeat', payload)
+        presence_tracker.flush()
+        assert socket_client.get_received() == []
+        assert presence_tracker.online_users(test_channel) == ['test-user-id']
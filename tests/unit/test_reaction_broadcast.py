@@ -0,0 +1,53 @@
+import pytest
+from app import db, socketio
+from app.realtime.reactions import reaction_broadcaster
+from app.models import Message
+
+@pytest.fixture
+def test_message(app, test_user, test_channel):
+    """テスト用のメッセージを作成"""
+    with app.app_context():
+        message = Message(
+            id='test-message-id',
+            content='テストメッセージ',
+            user_id=test_user,
+            channel_id=test_channel
+        )
+        db.session.add(message)
+        db.session.commit()
+        return message.id
+
+def reaction_events(socket_client):
+    """受信したupdate_reactionsイベントの内容を返す"""
+    return [r['args'][0] for r in socket_client.get_received() if r['name'] == 'update_reactions']
+
+def test_toggle_broadcasts_reactions(socket_client, auth_client, test_message, test_channel, app, api_headers):
+    """リアクションの切り替えでupdate_reactionsが送信されることのテスト"""
+    with app.app_context():
+        reaction_broadcaster.configure(0)
+        socket_client.emit('join_channel', {'channel_id': test_channel})
+        socket_client.get_received()
+
+        auth_client.post(f'/chat/messages/{test_message}/reaction', data={'emoji': '👍'}, headers=api_headers)
+
+        assert reaction_events(socket_client) == [{
+            'message_id': test_message,
+            'channel_id': test_channel,
+            'reactions': [{'emoji': '👍', 'count': 1}]
+        }]
+
+def test_burst_is_coalesced(socket_client, auth_client, test_message, test_channel, app, api_headers):
+    """短時間の連続した切り替えが最終状態の1イベントにまとめられることのテスト"""
+    with app.app_context():
+        reaction_broadcaster.configure(0.2)
+        socket_client.emit('join_channel', {'channel_id': test_channel})
+        socket_client.get_received()
+
+        for emoji in ['👍', '❤️', '🎉', '🎉', '👍']:
+            auth_client.post(f'/chat/messages/{test_message}/reaction', data={'emoji': emoji}, headers=api_headers)
+        assert reaction_events(socket_client) == []
+
+        socketio.sleep(0.5)
+        events = reaction_events(socket_client)
+        assert len(events) == 1
+        assert events[0]['reactions'] == [{'emoji': '👍', 'count': 1}]
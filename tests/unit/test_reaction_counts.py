@@ -0,0 +1,81 @@
+import pytest
+from app import db
+from app.models import Message, Reaction, ReactionCount
+from app.commands import recount_reaction_counts
+
+@pytest.fixture
+def test_message(app, test_user, test_channel):
+    """テスト用のメッセージを作成"""
+    with app.app_context():
+        message = Message(
+            id='test-message-id',
+            content='テストメッセージ',
+            user_id=test_user,
+            channel_id=test_channel
+        )
+        db.session.add(message)
+        db.session.commit()
+        return message.id
+
+def stored_counts(message_id):
+    """保存されているカウンターを {emoji: count} で返す"""
+    rows = ReactionCount.query.filter_by(message_id=message_id).all()
+    return {row.emoji: row.count for row in rows}
+
+def test_toggle_updates_counts(auth_client, test_message, app, api_headers):
+    """リアクションの追加・変更・削除でカウンターが更新されることのテスト"""
+    with app.app_context():
+        url = f'/chat/messages/{test_message}/reaction'
+
+        response = auth_client.post(url, data={'emoji': '👍'}, headers=api_headers)
+        assert response.get_json()['reactions'] == [{'emoji': '👍', 'count': 1}]
+        assert stored_counts(test_message) == {'👍': 1}
+
+        # 別の絵文字に変更すると古い絵文字のカウンターは消える
+        response = auth_client.post(url, data={'emoji': '❤️'}, headers=api_headers)
+        assert response.get_json()['reactions'] == [{'emoji': '❤️', 'count': 1}]
+        assert stored_counts(test_message) == {'❤️': 1}
+
+        response = auth_client.post(url, data={'emoji': '❤️'}, headers=api_headers)
+        assert response.get_json()['reactions'] == []
+        assert stored_counts(test_message) == {}
+
+def test_delete_message_removes_counts(auth_client, test_message, app, api_headers):
+    """メッセージ削除でカウンターも削除されることのテスト"""
+    with app.app_context():
+        auth_client.post(f'/chat/messages/{test_message}/reaction', data={'emoji': '👍'}, headers=api_headers)
+        response = auth_client.delete(f'/chat/messages/{test_message}', headers=api_headers)
+        assert response.status_code == 200
+        assert ReactionCount.query.count() == 0
+
+def test_delete_channel_removes_counts(auth_client, test_message, test_channel, app, api_headers, foreign_keys):
+    """リアクションの付いたメッセージのあるチャンネルを削除できることのテスト"""
+    with app.app_context():
+        auth_client.post(f'/chat/messages/{test_message}/reaction', data={'emoji': '👍'}, headers=api_headers)
+        assert stored_counts(test_message) == {'👍': 1}
+
+        response = auth_client.post(f'/chat/channels/{test_channel}/delete', headers=api_headers)
+        assert response.status_code == 200
+        assert ReactionCount.query.count() == 0
+        assert Reaction.query.count() == 0
+        assert Message.query.count() == 0
+
+def test_recount_command(app, test_user, test_message):
+    """ずれたカウンターを検出・修正するコマンドのテスト"""
+    with app.app_context():
+        db.session.add(Reaction(message_id=test_message, user_id=test_user, emoji='👍'))
+        db.session.add(ReactionCount(message_id=test_message, emoji='🎉', count=2))
+        db.session.commit()
+
+        runner = app.test_cli_runner()
+        result = runner.invoke(recount_reaction_counts)
+        assert result.exit_code == 0
+        assert '2件のずれを検出しました' in result.output
+        assert stored_counts(test_message) == {'🎉': 2}
+
+        result = runner.invoke(recount_reaction_counts, ['--fix'])
+        assert result.exit_code == 0
+        assert stored_counts(test_message) == {'👍': 1}
+
+        result = runner.invoke(recount_reaction_counts)
+        assert 'ずれはありませんでした' in result.output
@@ -0,0 +1,74 @@
+from app import create_app, socketio
+from app.realtime.replay import ReplayBuffer
+from app.outbox import outbox_dispatcher
+
+def test_replay_buffer_since():
+    """取りこぼした範囲のイベントだけが返されることのテスト"""
+    buffer = ReplayBuffer(capacity=3)
+    for seq in range(1, 6):
+        buffer.append('channel', seq, 'new_message', {'seq': seq})
+
+    assert [e[0] for e in buffer.since('channel', 3)] == [4, 5]
+    assert buffer.since('channel', 5) == []
+    # 古いイベントはバッファから消えているため再同期が必要
+    assert buffer.since('channel', 1) is None
+    assert buffer.since('unknown', 0) is None
+
+def test_replay_buffer_gap_resets():
+    """連番が飛んだ場合に欠けた範囲を再送しないことのテスト"""
+    buffer = ReplayBuffer(capacity=10)
+    buffer.append('channel', 1, 'new_message', {})
+    buffer.append('channel', 2, 'new_message', {})
+    buffer.append('channel', 5, 'new_message', {})
+    # 重複は無視される
+    buffer.append('channel', 5, 'new_message', {})
+
+    assert buffer.since('channel', 2) is None
+    assert [e[0] for e in buffer.since('channel', 4)] == [5]
+
+def test_replay_buffer_max_channels():
+    """チャンネル数の上限を超えると古いチャンネルから破棄されることのテスト"""
+    buffer = ReplayBuffer(capacity=10, max_channels=2)
+    for channel in ['a', 'b', 'c']:
+        buffer.append(channel, 1, 'new_message', {})
+
+    assert buffer.since('a', 0) is None
+    assert len(buffer.since('c', 0)) == 1
+
+def test_resume_replays_missed_events(socket_client, auth_client, test_channel, app, api_headers):
+    """再接続時に取りこぼしたイベントが再送されることのテスト"""
+    with app.app_context():
+        seqs = []
+        for i in range(3):
+            response = auth_client.post('/chat/send', data={
+                'message': f'メッセージ{i}',
+                'channel_id': test_channel
+            }, headers=api_headers)
+            seqs.append(response.get_json()['data']['seq'])
+        outbox_dispatcher.flush()
+        socket_client.get_received()
+
+        ack = socket_client.emit('resume', {
+            'channel_id': test_channel,
+            'last_seq': seqs[0]
+        }, callback=True)
+
+        assert ack == {'status': 'replayed', 'count': 2, 'online': ['test-user-id']}
+        received = socket_client.get_received()
+        assert [r['args'][0]['seq'] for r in received] == seqs[1:]
+        assert all(r['name'] == 'new_message' for r in received)
+
+def test_resume_requires_resync(socket_client, test_channel, app):
+    """バッファに無い範囲を要求した場合に再同期を求めることのテスト"""
+    with app.app_context():
+        ack = socket_client.emit('resume', {
+            'channel_id': test_channel,
+            'last_seq': 0
+        }, callback=True)
+        assert ack == {'status': 'resync', 'online': ['test-user-id']}
+
+def test_handlers_registered_on_every_app():
+    """create_app を呼ぶたびに作られるSocket.IOのサーバーにイベントハンドラが登録されることのテスト"""
+    for _ in range(2):
+        create_app()
+        assert {'connect', 'resume', 'join_channel'} <= set(socketio.server.handlers['/'])
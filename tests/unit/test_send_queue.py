@@ -0,0 +1,166 @@
+import json
+import pytest
+from app import socketio
+from app.realtime import publish_channel_event
+
+class PollingConnection:
+    """Engine.IO のポーリングで接続し、受信しない遅いクライアントを再現する
+
+    テストクライアントはサーバーの送信キューを通らないため、WSGIアプリに直接リクエストする。
+    """
+
+    def __init__(self, client):
+        self.client = client
+        handshake = client.get('/socket.io/?EIO=4&transport=polling').get_data(as_text=True)
+        self.sid = json.loads(handshake[1:])['sid']
+        self.post('40')
+        # 接続の応答（CONNECT）を受け取っておく
+        self.poll()
+
+    def url(self):
+        return f'/socket.io/?EIO=4&transport=polling&sid={self.sid}'
+
+    def post(self, *packets):
+        return self.client.post(self.url(), data='\x1e'.join(packets), content_type='text/plain')
+
+    def emit(self, event, data):
+        """応答（ack）を求めてイベントを送る"""
+        self.post('420' + json.dumps([event, data]))
+
+    def poll(self):
+        """溜まっているパケットを受け取り、イベントを [(名前, データ)] で返す（キューが空の場合は呼ばない）"""
+        response = self.client.get(self.url())
+        assert response.status_code == 200
+        events = []
+        for packet in response.get_data(as_text=True).split('\x1e'):
+            if packet.startswith('42'):
+                events.append(tuple(json.loads(packet[2:])))
+        return events
+
+    def depth(self):
+        return socketio.server.manager.queue_depth(self.sid)
+
+def configure(policy, max_queue=5):
+    socketio.server.manager.configure_send_queue(max_queue, policy)
+
+@pytest.fixture
+def slow_client(app, auth_client, test_channel):
+    """チャンネルに参加したまま受信しないクライアント"""
+    connection = PollingConnection(auth_client)
+    connection.emit('join_channel', {'channel_id': test_channel})
+    connection.poll()
+    yield connection
+    configure('coalesce', app.config['SOCKETIO_SEND_QUEUE_SIZE'])
+
+def publish_messages(channel_id, count, start=1):
+    for seq in range(start, start + count):
+        publish_channel_event('new_message', {'id': f'm{seq}', 'seq': seq}, channel_id)
+
+def test_queue_is_bounded(slow_client, test_channel, app):
+    """受信しない接続の送信キューが上限で止まることのテスト"""
+    with app.app_context():
+        configure('coalesce')
+        publish_messages(test_channel, 20)
+
+        assert slow_client.depth() == 5
+        stats = socketio.server.manager.queue_stats()
+        assert stats['max_depth'] == 5
+        busy = stats['busy'][0]
+        assert busy['depth'] == 5
+        assert busy['pending'] == 0
+        assert busy['dropped'] == 20 - 5
+
+def test_coalesce_keeps_latest_update(slow_client, test_channel, app):
+    """保持中のリアクション更新が最新のものだけ送られることのテスト"""
+    with app.app_context():
+        configure('coalesce', max_queue=10)
+        publish_messages(test_channel, 10)
+        for count in range(1, 6):
+            publish_channel_event('update_reactions', {
+                'message_id': 'm1', 'channel_id': test_channel, 'reactions': [{'count': count}]
+            }, test_channel)
+        publish_messages(test_channel, 1, start=11)
+
+        assert slow_client.depth() == 10
+        assert socketio.server.manager.queue_stats()['busy'][0]['pending'] == 2
+
+        received = slow_client.poll()
+        socketio.server.manager.drain()
+        received += slow_client.poll()
+
+        reactions = [data for name, data in received if name == 'update_reactions']
+        assert reactions == [{'message_id': 'm1', 'channel_id': test_channel, 'reactions': [{'count': 5}]}]
+        # 保持していたイベントも順番どおりに届く
+        seqs = [data['seq'] for name, data in received if name == 'new_message']
+        assert seqs == list(range(1, 12))
+
+def test_resync_after_drop(slow_client, test_channel, app):
+    """破棄した接続にはキューが空いてから再同期が求められることのテスト"""
+    with app.app_context():
+        configure('resync')
+        publish_messages(test_channel, 8)
+
+        received = slow_client.poll()
+        # キューが空く前のイベントも破棄され、再同期の要求だけが届く
+        publish_messages(test_channel, 1, start=9)
+        socketio.server.manager.drain()
+        received += slow_client.poll()
+
+        names = [name for name, data in received]
+        assert names == ['new_message'] * 5 + ['resync_required']
+        assert socketio.server.manager.queue_stats()['busy'][0]['dropped'] == 4
+
+        # 再同期の後は通常どおり届く
+        publish_messages(test_channel, 1, start=10)
+        assert slow_client.poll() == [('new_message', {'id': 'm10', 'seq': 10})]
+
+def test_disconnect_slow_consumer(slow_client, test_channel, app):
+    """disconnect の方針では上限を超えた接続が切断されることのテスト"""
+    with app.app_context():
+        configure('disconnect')
+        publish_messages(test_channel, 6)
+
+        assert slow_client.sid not in socketio.server.eio.sockets
+        assert socketio.server.manager.queue_stats()['connections'] == 0
+        assert slow_client.client.get(slow_client.url()).status_code == 400
+
+def test_fast_client_unaffected(slow_client, app, test_user, test_channel):
+    """遅い接続があっても受信している接続には全てのイベントが届くことのテスト"""
+    with app.app_context():
+        configure('resync')
+        fast_http = app.test_client()
+        with fast_http.session_transaction() as session:
+            session['user_id'] = test_user
+            session['username'] = 'testuser'
+        fast_client = PollingConnection(fast_http)
+        fast_client.emit('join_channel', {'channel_id': test_channel})
+        fast_client.poll()
+
+        received = []
+        for start in range(1, 21, 4):
+            publish_messages(test_channel, 4, start=start)
+            received += fast_client.poll()
+
+        assert [data['seq'] for name, data in received] == list(range(1, 21))
+        assert slow_client.depth() == 5
+
+def test_drain_sends_only_to_held_connection(slow_client, app, test_user, test_channel):
+    """保持していたイベントと再同期の要求が、チャンネルに参加していない接続には届かないことのテスト"""
+    with app.app_context():
+        other_http = app.test_client()
+        with other_http.session_transaction() as session:
+            session['user_id'] = test_user
+            session['username'] = 'testuser'
+        outsider = PollingConnection(other_http)
+
+        configure('coalesce', max_queue=5)
+        publish_messages(test_channel, 7)
+        slow_client.poll()
+        socketio.server.manager.drain()
+        configure('resync')
+        publish_messages(test_channel, 6, start=8)
+        slow_client.poll()
+        socketio.server.manager.drain()
+
+        assert ('resync_required', {}) in slow_client.poll()
+        assert outsider.depth() == 0
@@ -0,0 +1,104 @@
+import pytest
+from sqlalchemy import event
+from app import db
+from app.models import User, Channel, Message, Reaction
+from app.serializers import format_messages
+from app.reaction_counts import increment_reaction_count
+from datetime import datetime, UTC, timedelta
+
+@pytest.fixture
+def test_users(app):
+    """メンション先を含む複数のテスト用ユーザーを作成"""
+    with app.app_context():
+        users = []
+        for i in range(3):
+            user = User(
+                id=f'test-user-{i}',
+                username=f'user{i}',
+                password_hash='dummy_hash',
+                created_at=datetime.now(UTC),
+                updated_at=datetime.now(UTC)
+            )
+            db.session.add(user)
+            users.append(user)
+        db.session.commit()
+        return [u.id for u in users]
+
+@pytest.fixture
+def test_channel(app, test_users):
+    """テスト用のチャンネルを作成"""
+    with app.app_context():
+        channel = Channel(
+            id='test-channel-id',
+            name='testchannel',
+            created_by=test_users[0],
+            created_at=datetime.now(UTC),
+            updated_at=datetime.now(UTC)
+        )
+        db.session.add(channel)
+        db.session.commit()
+        return channel.id
+
+def create_messages(test_users, test_channel, count):
+    """メンションとリアクション付きのメッセージを作成"""
+    base_time = datetime(2025, 1, 1, 12, 0, 0)
+    for i in range(count):
+        message = Message(
+            id=f'test-message-{i}',
+            content=f'@user1 @user2 @unknown メッセージ{i}',
+            user_id=test_users[i % len(test_users)],
+            channel_id=test_channel,
+            created_at=base_time + timedelta(minutes=i),
+            updated_at=base_time + timedelta(minutes=i)
+        )
+        db.session.add(message)
+        for user_id in test_users:
+            db.session.add(Reaction(message_id=message.id, user_id=user_id, emoji='👍'))
+            increment_reaction_count(message.id, '👍')
+    db.session.commit()
+    db.session.expunge_all()
+    return Message.query.order_by(Message.created_at.asc()).all()
+
+def count_queries(func, *args):
+    """関数の実行中に発行されたSQLの数を数える"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        result = func(*args)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return result, len(statements)
+
+def test_format_messages_content(app, test_users, test_channel):
+    """まとめてシリアライズした内容のテスト"""
+    with app.app_context():
+        messages = create_messages(test_users, test_channel, 2)
+        result = format_messages(messages)
+
+        assert len(result) == 2
+        assert result[0]['username'] == 'user0'
+        assert '<span class="mention">@user1</span>' in result[0]['content']
+        assert '<span class="mention">@unknown</span>' not in result[0]['content']
+        assert result[0]['raw_content'] == messages[0].content
+        assert result[0]['reactions'] == [{'emoji': '👍', 'count': 3}]
+
+def test_format_messages_query_count(app, test_users, test_channel):
+    """メッセージ件数が増えてもクエリ数が一定であることのテスト"""
+    with app.app_context():
+        messages = create_messages(test_users, test_channel, 30)
+
+        db.session.expunge_all()
+        small_page = Message.query.order_by(Message.created_at.asc()).limit(3).all()
+        _, small_count = count_queries(format_messages, small_page)
+
+        db.session.expunge_all()
+        large_page = Message.query.order_by(Message.created_at.asc()).all()
+        result, large_count = count_queries(format_messages, large_page)
+
+        assert len(result) == 30
+        assert small_count == large_count
+        assert large_count <= 3
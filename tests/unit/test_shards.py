@@ -0,0 +1,86 @@
+import time
+import pytest
+from flask_socketio import SocketIOTestClient
+from app import socketio
+from app.metrics import metrics
+from app.realtime import publish_channel_event
+
+@pytest.fixture
+def manager(app):
+    """サブルームの参加者数を2にしたクライアントマネージャー"""
+    manager = socketio.server.manager
+    manager.configure_fanout(2, 2, 1)
+    return manager
+
+def join(app, auth_client, channel_id):
+    socket_client = SocketIOTestClient(app, socketio, flask_test_client=auth_client)
+    socket_client.emit('join_channel', {'channel_id': channel_id}, callback=True)
+    socket_client.get_received()
+    return socket_client
+
+def sharded_rooms(manager):
+    return {stats['room']: stats for stats in manager.fanout_stats()['sharded_rooms']}
+
+def received_events(socket_client, name, count, timeout=5):
+    """配信用スレッドから count 件届くまで待って受信したイベントを返す"""
+    events = []
+    deadline = time.monotonic() + timeout
+    while len(events) < count and time.monotonic() < deadline:
+        events += [r['args'][0] for r in socket_client.get_received() if r['name'] == name]
+        if len(events) < count:
+            socketio.sleep(0.05)
+    return events
+
+def test_rooms_split_into_shards(app, auth_client, test_channel, manager):
+    """参加者が上限を超えたルームがサブルームに分割され、空きが再利用されることのテスト"""
+    clients = [join(app, auth_client, test_channel) for _ in range(5)]
+    room = f'channel:{test_channel}'
+    assert manager.is_sharded('/', room)
+    assert sharded_rooms(manager)[room] == {'room': room, 'shards': 3, 'participants': 5}
+
+    # 退出した接続の空きに次の参加者を割り当てる
+    clients.pop(0).disconnect()
+    clients.append(join(app, auth_client, test_channel))
+    assert sharded_rooms(manager)[room] == {'room': room, 'shards': 3, 'participants': 5}
+
+    for socket_client in clients[:4]:
+        socket_client.disconnect()
+    assert not manager.is_sharded('/', room)
+    clients[4].disconnect()
+
+def test_sharded_emit_reaches_every_member_in_order(app, auth_client, test_channel, manager):
+    """分割したルームの全ての接続に、送信した順番でイベントが届くことのテスト"""
+    clients = [join(app, auth_client, test_channel) for _ in range(5)]
+    for number in range(3):
+        publish_channel_event('new_message', {'id': f'message-{number}', 'channel_id': test_channel}, test_channel)
+
+    for socket_client in clients:
+        events = received_events(socket_client, 'new_message', 3)
+        assert [event['id'] for event in events] == ['message-0', 'message-1', 'message-2']
+        socket_client.disconnect()
+
+def test_small_room_sent_inline(app, auth_client, test_channel, manager):
+    """参加者が上限以下のルームにはその場で送信されることのテスト"""
+    socket_client = join(app, auth_client, test_channel)
+    assert not manager.is_sharded('/', f'channel:{test_channel}')
+    publish_channel_event('new_message', {'id': 'inline', 'channel_id': test_channel}, test_channel)
+    assert [r['args'][0]['id'] for r in socket_client.get_received() if r['name'] == 'new_message'] == ['inline']
+    socket_client.disconnect()
+
+def test_sharded_emit_respects_send_queue(app, auth_client, test_channel, manager):
+    """分割したルームへの送信でも送信キューの上限を確認することのテスト"""
+    clients = [join(app, auth_client, test_channel) for _ in range(3)]
+    slow = clients[0]
+    manager.configure_send_queue(1, 'resync')
+    # 1つ目の接続だけ送信キューが上限に達している状態にする
+    manager.queue_depth = lambda eio_sid: 1 if eio_sid == slow.eio_sid else 0
+    dropped = metrics.snapshot().get('socketio_send_queue_dropped_total', 0)
+
+    publish_channel_event('new_message', {'id': 'queued', 'channel_id': test_channel}, test_channel)
+    for socket_client in clients[1:]:
+        assert len(received_events(socket_client, 'new_message', 1)) == 1
+    assert received_events(slow, 'new_message', 1, timeout=0.5) == []
+    # 参加時のオンライン状態の通知（presence_update）も破棄される場合がある
+    assert metrics.snapshot()['socketio_send_queue_dropped_total'] >= dropped + 1
+    for socket_client in clients:
+        socket_client.disconnect()
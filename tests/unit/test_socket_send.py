@@ -0,0 +1,92 @@
+from flask_socketio import SocketIOTestClient
+from app import db, socketio
+from app.channel_cache import channel_cache
+from app.models import Channel, Message
+from app.outbox import outbox_dispatcher
+
+def test_send_message_ack(socket_client, test_user, test_channel, app):
+    """WebSocketで送信したメッセージが保存されackで返されることのテスト"""
+    with app.app_context():
+        ack = socket_client.emit('send_message', {
+            'channel_id': test_channel,
+            'message': '  WebSocketから送信 @testuser  '
+        }, callback=True)
+
+        assert ack['status'] == 'success'
+        data = ack['data']
+        assert data['raw_content'] == 'WebSocketから送信 @testuser'
+        assert data['channel_id'] == test_channel
+        assert data['mentions'] == ['testuser']
+        assert data['seq'] is not None
+
+        message = db.session.get(Message, data['id'])
+        assert message.user_id == test_user
+        assert message.content_html is not None
+
+def test_send_message_broadcast(socket_client, test_channel, app):
+    """WebSocketで送信したメッセージがチャンネルに配信されることのテスト"""
+    with app.app_context():
+        socket_client.emit('join_channel', {'channel_id': test_channel})
+        socket_client.get_received()
+
+        ack = socket_client.emit('send_message', {'channel_id': test_channel, 'message': '配信'}, callback=True)
+        outbox_dispatcher.flush()
+
+        received = [r for r in socket_client.get_received() if r['name'] == 'new_message']
+        assert [r['args'][0]['id'] for r in received] == [ack['data']['id']]
+
+def test_send_message_validation(socket_client, test_channel, app):
+    """HTTPと同じ検証が行われることのテスト"""
+    with app.app_context():
+        ack = socket_client.emit('send_message', {'channel_id': test_channel, 'message': '   '}, callback=True)
+        assert ack == {'status': 'error', 'message': 'メッセージまたは画像を入力してください'}
+
+        ack = socket_client.emit('send_message', {'message': 'こんにちは'}, callback=True)
+        assert ack == {'status': 'error', 'message': 'チャンネルIDが指定されていません'}
+
+        ack = socket_client.emit('send_message', {'channel_id': 'missing', 'message': 'こんにちは'}, callback=True)
+        assert ack == {'status': 'error', 'message': 'チャンネルが見つかりません'}
+        assert Message.query.count() == 0
+
+def test_send_message_invalid_payload(socket_client, test_channel, app):
+    """辞書でないデータや文字列でない値の場合も検証エラーを返すことのテスト"""
+    with app.app_context():
+        for payload in ('こんにちは', ['こんにちは'], 1):
+            ack = socket_client.emit('send_message', payload, callback=True)
+            assert ack == {'status': 'error', 'message': 'チャンネルIDが指定されていません'}
+
+        ack = socket_client.emit('send_message', {'channel_id': [test_channel], 'message': 'こんにちは'}, callback=True)
+        assert ack == {'status': 'error', 'message': 'チャンネルIDが指定されていません'}
+        ack = socket_client.emit('send_message', {'channel_id': test_channel, 'message': ['こんにちは']}, callback=True)
+        assert ack == {'status': 'error', 'message': 'メッセージまたは画像を入力してください'}
+        assert Message.query.count() == 0
+
+def test_send_to_channel_created_on_other_worker(socket_client, test_user, test_channel, app):
+    """キャッシュにないチャンネル（他のワーカーで作成）にもDBを確認して送信できることのテスト"""
+    with app.app_context():
+        channel_cache.list()
+        db.session.add(Channel(id='other-channel-id', name='other', created_by=test_user))
+        db.session.commit()
+
+        ack = socket_client.emit('send_message', {'channel_id': 'other-channel-id', 'message': 'こんにちは'}, callback=True)
+        assert ack['status'] == 'success'
+        assert channel_cache.get('other-channel-id').name == 'other'
+
+def test_send_message_requires_login(app, test_channel):
+    """未ログインの接続からは送信できないことのテスト"""
+    with app.app_context():
+        socket_client = SocketIOTestClient(app, socketio)
+        ack = socket_client.emit('send_message', {'channel_id': test_channel, 'message': 'こんにちは'}, callback=True)
+        socket_client.disconnect()
+        assert ack['status'] == 'error'
+        assert Message.query.count() == 0
+
+def test_http_send_unknown_channel(auth_client, app, api_headers):
+    """HTTPでも存在しないチャンネルへの送信が400になることのテスト"""
+    with app.app_context():
+        response = auth_client.post('/chat/send', data={
+            'message': 'こんにちは',
+            'channel_id': 'missing'
+        }, headers=api_headers)
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'チャンネルが見つかりません'
@@ -0,0 +1,114 @@
+import json
+import pytest
+from app.outbox import outbox_dispatcher
+from app.realtime import publish_channel_event
+from app.realtime.stream import channel_streams
+
+@pytest.fixture
+def app(app):
+    """キープアライブの間隔を短くしたアプリケーション"""
+    app.config['SSE_KEEPALIVE_SECONDS'] = 0.2
+    return app
+
+def open_stream(client, channel_id, headers=None):
+    """SSEのストリームを開き、受信した文字列を1回分ずつ返すイテレーターを返す"""
+    response = client.get(f'/chat/channels/{channel_id}/stream', headers=headers or {}, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    chunks = (chunk.decode('utf-8') for chunk in response.response)
+    return response, chunks
+
+def parse_events(text):
+    """SSEの文字列を [(id, event, data)] にする（コメント行は除く）"""
+    events = []
+    for block in text.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if line and not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields.get('id'), fields['event'], json.loads(fields['data'])))
+    return events
+
+def test_stream_receives_channel_events(auth_client, test_channel, api_headers, app):
+    """送信したメッセージがSocket.IOと同じ経路でSSEに届くことのテスト"""
+    with app.app_context():
+        response, chunks = open_stream(auth_client, test_channel)
+        assert next(chunks) == 'retry: 3000\n\n'
+
+        sent = auth_client.post('/chat/send', data={
+            'message': 'SSEテスト', 'channel_id': test_channel
+        }, headers=api_headers).get_json()['data']
+        outbox_dispatcher.flush()
+
+        [(event_id, event, data)] = parse_events(next(chunks))
+        assert event == 'new_message'
+        assert data['id'] == sent['id']
+        assert event_id == str(sent['seq'])
+        response.close()
+
+def test_stream_keepalive(auth_client, test_channel, app):
+    """イベントがない間はキープアライブのコメントが送られることのテスト"""
+    with app.app_context():
+        response, chunks = open_stream(auth_client, test_channel)
+        next(chunks)
+        assert next(chunks) == ': keep-alive\n\n'
+        response.close()
+
+def test_stream_resumes_from_last_event_id(auth_client, test_channel, app):
+    """Last-Event-ID より後のイベントが再送用バッファから送られることのテスト"""
+    with app.app_context():
+        for seq in range(1, 4):
+            publish_channel_event('new_message', {'id': f'm{seq}', 'seq': seq}, test_channel)
+
+        response, chunks = open_stream(auth_client, test_channel, {'Last-Event-ID': '1'})
+        events = parse_events(next(chunks))
+        assert [(event_id, event) for event_id, event, data in events] == [('2', 'new_message'), ('3', 'new_message')]
+
+        # 連番のないイベントはIDなしで届く
+        publish_channel_event('update_reactions', {'message_id': 'm1', 'reactions': []}, test_channel)
+        assert parse_events(next(chunks)) == [(None, 'update_reactions', {'message_id': 'm1', 'reactions': []})]
+        response.close()
+
+def test_stream_requests_resync(auth_client, test_channel, app):
+    """再送用バッファに無い範囲を要求した場合に resync が送られることのテスト"""
+    with app.app_context():
+        response, chunks = open_stream(auth_client, test_channel, {'Last-Event-ID': '10'})
+        [(event_id, event, data)] = parse_events(next(chunks))
+        assert event == 'resync'
+        assert data == {'channel_id': test_channel, 'last_event_id': 10}
+        response.close()
+
+def test_stream_overflow_disconnects(auth_client, test_channel, app):
+    """受信が追いつかない接続が resync を送って終了することのテスト"""
+    with app.app_context():
+        channel_streams.configure(2)
+        try:
+            response, chunks = open_stream(auth_client, test_channel)
+            next(chunks)
+            for seq in range(1, 6):
+                publish_channel_event('new_message', {'id': f'm{seq}', 'seq': seq}, test_channel)
+
+            received = parse_events(''.join(chunks))
+            assert [event for _, event, _ in received] == ['new_message', 'new_message', 'resync']
+            assert received[-1][2] == {'channel_id': test_channel, 'last_event_id': 2}
+            assert channel_streams.subscriber_count() == 0
+        finally:
+            channel_streams.configure(app.config['SSE_QUEUE_SIZE'])
+
+def test_stream_unsubscribes_on_close(auth_client, test_channel, app):
+    """接続を閉じると購読が解除されることのテスト"""
+    with app.app_context():
+        response, chunks = open_stream(auth_client, test_channel)
+        next(chunks)
+        assert channel_streams.subscriber_count() == 1
+        response.close()
+        assert channel_streams.subscriber_count() == 0
+
+def test_stream_invalid_last_event_id(auth_client, test_channel, app):
+    """不正な Last-Event-ID が拒否されることのテスト"""
+    with app.app_context():
+        response = auth_client.get(f'/chat/channels/{test_channel}/stream', headers={'Last-Event-ID': 'abc'})
+        assert response.status_code == 400
+
+def test_stream_requires_login(client, test_channel, app):
+    """未ログインの場合は購読できないことのテスト"""
+    with app.app_context():
+        assert client.get(f'/chat/channels/{test_channel}/stream').status_code == 403
@@ -0,0 +1,77 @@
+from app import db
+from app.models import Channel, MessageTombstone
+
+def send(client, channel_id, content, headers):
+    """メッセージを送信して整形済みのデータを返す"""
+    response = client.post('/chat/send', data={
+        'message': content,
+        'channel_id': channel_id
+    }, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()['data']
+
+def test_changes_since_api(auth_client, test_channel, app, api_headers):
+    """since以降の作成・編集・削除だけが返されることのテスト"""
+    with app.app_context():
+        response = auth_client.get(f'/chat/messages/{test_channel}', headers=api_headers)
+        since = response.get_json()['sync_seq']
+
+        first = send(auth_client, test_channel, '1件目', api_headers)
+        second = send(auth_client, test_channel, '2件目', api_headers)
+        auth_client.post(f'/chat/messages/{first["id"]}/edit', data={'content': '1件目（編集）'}, headers=api_headers)
+        auth_client.delete(f'/chat/messages/{second["id"]}', headers=api_headers)
+
+        response = auth_client.get(f'/chat/channels/{test_channel}/changes?since={since}', headers=api_headers)
+        assert response.status_code == 200
+        data = response.get_json()
+
+        assert [m['id'] for m in data['messages']] == [first['id']]
+        assert data['messages'][0]['raw_content'] == '1件目（編集）'
+        assert data['messages'][0]['is_edited'] is True
+        assert [d['message_id'] for d in data['deleted']] == [second['id']]
+        assert data['next_since'] == since + 4
+        assert data['has_more'] is False
+
+        # 最新の連番以降は変更なし
+        response = auth_client.get(f'/chat/channels/{test_channel}/changes?since={data["next_since"]}', headers=api_headers)
+        data = response.get_json()
+        assert data['messages'] == []
+        assert data['deleted'] == []
+
+def test_changes_paging_api(auth_client, test_channel, app, api_headers):
+    """変更件数がlimitを超える場合に続きから取得できることのテスト"""
+    with app.app_context():
+        for i in range(3):
+            send(auth_client, test_channel, f'メッセージ{i}', api_headers)
+
+        response = auth_client.get(f'/chat/channels/{test_channel}/changes?since=0&limit=2', headers=api_headers)
+        data = response.get_json()
+        assert len(data['messages']) == 2
+        assert data['has_more'] is True
+
+        response = auth_client.get(
+            f'/chat/channels/{test_channel}/changes?since={data["next_since"]}&limit=2',
+            headers=api_headers
+        )
+        data = response.get_json()
+        assert [m['raw_content'] for m in data['messages']] == ['メッセージ2']
+        assert data['has_more'] is False
+
+def test_changes_invalid_since_api(auth_client, test_channel, app, api_headers):
+    """sinceが不正な場合のエラーのテスト"""
+    with app.app_context():
+        response = auth_client.get(f'/chat/channels/{test_channel}/changes', headers=api_headers)
+        assert response.status_code == 400
+
+def test_delete_channel_with_deleted_messages(auth_client, test_channel, app, api_headers, foreign_keys):
+    """メッセージを削除したことのあるチャンネルを削除できることのテスト"""
+    with app.app_context():
+        message = send(auth_client, test_channel, '削除するメッセージ', api_headers)
+        send(auth_client, test_channel, '残すメッセージ', api_headers)
+        auth_client.delete(f'/chat/messages/{message["id"]}', headers=api_headers)
+        assert MessageTombstone.query.filter_by(channel_id=test_channel).count() == 1
+
+        response = auth_client.post(f'/chat/channels/{test_channel}/delete', headers=api_headers)
+        assert response.status_code == 200
+        assert db.session.get(Channel, test_channel) is None
+        assert MessageTombstone.query.filter_by(channel_id=test_channel).count() == 0
@@ -0,0 +1,108 @@
+import pytest
+from flask_socketio import SocketIOTestClient
+from app import db, socketio
+from app.channel_cache import channel_cache
+from app.models import Channel, User
+from app.realtime.typing import TypingTracker, typing_tracker
+
+@pytest.fixture
+def other_socket_client(app, test_channel):
+    """同じチャンネルを開いている別のユーザーのSocketIOテストクライアント"""
+    with app.app_context():
+        user = User(id='other-user-id', username='otheruser', password_hash='dummy_hash')
+        db.session.add(user)
+        db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 'other-user-id'
+        session['username'] = 'otheruser'
+    socket_client = SocketIOTestClient(app, socketio, flask_test_client=client)
+    socket_client.emit('join_channel', {'channel_id': test_channel})
+    socket_client.get_received()
+    yield socket_client
+    socket_client.disconnect()
+
+def typing_updates(socket_client):
+    return [r['args'][0] for r in socket_client.get_received() if r['name'] == 'typing_update']
+
+def test_typing_throttled():
+    """同じユーザーの typing_start が間隔内は無視されることのテスト"""
+    tracker = TypingTracker(timeout=5, throttle=1, interval=0.5)
+    assert tracker.start_typing('channel-1', 'user-1', 'alice', now=0)
+    assert not tracker.start_typing('channel-1', 'user-1', 'alice', now=0.5)
+    assert tracker.start_typing('channel-1', 'user-1', 'alice', now=1)
+    assert tracker.take_updates(now=1) == {'channel-1': [{'user_id': 'user-1', 'username': 'alice'}]}
+    # 入力中のままなら一覧は変わらないため送信しない
+    tracker.start_typing('channel-1', 'user-1', 'alice', now=2)
+    assert tracker.take_updates(now=2) == {}
+
+def test_typing_aggregated_per_channel():
+    """チャンネルごとに入力中のユーザーがまとめられることのテスト"""
+    tracker = TypingTracker(timeout=5, throttle=1, interval=0.5)
+    tracker.start_typing('channel-1', 'user-2', 'bob', now=0)
+    tracker.start_typing('channel-1', 'user-1', 'alice', now=0)
+    tracker.start_typing('channel-2', 'user-3', 'carol', now=0)
+    assert tracker.take_updates(now=0) == {
+        'channel-1': [{'user_id': 'user-1', 'username': 'alice'}, {'user_id': 'user-2', 'username': 'bob'}],
+        'channel-2': [{'user_id': 'user-3', 'username': 'carol'}],
+    }
+
+    tracker.stop_typing('channel-1', 'user-1')
+    assert tracker.take_updates(now=0) == {'channel-1': [{'user_id': 'user-2', 'username': 'bob'}]}
+
+def test_typing_expires():
+    """typing_stop が届かない場合も期限切れで入力中が消えることのテスト"""
+    tracker = TypingTracker(timeout=5, throttle=1, interval=0.5)
+    tracker.start_typing('channel-1', 'user-1', 'alice', now=0)
+    tracker.take_updates(now=0)
+
+    assert tracker.take_updates(now=4.9) == {}
+    assert tracker.take_updates(now=5) == {'channel-1': []}
+    assert tracker.typing_users('channel-1') == []
+    assert tracker.take_updates(now=6) == {}
+
+def test_typing_flood_sends_one_update(socket_client, other_socket_client, test_channel, app):
+    """連続した typing_start でも送信間隔ごとに1回だけ配信されることのテスト"""
+    with app.app_context():
+        socket_client.emit('join_channel', {'channel_id': test_channel})
+        socket_client.get_received()
+
+        for _ in range(50):
+            other_socket_client.emit('typing_start', {'channel_id': test_channel})
+        typing_tracker.flush()
+
+        expected = {'channel_id': test_channel, 'users': [{'user_id': 'other-user-id', 'username': 'otheruser'}]}
+        assert typing_updates(socket_client) == [expected]
+        typing_tracker.flush()
+        assert typing_updates(socket_client) == []
+
+        other_socket_client.emit('typing_stop', {'channel_id': test_channel})
+        typing_tracker.flush()
+        assert typing_updates(socket_client) == [{'channel_id': test_channel, 'users': []}]
+
+def test_typing_requires_known_channel(socket_client, app):
+    """存在しないチャンネルの typing_start が記録されないことのテスト"""
+    with app.app_context():
+        socket_client.emit('typing_start', {'channel_id': 'unknown-channel'})
+        assert typing_tracker.typing_users('unknown-channel') == []
+
+@pytest.mark.parametrize('payload', ['channel', ['channel'], 1, {'channel_id': ['channel']}])
+def test_typing_invalid_payload(socket_client, test_channel, app, payload):
+    """辞書でないデータや文字列でないチャンネルIDの typing_start / typing_stop が無視されることのテスト"""
+    with app.app_context():
+        socket_client.emit('typing_start', payload)
+        socket_client.emit('typing_stop', payload)
+        typing_tracker.flush()
+        assert typing_tracker.typing_users(test_channel) == []
+        assert socket_client.get_received() == []
+
+def test_typing_in_channel_created_on_other_worker(socket_client, test_user, app):
+    """キャッシュにないチャンネル（他のワーカーで作成）の typing_start もDBを確認して記録することのテスト"""
+    with app.app_context():
+        channel_cache.list()
+        db.session.add(Channel(id='new-channel-id', name='newchannel', created_by=test_user))
+        db.session.commit()
+
+        socket_client.emit('typing_start', {'channel_id': 'new-channel-id'})
+        assert typing_tracker.typing_users('new-channel-id') == [{'user_id': test_user, 'username': 'testuser'}]
+        socket_client.emit('typing_stop', {'channel_id': 'new-channel-id'})